@@ -162,3 +162,113 @@ CELERY_TIMEZONE = 'UTC'
 
 # Static files
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Tracking settings
+# Bot filtering mode for /api/track/: 'count' drops bot hits and counts them per site,
+# 'drop' discards them silently, 'off' disables the classifier
+TRACKING_BOT_FILTER = os.getenv('TRACKING_BOT_FILTER', 'count')
+TRACKING_BOT_UA_CACHE_SIZE = 4096
+
+# Token-bucket rate limits for /api/track/ ('memory' per process, or 'redis' shared)
+TRACKING_RATE_LIMIT_ENABLED = True
+TRACKING_RATE_LIMIT_BACKEND = os.getenv('TRACKING_RATE_LIMIT_BACKEND', 'memory')
+TRACKING_RATE_LIMIT_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+TRACKING_SITE_RATE_LIMIT_PER_MINUTE = 6000
+TRACKING_SITE_RATE_LIMIT_BURST = 1000
+TRACKING_VISITOR_RATE_LIMIT_PER_MINUTE = 120
+TRACKING_VISITOR_RATE_LIMIT_BURST = 30
+# Per-process LRU sizes for cached site quotas and for unknown site_keys
+TRACKING_RATE_LIMIT_SITE_CACHE_SIZE = 10000
+TRACKING_RATE_LIMIT_UNKNOWN_SITE_CACHE_SIZE = 1000
+
+# Per-process cache of interned URL/title ids used when writing events
+TRACKING_INTERN_CACHE_SIZE = 10000
+
+# Fuzzy browser fingerprint matching: per-field weights (normalised to sum
+# to 1) and the minimum weighted similarity accepted as a match
+TRACKING_FINGERPRINT_WEIGHTS = {
+    'browser_name': 0.2,
+    'os_name': 0.2,
+    'device_type': 0.1,
+    'screen_resolution': 0.25,
+    'timezone': 0.15,
+    'language': 0.1,
+}
+TRACKING_FINGERPRINT_MATCH_THRESHOLD = float(os.getenv('TRACKING_FINGERPRINT_MATCH_THRESHOLD', '0.8'))
+
+# Identify events for the same visitor and email within this many seconds
+# are merged into a single identity resolution task
+TRACKING_IDENTITY_DEBOUNCE_SECONDS = int(os.getenv('TRACKING_IDENTITY_DEBOUNCE_SECONDS', '5'))
+
+# Identity writes lock rows in a fixed order and retry conflicting
+# transactions this many times, backing off (seconds, doubled per attempt)
+TRACKING_IDENTITY_WRITE_ATTEMPTS = 3
+TRACKING_IDENTITY_WRITE_BACKOFF = 0.05
+
+# Target false positive rate of the per-site enrichment Bloom filter
+TRACKING_BLOOM_ERROR_RATE = 0.01
+
+# Seconds published enrichment snapshots and their change deltas stay cached
+TRACKING_SNAPSHOT_TIMEOUT = 86400
+
+# Dashboard widgets are cached per site and re-aggregated at most this often
+# while events keep arriving; cached results expire after TRACKING_STATS_CACHE_TIMEOUT
+TRACKING_STATS_REFRESH_SECONDS = 30
+TRACKING_STATS_CACHE_TIMEOUT = 3600
+
+# Unique-visitor (HyperLogLog) and top-K (count-min) sketches are buffered per
+# process and merged into the database by a background thread every
+# TRACKING_SKETCH_FLUSH_SECONDS, or once TRACKING_SKETCH_MAX_PENDING buckets /
+# distinct values are waiting
+TRACKING_SKETCH_FLUSH_SECONDS = 10
+TRACKING_SKETCH_MAX_PENDING = 1000
+
+# Live dashboard stream (SSE): 'memory' delivers within one process, 'redis'
+# fans out through Redis pub/sub to every ASGI worker. Each open stream buffers
+# at most TRACKING_LIVE_BUFFER_SIZE messages and sends a keepalive comment
+# after TRACKING_LIVE_HEARTBEAT_SECONDS of silence.
+TRACKING_LIVE_BACKEND = os.getenv('TRACKING_LIVE_BACKEND', 'memory')
+TRACKING_LIVE_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+TRACKING_LIVE_BUFFER_SIZE = 100
+TRACKING_LIVE_HEARTBEAT_SECONDS = 15
+
+# Shared cache: Redis when REDIS_URL is set so counters, index versions,
+# Bloom filters and enrichment snapshots are shared by all workers;
+# per-process memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+# Logging: the tracking app logs JSON lines through a queue drained by a
+# background thread, so log I/O never blocks request threads. Repeated
+# warnings/errors are sampled to at most 10 per minute per message.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample_repeated': {
+            '()': 'tracking.log.SamplingFilter',
+            'rate': 10,
+            'per': 60,
+        },
+    },
+    'handlers': {
+        'nonblocking_json': {
+            'class': 'tracking.log.NonBlockingStreamHandler',
+            'filters': ['sample_repeated'],
+        },
+    },
+    'loggers': {
+        'tracking': {
+            'handlers': ['nonblocking_json'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
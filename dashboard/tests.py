@@ -1,3 +1,15 @@
 from django.test import TestCase
+from django.urls import reverse
+from tracking.models import Contact, Site
 
-# Create your tests here.
+
+class ContactSearchTests(TestCase):
+    def test_search_ignores_case_on_both_sides(self):
+        site = Site.objects.create(name='Site', domain='search.example.com')
+        alice = Contact.objects.create(site=site, email='alice@example.com')
+        shouting = Contact.objects.create(site=site, email='ALICIA@Example.com')
+        Contact.objects.create(site=site, email='bob@example.com')
+
+        response = self.client.get(reverse('dashboard:contact-list'), {'q': 'Ali'})
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual([contact.id for contact in response.context['contacts']], [alice.id, shouting.id])
@@ -9,6 +9,10 @@ urlpatterns = [
     path('sites/<uuid:site_id>/', views.site_detail, name='site-detail'),
     path('contacts/', views.contact_list, name='contact-list'),
     path('contacts/<uuid:contact_id>/', views.contact_detail, name='contact-detail'),
+    path('contacts/<uuid:contact_id>/timeline/', views.contact_timeline, name='contact-timeline'),
     path('visitors/<uuid:visitor_id>/', views.visitor_detail, name='visitor-detail'),
+    path('visitors/<uuid:visitor_id>/timeline/', views.visitor_timeline, name='visitor-timeline'),
+    path('widgets/<slug:name>/', views.widget_data, name='widget-data'),
+    path('live/', views.live_stream, name='live-stream'),
     path('demo/', views.demo_page, name='demo'),
 ]
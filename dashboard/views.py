@@ -1,18 +1,25 @@
+import base64
+import json
+import uuid
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.db.models import Count, Q, Avg, F, Func, OuterRef, Subquery, DurationField, ExpressionWrapper, IntegerField
+from django.db.models.functions import Coalesce, Lower
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from tracking.models import Site, Visitor, Contact, Event, ConversionGoal
+from tracking.models import Site, Visitor, Contact, Event, ConversionGoal, IdentityLink, UniqueVisitorSketch, HeavyHitterSketch
+from tracking.bot_detection import get_bot_hits
+from tracking import live
+from tracking.uniques import top_keys
+from .widgets import WIDGETS, get_widget
 
 
 def dashboard_home(request):
-    """Main dashboard overview"""
-    # Get overall stats
-    total_sites = Site.objects.filter(is_active=True).count()
-    total_visitors = Visitor.objects.count()
-    total_contacts = Contact.objects.count()
-    total_events = Event.objects.count()
-
+    """Main dashboard overview; counters and charts load from the widget endpoints"""
     # Get recent sites
     recent_sites = Site.objects.filter(is_active=True)[:5]
 
@@ -20,76 +27,76 @@ def dashboard_home(request):
     recent_contacts = Contact.objects.select_related('site', 'visitor')[:10]
 
     # Get recent events
-    recent_events = Event.objects.select_related('site', 'visitor').order_by('-timestamp')[:20]
+    recent_events = Event.objects.select_related('site', 'visitor', 'page_url').order_by('-timestamp')[:20]
 
-    # Get event stats by type
-    event_stats = Event.objects.values('event_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    context = {
+        'recent_sites': recent_sites,
+        'recent_contacts': recent_contacts,
+        'recent_events': recent_events,
+        # The live stream only works when the app is served over ASGI
+        'live_stream_enabled': isinstance(request, ASGIRequest),
+    }
 
-    # Get today's stats
-    today = timezone.now().date()
-    today_start = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.min.time()))
+    return render(request, 'dashboard/home.html', context)
 
-    today_visitors = Visitor.objects.filter(first_seen__gte=today_start).count()
-    today_events = Event.objects.filter(timestamp__gte=today_start).count()
-    today_contacts = Contact.objects.filter(created_at__gte=today_start).count()
 
-    # Get identified vs anonymous visitor stats
-    identified_visitors = Visitor.objects.filter(is_identified=True).count()
-    anonymous_visitors = total_visitors - identified_visitors
+def widget_data(request, name):
+    """JSON data of one dashboard widget, for all sites or for ?site=<id>"""
+    if name not in WIDGETS:
+        raise Http404(f'Unknown widget: {name}')
 
-    # Get events over time (last 7 days)
-    end_date = timezone.now()
-    daily_event_data = []
-    for i in range(7):
-        day = end_date - timedelta(days=6-i)  # Start from 6 days ago
-        day_start = timezone.make_aware(timezone.datetime.combine(day.date(), timezone.datetime.min.time()))
-        day_end = day_start + timedelta(days=1)
+    site_id = request.GET.get('site')
+    if site_id:
+        try:
+            site_id = uuid.UUID(site_id)
+        except ValueError:
+            raise Http404('Invalid site id')
+        get_object_or_404(Site, id=site_id)
 
-        count = Event.objects.filter(
-            timestamp__gte=day_start,
-            timestamp__lt=day_end
-        ).count()
+    data, version, bucket = get_widget(name, site_id)
+    return JsonResponse({'widget': name, 'version': version, 'bucket': bucket, 'data': data})
 
-        daily_event_data.append({
-            'date': day.strftime('%b %d'),
-            'count': count
-        })
 
-    # Prepare chart data for template
-    import json
+async def live_stream(request):
+    """
+    Server-Sent Events stream of new events and summary counter deltas
 
-    # Event type chart data
-    event_type_labels = [stat['event_type'] for stat in event_stats]
-    event_type_counts = [stat['count'] for stat in event_stats]
+    Served by the ASGI app; ?site=<id> limits the stream to one site. Messages
+    come from tracking.live, so open dashboards cost no database queries
+    beyond the site check. Under WSGI an endless stream would be buffered in
+    full and pin a worker thread, so it is refused with 501 instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('The live stream requires the ASGI server', status=501, content_type='text/plain')
 
-    # Daily events chart data
-    daily_event_labels = [day['date'] for day in daily_event_data]
-    daily_event_counts = [day['count'] for day in daily_event_data]
+    channel = live.ALL_SITES
+    site_id = request.GET.get('site')
+    if site_id:
+        try:
+            site_id = uuid.UUID(site_id)
+        except ValueError:
+            raise Http404('Invalid site id')
+        if not await Site.objects.filter(id=site_id).aexists():
+            raise Http404('Site not found')
+        channel = str(site_id)
 
-    context = {
-        'total_sites': total_sites,
-        'total_visitors': total_visitors,
-        'total_contacts': total_contacts,
-        'total_events': total_events,
-        'recent_sites': recent_sites,
-        'recent_contacts': recent_contacts,
-        'recent_events': recent_events,
-        'event_stats': event_stats,
-        'today_visitors': today_visitors,
-        'today_events': today_events,
-        'today_contacts': today_contacts,
-        'identified_visitors': identified_visitors,
-        'anonymous_visitors': anonymous_visitors,
-        # Chart data (JSON for JavaScript)
-        'event_type_labels_json': json.dumps(event_type_labels),
-        'event_type_counts_json': json.dumps(event_type_counts),
-        'daily_event_labels_json': json.dumps(daily_event_labels),
-        'daily_event_counts_json': json.dumps(daily_event_counts),
-    }
+    heartbeat = getattr(settings, 'TRACKING_LIVE_HEARTBEAT_SECONDS', 15)
 
-    return render(request, 'dashboard/home.html', context)
+    async def stream():
+        subscription = live.subscribe(channel)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = await subscription.get(heartbeat)
+                yield ': keepalive\n\n' if message is None else live.format_sse(message)
+        finally:
+            live.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 def site_list(request):
@@ -130,7 +137,7 @@ def site_detail(request, site_id):
     ).order_by('-count')
 
     # Recent events
-    recent_events = site.events.select_related('visitor').order_by('-timestamp')[:20]
+    recent_events = site.events.select_related('visitor', 'page_url', 'page_title').order_by('-timestamp')[:20]
 
     # Recent contacts
     recent_contacts = site.contacts.select_related('visitor')[:10]
@@ -154,6 +161,35 @@ def site_detail(request, site_id):
 
     daily_events.reverse()
 
+    # Session analytics read the materialized Session rows, not raw events
+    session_stats = site.sessions.filter(started_at__gte=start_date).aggregate(
+        session_count=Count('id'),
+        avg_pages=Avg('page_view_count'),
+        avg_duration=Avg(ExpressionWrapper(F('ended_at') - F('started_at'), output_field=DurationField())),
+    )
+    top_entry_pages = site.sessions.filter(started_at__gte=start_date).values('entry_url').annotate(
+        count=Count('id')
+    ).order_by('-count')[:5]
+
+    # Bot hits are dropped before any DB write, so they only live in the cache counter
+    bot_hits_today = get_bot_hits(site.site_key)
+
+    # Distinct visitors come from the merged daily HyperLogLog sketches
+    today = timezone.localdate()
+    week_start = today - timedelta(days=6)
+    unique_visitors = {
+        'today': UniqueVisitorSketch.objects.estimate(site.id, today, today),
+        'week': UniqueVisitorSketch.objects.estimate(site.id, week_start, today),
+        'pages': top_keys(site.id, week_start, today, 'page', 5),
+        'campaigns': top_keys(site.id, week_start, today, 'campaign', 5),
+    }
+
+    # Top lists are read from the per-day top-K sketches, not grouped from events
+    top_values = {
+        dimension: HeavyHitterSketch.objects.top(site.id, week_start, today, dimension, 10)
+        for dimension in ('page', 'referrer', 'element')
+    }
+
     context = {
         'site': site,
         'total_visitors': total_visitors,
@@ -165,160 +201,206 @@ def site_detail(request, site_id):
         'recent_events': recent_events,
         'recent_contacts': recent_contacts,
         'daily_events': daily_events,
+        'bot_hits_today': bot_hits_today,
+        'session_stats': session_stats,
+        'top_entry_pages': top_entry_pages,
+        'unique_visitors': unique_visitors,
+        'top_values': top_values,
     }
 
     return render(request, 'dashboard/site_detail.html', context)
 
 
+# Contact list orderings; every one ends on id so the keyset cursor is unique
+CONTACT_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'email': ('email', 'id'),
+    'email_desc': ('-email', '-id'),
+}
+CONTACT_PAGE_SIZE = 50
+
+# Event timelines walk the (visitor, -timestamp) index; id breaks timestamp ties
+TIMELINE_ORDERING = ('-timestamp', '-id')
+TIMELINE_PAGE_SIZE = 50
+
+
+def _encode_cursor(values):
+    # str() keeps full microsecond precision, which the keyset comparison needs
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise Http404('Invalid cursor')
+
+
+def _after_cursor(ordering, values):
+    """Q selecting the rows that sort after `values` for a two-column ordering"""
+    (first, second), (first_value, second_value) = ordering, values
+    if first.lstrip('-') in ('created_at', 'timestamp'):
+        first_value = parse_datetime(first_value)
+    lookup = 'lt' if first.startswith('-') else 'gt'
+    first, second = first.lstrip('-'), second.lstrip('-')
+    return Q(**{f'{first}__{lookup}': first_value}) | Q(**{first: first_value, f'{second}__{lookup}': second_value})
+
+
 def contact_list(request):
-    """List all contacts"""
+    """List contacts a page at a time, keyset-paginated on an indexed ordering"""
     site_id = request.GET.get('site')
+    search = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort')
+    if sort not in CONTACT_SORTS:
+        sort = 'newest'
+    ordering = CONTACT_SORTS[sort]
 
     contacts = Contact.objects.select_related('site', 'visitor')
 
     if site_id:
         contacts = contacts.filter(site_id=site_id)
-
-    contacts = contacts.annotate(
-        event_count=Count('visitor__events')
-    )
+    if search:
+        # Emails are stored as entered, so prefix-match case-insensitively
+        # against the Lower(email) index
+        contacts = contacts.annotate(email_lower=Lower('email')).filter(email_lower__startswith=search.lower())
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        contacts = contacts.filter(_after_cursor(ordering, _decode_cursor(cursor)))
+
+    # Sum the maintained counters of every visitor stitched to each contact's identity
+    identity_root = Coalesce(F('visitor__identity_link__root_id'), F('visitor_id'))
+    stitched_counts = Visitor.objects.filter(
+        Q(id=OuterRef('identity_root')) | Q(identity_link__root_id=OuterRef('identity_root'))
+    ).order_by().annotate(
+        total=Func(F('event_count'), function='SUM', output_field=IntegerField())
+    ).values('total')
+    contacts = contacts.annotate(identity_root=identity_root).annotate(
+        event_count=Coalesce(Subquery(stitched_counts), 0)
+    ).order_by(*ordering)
+
+    page = list(contacts[:CONTACT_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > CONTACT_PAGE_SIZE:
+        page = page[:CONTACT_PAGE_SIZE]
+        last = page[-1]
+        next_cursor = _encode_cursor([getattr(last, name.lstrip('-')) for name in ordering])
 
     sites = Site.objects.filter(is_active=True)
 
     context = {
-        'contacts': contacts,
+        'contacts': page,
         'sites': sites,
         'selected_site': site_id,
+        'search': search,
+        'sort': sort,
+        'sorts': CONTACT_SORTS,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
     }
 
     return render(request, 'dashboard/contact_list.html', context)
 
 
+def _timeline_page(events, cursor=None):
+    """One page of an event timeline, newest first, and the cursor of the next page"""
+    if cursor:
+        events = events.filter(_after_cursor(TIMELINE_ORDERING, _decode_cursor(cursor)))
+    page = list(events.select_related('page_url', 'page_title').order_by(*TIMELINE_ORDERING)[:TIMELINE_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > TIMELINE_PAGE_SIZE:
+        page = page[:TIMELINE_PAGE_SIZE]
+        next_cursor = _encode_cursor([page[-1].timestamp, page[-1].id])
+    return page, next_cursor
+
+
+def _timeline_response(request, events, template):
+    """JSON page of a timeline: rendered table rows plus the raw events"""
+    page, next_cursor = _timeline_page(events, request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string(template, {'events': page}, request=request),
+        'events': [
+            {
+                'id': str(event.id),
+                'event_type': event.event_type,
+                'event_name': event.event_name,
+                'page_url': str(event.page_url),
+                'page_title': str(event.page_title) if event.page_title_id else None,
+                'session_id': event.session_id,
+                'timestamp': event.timestamp.isoformat(),
+            }
+            for event in page
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
 def contact_detail(request, contact_id):
-    """Detailed view of a single contact"""
+    """Detailed view of a single contact; older events load from contact_timeline"""
     contact = get_object_or_404(Contact.objects.select_related('site', 'visitor'), id=contact_id)
 
-    # Get all events for this contact's visitor
-    if contact.visitor:
-        events = contact.visitor.events.all()[:50]
-        event_count = contact.visitor.events.count()
-    else:
-        events = []
-        event_count = 0
+    # First page of the events of every visitor stitched to this contact
+    events, next_cursor = _timeline_page(contact.get_events())
+
+    # Other devices stitched into this contact's identity
+    linked_visitors = []
+    if contact.visitor_id:
+        linked_visitors = Visitor.objects.filter(
+            id__in=IdentityLink.objects.members(contact.visitor_id)
+        ).exclude(id=contact.visitor_id)
 
     context = {
         'contact': contact,
         'events': events,
-        'event_count': event_count,
+        'next_cursor': next_cursor,
+        'event_count': contact.get_event_count(),
+        'linked_visitors': linked_visitors,
     }
 
     return render(request, 'dashboard/contact_detail.html', context)
 
 
+def contact_timeline(request, contact_id):
+    """Keyset-paginated events of a contact's identity, for ?cursor=<next_cursor>"""
+    contact = get_object_or_404(Contact, id=contact_id)
+    return _timeline_response(request, contact.get_events(), 'dashboard/contact_events.html')
+
+
 def visitor_detail(request, visitor_id):
-    """Detailed view of a single visitor"""
+    """Detailed view of a single visitor; older events load from visitor_timeline"""
     visitor = get_object_or_404(
         Visitor.objects.select_related('site', 'contact'),
         id=visitor_id
     )
 
-    # Get events
-    events = visitor.events.all()[:50]
-    event_count = visitor.events.count()
+    # First page of events; the total comes from the maintained counter
+    events, next_cursor = _timeline_page(visitor.events.all())
 
-    # Get contact if identified
-    contact = None
-    if visitor.is_identified:
-        try:
-            contact = visitor.contact
-        except Contact.DoesNotExist:
-            # If visitor is marked as identified but has no contact, this is a data issue
-            # Auto-fix: Try to find and create the missing contact
-            from tracking.models import Event, EnrichmentData
-
-            # Try to find contact by visitor FK first
-            contact = Contact.objects.filter(visitor=visitor).first()
-
-            # If still no contact, try to recreate from identify event
-            if not contact:
-                identify_event = Event.objects.filter(
-                    visitor=visitor,
-                    event_type='custom',
-                    event_data__event_name='identify'
-                ).order_by('-timestamp').first()
-
-                if identify_event:
-                    identity_data = identify_event.event_data.get('identity_data', {})
-                    email = identity_data.get('email')
-
-                    if email:
-                        name = identity_data.get('name', '')
-                        phone = identity_data.get('phone', '')
-
-                        # Get or create enrichment
-                        enrichment, _ = EnrichmentData.objects.get_or_create(
-                            site=visitor.site,
-                            email=email,
-                            defaults={
-                                'first_name': name.split()[0] if name else '',
-                                'last_name': ' '.join(name.split()[1:]) if name and len(name.split()) > 1 else '',
-                                'phone': phone,
-                                'source': 'visitor_identification'
-                            }
-                        )
-
-                        # Create contact
-                        contact, created = Contact.objects.get_or_create(
-                            site=visitor.site,
-                            email=email,
-                            defaults={
-                                'visitor': visitor,
-                                'enrichment_data': enrichment,
-                                'name': name,
-                                'phone': phone,
-                            }
-                        )
-
-                        if not created and contact.visitor != visitor:
-                            contact.visitor = visitor
-                            contact.save()
-
-                        # Store fingerprint data in enrichment
-                        if visitor.browser_name and visitor.os_name:
-                            updated = False
-                            fp_dict = {
-                                'browser_name': visitor.browser_name,
-                                'os_name': visitor.os_name,
-                                'device_type': visitor.device_type,
-                                'screen_resolution': visitor.screen_resolution,
-                                'timezone': visitor.timezone,
-                                'language': visitor.language
-                            }
-                            if fp_dict not in enrichment.browser_fingerprints:
-                                enrichment.browser_fingerprints.append(fp_dict)
-                                updated = True
-                            if visitor.user_agent and visitor.user_agent not in enrichment.user_agents:
-                                enrichment.user_agents.append(visitor.user_agent)
-                                updated = True
-                            if visitor.ip_address and visitor.ip_address not in enrichment.ip_addresses:
-                                enrichment.ip_addresses.append(visitor.ip_address)
-                                updated = True
-                            if phone and phone not in enrichment.phone_numbers:
-                                enrichment.phone_numbers.append(phone)
-                                updated = True
-                            if updated:
-                                enrichment.save()
+    # Read-only: identified visitors missing a Contact are fixed by repair_identities
+    try:
+        contact = visitor.contact
+    except Contact.DoesNotExist:
+        contact = None
 
     context = {
         'visitor': visitor,
         'events': events,
-        'event_count': event_count,
+        'next_cursor': next_cursor,
+        'event_count': visitor.event_count,
         'contact': contact,
+        'needs_repair': visitor.is_identified and contact is None,
     }
 
     return render(request, 'dashboard/visitor_detail.html', context)
 
 
+def visitor_timeline(request, visitor_id):
+    """Keyset-paginated events of a visitor, for ?cursor=<next_cursor>"""
+    visitor = get_object_or_404(Visitor, id=visitor_id)
+    return _timeline_response(request, visitor.events.all(), 'dashboard/visitor_events.html')
+
+
 def demo_page(request):
     """Serve the demo e-commerce website"""
     # Get a sample site key for the demo (first active site)
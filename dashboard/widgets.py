@@ -0,0 +1,103 @@
+"""
+Cached data for dashboard widgets
+
+Each widget is a function returning JSON-serializable chart data for one site,
+or for all sites when site_id is None. Results are cached under
+(site, widget, time bucket, version): the bucket is the current day, so
+day-based widgets roll over at midnight, and the version is the site's
+'stats' counter that event ingest touches (see tracking.versioning), so a
+refresh only re-aggregates after new data arrived.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from tracking.models import Site, Visitor, Contact, Event
+from tracking.versioning import settle_version
+
+
+VERSION_NAMESPACE = 'stats'
+
+# Version scope for widgets that span every site
+ALL_SITES = 'all'
+
+
+def _filter(queryset, site_id):
+    return queryset.filter(site_id=site_id) if site_id else queryset
+
+
+def _today_start():
+    return timezone.make_aware(timezone.datetime.combine(timezone.localdate(), timezone.datetime.min.time()))
+
+
+def summary(site_id):
+    """Headline counters"""
+    today_start = _today_start()
+    visitors = _filter(Visitor.objects.all(), site_id)
+    contacts = _filter(Contact.objects.all(), site_id)
+    events = _filter(Event.objects.all(), site_id)
+
+    total_visitors = visitors.count()
+    identified_visitors = visitors.filter(is_identified=True).count()
+    return {
+        'total_sites': Site.objects.filter(is_active=True).count() if not site_id else 1,
+        'total_visitors': total_visitors,
+        'total_contacts': contacts.count(),
+        'total_events': events.count(),
+        'today_visitors': visitors.filter(first_seen__gte=today_start).count(),
+        'today_events': events.filter(timestamp__gte=today_start).count(),
+        'today_contacts': contacts.filter(created_at__gte=today_start).count(),
+        'identified_visitors': identified_visitors,
+        'anonymous_visitors': total_visitors - identified_visitors,
+    }
+
+
+def event_types(site_id):
+    """Event counts by type, largest first"""
+    stats = _filter(Event.objects.all(), site_id).values('event_type').annotate(
+        count=Count('id')
+    ).order_by('-count')
+    return {
+        'labels': [stat['event_type'] for stat in stats],
+        'counts': [stat['count'] for stat in stats],
+    }
+
+
+def daily_events(site_id, days=7):
+    """Events per day for the last `days` days, in one grouped query"""
+    today = timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    start = timezone.make_aware(timezone.datetime.combine(first_day, timezone.datetime.min.time()))
+    rows = _filter(Event.objects.filter(timestamp__gte=start), site_id).annotate(
+        day=TruncDate('timestamp')
+    ).values('day').annotate(count=Count('id'))
+    counts = {row['day']: row['count'] for row in rows}
+
+    days_list = [first_day + timedelta(days=i) for i in range(days)]
+    return {
+        'labels': [day.strftime('%b %d') for day in days_list],
+        'counts': [counts.get(day, 0) for day in days_list],
+    }
+
+
+WIDGETS = {
+    'summary': summary,
+    'event-types': event_types,
+    'daily-events': daily_events,
+}
+
+
+def get_widget(name, site_id=None):
+    """Return (data, version, bucket) for a widget, computing it only on a cache miss"""
+    refresh = getattr(settings, 'TRACKING_STATS_REFRESH_SECONDS', 30)
+    version = settle_version(VERSION_NAMESPACE, site_id or ALL_SITES, refresh)
+    bucket = timezone.localdate().isoformat()
+    key = f'stats:{site_id or ALL_SITES}:{name}:{bucket}:{version}'
+
+    data = cache.get(key)
+    if data is None:
+        data = WIDGETS[name](site_id)
+        cache.set(key, data, timeout=getattr(settings, 'TRACKING_STATS_CACHE_TIMEOUT', 3600))
+    return data, version, bucket
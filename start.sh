@@ -189,10 +189,10 @@ echo ""
 
 # Kill any existing Django servers
 echo -e "${BLUE}Checking for existing Django servers...${NC}"
-EXISTING_PIDS=$(pgrep -f "python manage.py runserver" || true)
+EXISTING_PIDS=$(pgrep -f "python manage.py runserver|uvicorn config.asgi:application" || true)
 if [ ! -z "$EXISTING_PIDS" ]; then
     echo -e "${YELLOW}Found running Django server(s), stopping them...${NC}"
-    pkill -f "python manage.py runserver" || true
+    pkill -f "python manage.py runserver|uvicorn config.asgi:application" || true
     sleep 2
     echo -e "${GREEN}✓ Existing server(s) stopped${NC}"
 else
@@ -212,5 +212,5 @@ echo ""
 echo -e "${YELLOW}Press Ctrl+C to stop the server${NC}"
 echo ""
 
-# Start the development server
-python manage.py runserver
+# Start the development server on the ASGI app (the dashboard's live stream needs ASGI)
+uvicorn config.asgi:application --reload --host 127.0.0.1 --port 8000
@@ -2,9 +2,11 @@ from django.contrib import admin
 from django.shortcuts import render, redirect
 from django.urls import path
 from django.contrib import messages
+from django.db import transaction
 import csv
 import io
-from .models import Site, Visitor, Contact, Event, ConversionGoal, EnrichmentData, APIKey
+from .models import Site, Visitor, Contact, Event, Session, ConversionGoal, EnrichmentData, APIKey, IdentityLink
+from .ip_index import parse_ip_field, update_enrichment_index, invalidate_enrichment
 
 
 @admin.register(Site)
@@ -23,6 +25,11 @@ class VisitorAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'first_seen', 'last_seen')
     raw_id_fields = ('site',)
 
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            IdentityLink.objects.detach(queryset.values_list('pk', flat=True))
+            queryset.delete()
+
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
@@ -32,17 +39,30 @@ class ContactAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'created_at', 'updated_at')
     raw_id_fields = ('site', 'visitor')
 
+    def delete_queryset(self, request, queryset):
+        queryset.erase()
+
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ('event_type', 'event_name', 'site', 'visitor', 'timestamp')
     list_filter = ('event_type', 'site', 'timestamp')
-    search_fields = ('event_name', 'page_url', 'page_title')
+    search_fields = ('event_name', 'page_url__value', 'page_title__value')
     readonly_fields = ('id', 'timestamp')
-    raw_id_fields = ('site', 'visitor')
+    raw_id_fields = ('site', 'visitor', 'page_url', 'page_title', 'referrer')
     date_hierarchy = 'timestamp'
 
 
+@admin.register(Session)
+class SessionAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'site', 'visitor', 'started_at', 'ended_at', 'event_count', 'page_view_count')
+    list_filter = ('site', 'started_at')
+    search_fields = ('session_id', 'entry_url', 'exit_url')
+    readonly_fields = ('id',)
+    raw_id_fields = ('site', 'visitor')
+    date_hierarchy = 'started_at'
+
+
 @admin.register(ConversionGoal)
 class ConversionGoalAdmin(admin.ModelAdmin):
     list_display = ('name', 'site', 'event_type', 'is_active', 'created_at')
@@ -52,6 +72,14 @@ class ConversionGoalAdmin(admin.ModelAdmin):
     raw_id_fields = ('site',)
 
 
+@admin.register(IdentityLink)
+class IdentityLinkAdmin(admin.ModelAdmin):
+    list_display = ('visitor', 'root', 'site', 'size', 'linked_via', 'linked_at')
+    list_filter = ('site', 'linked_via')
+    search_fields = ('visitor__visitor_id', 'root__visitor_id')
+    raw_id_fields = ('visitor', 'root', 'site')
+
+
 @admin.register(EnrichmentData)
 class EnrichmentDataAdmin(admin.ModelAdmin):
     list_display = ('email', 'first_name', 'last_name', 'company', 'site', 'source', 'created_at')
@@ -62,6 +90,20 @@ class EnrichmentDataAdmin(admin.ModelAdmin):
 
     change_list_template = "admin/enrichment_data_changelist.html"
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_enrichment_index(obj.site_id, [(obj.id, obj.ip_addresses, obj.ip_ranges)])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_enrichment(obj.site_id)
+
+    def delete_queryset(self, request, queryset):
+        site_ids = set(queryset.values_list('site_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for site_id in site_ids:
+            invalidate_enrichment(site_id)
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -97,6 +139,7 @@ class EnrichmentDataAdmin(admin.ModelAdmin):
                 created_count = 0
                 updated_count = 0
                 errors = []
+                indexed_rows = []
 
                 for row_num, row in enumerate(reader, start=2):
                     try:
@@ -105,11 +148,10 @@ class EnrichmentDataAdmin(admin.ModelAdmin):
                             errors.append(f"Row {row_num}: Missing email")
                             continue
 
-                        # Parse IP addresses (can be comma-separated)
-                        ip_addresses = []
+                        # Parse IP addresses (comma-separated IPs, CIDR blocks or a-b ranges)
                         ip_field = row.get('ip_address', '') or row.get('ip', '')
-                        if ip_field:
-                            ip_addresses = [ip.strip() for ip in ip_field.split(',') if ip.strip()]
+                        range_field = row.get('ip_range', '') or row.get('cidr', '')
+                        ip_addresses, ip_ranges = parse_ip_field(f'{ip_field},{range_field}')
 
                         # Get or create enrichment data
                         enrichment, created = EnrichmentData.objects.update_or_create(
@@ -126,9 +168,11 @@ class EnrichmentDataAdmin(admin.ModelAdmin):
                                 'job_title': row.get('job_title', '') or row.get('title', ''),
                                 'location': row.get('location', ''),
                                 'ip_addresses': ip_addresses,
+                                'ip_ranges': ip_ranges,
                                 'source': 'csv_upload',
                             }
                         )
+                        indexed_rows.append((enrichment.id, ip_addresses, ip_ranges))
 
                         if created:
                             created_count += 1
@@ -138,6 +182,9 @@ class EnrichmentDataAdmin(admin.ModelAdmin):
                     except Exception as e:
                         errors.append(f"Row {row_num}: {str(e)}")
 
+                if indexed_rows:
+                    update_enrichment_index(site.id, indexed_rows)
+
                 # Show results
                 success_msg = f"Successfully imported {created_count} new records and updated {updated_count} existing records."
                 messages.success(request, success_msg)
@@ -0,0 +1,232 @@
+"""
+Negative-lookup Bloom filter over a site's enrichment identifiers
+
+Most hits come from visitors that match nothing. The filter holds every known
+enrichment IP, CIDR block, user agent and fingerprint bucket key for a site
+(see tracking.fingerprints, which guarantees that any fuzzy match shares at
+least one bucket key), so a
+definite miss skips the matching stage without touching the database or the
+IP index. False positives only cost the normal lookup.
+
+Filters are serialized into the Django cache (Redis in production) under one
+key per site, so workers share one build, and memoized per process by the
+site's 'enrichment' version. A stale or missing filter is rebuilt in the
+background; until it is published, lookups skip the pre-check.
+"""
+import hashlib
+import ipaddress
+import logging
+import math
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from .flushing import BackgroundFlusher
+from .versioning import get_version
+from .fingerprints import bucket_keys
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAMESPACE = 'enrichment'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one blake2b digest"""
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """Size a filter for `capacity` items at the given false positive rate"""
+        capacity = max(capacity, 1)
+        size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class EnrichmentFilter:
+    """A site's Bloom filter plus the CIDR prefix lengths needed to probe it"""
+
+    def __init__(self, bloom, prefixes):
+        self.bloom = bloom
+        # {ip version: [prefix lengths]} of ranges inserted into the filter
+        self.prefixes = prefixes
+
+    def might_match_ip(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if f'ip:{address}' in self.bloom:
+            return True
+        value = int(address)
+        bits = address.max_prefixlen
+        for prefixlen in self.prefixes.get(address.version, ()):
+            network = value & (((1 << prefixlen) - 1) << (bits - prefixlen))
+            if f'net:{address.version}:{prefixlen}:{network}' in self.bloom:
+                return True
+        return False
+
+    def might_match(self, ip=None, user_agent=None, fingerprint=None):
+        """False only if none of the given identifiers can match any enrichment row"""
+        if ip and self.might_match_ip(ip):
+            return True
+        if user_agent and f'ua:{user_agent}' in self.bloom:
+            return True
+        if fingerprint is not None:
+            return any(f'fp:{key}' in self.bloom for key in bucket_keys(fingerprint))
+        return False
+
+    def to_dict(self):
+        return {
+            'size': self.bloom.size,
+            'hashes': self.bloom.hashes,
+            'bits': bytes(self.bloom.bits),
+            'prefixes': self.prefixes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        bloom = BloomFilter(data['size'], data['hashes'], bytearray(data['bits']))
+        return cls(bloom, data['prefixes'])
+
+
+def build_filter(site_id):
+    """Build the filter for a site from its enrichment snapshot"""
+    from .snapshot import get_snapshot
+
+    keys = set()
+    prefixes = {4: set(), 6: set()}
+    for ip_addresses, ip_ranges, user_agents, fingerprints in get_snapshot(site_id).rows.values():
+        for ip in ip_addresses or []:
+            try:
+                keys.add(f'ip:{ipaddress.ip_address(ip)}')
+            except ValueError:
+                continue
+        for value in ip_ranges or []:
+            try:
+                network = ipaddress.ip_network(value, strict=False)
+            except ValueError:
+                continue
+            prefixes[network.version].add(network.prefixlen)
+            keys.add(f'net:{network.version}:{network.prefixlen}:{int(network.network_address)}')
+        keys.update(f'ua:{user_agent}' for user_agent in user_agents or [] if user_agent)
+        for fingerprint in fingerprints or []:
+            if isinstance(fingerprint, dict):
+                keys.update(f'fp:{key}' for key in bucket_keys(fingerprint))
+
+    error_rate = getattr(settings, 'TRACKING_BLOOM_ERROR_RATE', 0.01)
+    bloom = BloomFilter.for_capacity(len(keys), error_rate)
+    for key in keys:
+        bloom.add(key)
+    return EnrichmentFilter(bloom, {version: sorted(lengths) for version, lengths in prefixes.items()})
+
+
+def _cache_key(site_id):
+    return f'bloom:{site_id}'
+
+
+def _timeout():
+    return getattr(settings, 'TRACKING_SNAPSHOT_TIMEOUT', 86400)
+
+
+def rebuild_filter(site_id, version=None):
+    """Build and publish the filter for the site's current version"""
+    version = version or get_version(VERSION_NAMESPACE, site_id)
+    enrichment_filter = build_filter(site_id)
+    # One key per site: a newer version overwrites the last instead of piling up
+    cache.set(_cache_key(site_id), {'version': version, 'filter': enrichment_filter.to_dict()}, timeout=_timeout())
+    _filters[site_id] = (version, enrichment_filter)
+    return enrichment_filter
+
+
+_pending_rebuilds = set()
+_pending_lock = threading.Lock()
+
+
+def _run_rebuilds():
+    from .tasks import rebuild_enrichment_filter
+
+    with _pending_lock:
+        site_ids = list(_pending_rebuilds)
+        _pending_rebuilds.clear()
+    for site_id in site_ids:
+        try:
+            rebuild_enrichment_filter.delay(str(site_id))
+        except Exception:
+            # Celery is not available: build the filter in this thread instead
+            try:
+                rebuild_filter(site_id)
+            except Exception:
+                logger.exception('Enrichment filter rebuild failed', extra={'site_id': str(site_id)})
+
+
+_rebuilder = BackgroundFlusher(_run_rebuilds, 'bloom-rebuild')
+
+
+def schedule_rebuild(site_id):
+    """
+    Rebuild the filter in the background after enrichment data changed
+
+    Only queues the site: a background thread hands it to Celery, or builds it
+    itself when the broker is down, so callers never wait on the broker.
+    """
+    with _pending_lock:
+        _pending_rebuilds.add(site_id)
+    _rebuilder.wake()
+
+
+_filters = {}
+_lock = threading.Lock()
+
+
+def get_filter(site_id):
+    """
+    Return the current filter for a site, or None while it is being rebuilt
+
+    Callers must treat None as "might match".
+    """
+    version = get_version(VERSION_NAMESPACE, site_id)
+    cached = _filters.get(site_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        cached = _filters.get(site_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        data = cache.get(_cache_key(site_id))
+        if data is not None and data['version'] == version:
+            enrichment_filter = EnrichmentFilter.from_dict(data['filter'])
+            _filters[site_id] = (version, enrichment_filter)
+            return enrichment_filter
+
+    # Nobody has published this version yet: one process schedules the build
+    if cache.add(f'bloom:building:{site_id}:{version}', 1, timeout=300):
+        schedule_rebuild(site_id)
+    return None
+
+
+def might_match(site_id, ip=None, user_agent=None, fingerprint=None):
+    """Cheap pre-check before identity matching; False means a guaranteed miss"""
+    enrichment_filter = get_filter(site_id)
+    if enrichment_filter is None:
+        return True
+    return enrichment_filter.might_match(ip=ip, user_agent=user_agent, fingerprint=fingerprint)
@@ -0,0 +1,84 @@
+"""
+Bot and crawler classification for the tracking endpoint
+
+Runs before the serializer and before any ORM work so that automated traffic
+never creates Visitor or Event rows. User-agent verdicts are memoized in an
+LRU keyed by the raw UA string since the set of distinct UAs is small.
+"""
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from . import metrics
+
+
+# Substrings found in crawler, monitoring and scripted-client user agents.
+# "bot" only counts as a word of its own or right before a version, dash or
+# semicolon (Googlebot/2.1, AdsBot-Google, PetalBot;), never inside a device
+# name such as CUBOT.
+BOT_UA_PATTERN = re.compile(
+    r'\bbot\b|bot[/;-]|crawl|spider|slurp|scrap|fetch|preview|monitor|checker|'
+    r'headless|phantomjs|puppeteer|playwright|selenium|lighthouse|pingdom|'
+    r'facebookexternalhit|embedly|quora link|bingpreview|yahoo! slurp|'
+    r'python-requests|python-urllib|aiohttp|httpx|go-http-client|okhttp|'
+    r'java/|libwww|curl/|wget/|httpie|postman|insomnia|axios/|node-fetch',
+    re.IGNORECASE
+)
+
+# Real browsers always send these on the pixel's XHR
+REQUIRED_BROWSER_HEADERS = ('HTTP_ACCEPT_LANGUAGE',)
+
+BOT_HIT_COUNTER_TTL = 60 * 60 * 24 * 8  # Keep a week of daily counters
+
+
+@lru_cache(maxsize=getattr(settings, 'TRACKING_BOT_UA_CACHE_SIZE', 4096))
+def is_bot_user_agent(user_agent):
+    """Return True if the user agent string matches a known bot pattern"""
+    return bool(BOT_UA_PATTERN.search(user_agent))
+
+
+def classify_request(request):
+    """
+    Classify a tracking request as human or automated
+
+    Returns the reason the request was flagged ('missing_user_agent',
+    'user_agent' or 'missing_headers'), or None for regular browser traffic.
+    """
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    if not user_agent:
+        return 'missing_user_agent'
+
+    if is_bot_user_agent(user_agent):
+        return 'user_agent'
+
+    for header in REQUIRED_BROWSER_HEADERS:
+        if not request.META.get(header):
+            return 'missing_headers'
+
+    return None
+
+
+def _bot_hit_key(site_key, day):
+    return f'bot_hits:{site_key}:{day.isoformat()}'
+
+
+def record_bot_hit(site_key):
+    """Increment the per-site daily bot counter (cache only, no DB write)"""
+    if not site_key:
+        return
+    site_key = str(site_key)[:64]
+    metrics.incr('bot_hits_total', site_key)
+    key = _bot_hit_key(site_key, timezone.now().date())
+    cache.add(key, 0, timeout=BOT_HIT_COUNTER_TTL)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key expired between add() and incr()
+        cache.set(key, 1, timeout=BOT_HIT_COUNTER_TTL)
+
+
+def get_bot_hits(site_key, day=None):
+    """Return the number of bot hits dropped for a site on a given day"""
+    day = day or timezone.now().date()
+    return cache.get(_bot_hit_key(site_key, day), 0)
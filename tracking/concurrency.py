@@ -0,0 +1,90 @@
+"""
+Contention-aware write path for identity data
+
+Identity writers (email resolution, IP auto-match, identify_visitors) all
+read-modify-write the same Contact and EnrichmentData rows. They lock those
+rows with SELECT ... FOR UPDATE in one global order (visitors, then contacts,
+then enrichment rows, each by primary key) so concurrent writers queue instead
+of deadlocking, and retry the whole transaction a few times with jittered
+backoff when they still lose a race: a deadlock, a serialization failure, or
+an insert that lost to a concurrent writer (reported as WriteConflict). Other
+integrity errors, such as moving a contact onto an email another contact
+already owns, are deterministic and re-raised at once.
+"""
+import random
+import time
+from django.conf import settings
+from django.db import transaction, OperationalError
+from . import metrics
+
+
+# Postgres SQLSTATEs worth retrying: serialization_failure, deadlock_detected
+RETRYABLE_PGCODES = {'40001', '40P01'}
+
+
+class WriteConflict(Exception):
+    """
+    An insert lost a race for a row that did not exist when it was looked up
+
+    Writers raise this (from the IntegrityError) where a concurrent insert is
+    the expected cause; the retried transaction then finds the row.
+    """
+
+
+def _is_retryable(exc):
+    if isinstance(exc, WriteConflict):
+        return True
+    cause = getattr(exc, '__cause__', None)
+    return getattr(cause, 'pgcode', None) in RETRYABLE_PGCODES
+
+
+def run_with_retry(func, *args, site_key=None, **kwargs):
+    """
+    Run func(*args, **kwargs) in its own transaction, retrying on write conflicts
+
+    Attempts and backoff come from TRACKING_IDENTITY_WRITE_ATTEMPTS and
+    TRACKING_IDENTITY_WRITE_BACKOFF (seconds, doubled per attempt, full jitter).
+    The last conflict is re-raised once attempts are exhausted.
+    """
+    attempts = getattr(settings, 'TRACKING_IDENTITY_WRITE_ATTEMPTS', 3)
+    backoff = getattr(settings, 'TRACKING_IDENTITY_WRITE_BACKOFF', 0.05)
+
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except (WriteConflict, OperationalError) as exc:
+            if not _is_retryable(exc):
+                raise
+            if site_key:
+                metrics.incr('identity_write_conflicts_total', site_key)
+            if attempt == attempts:
+                if site_key:
+                    metrics.incr('identity_write_retries_exhausted_total', site_key)
+                raise
+            time.sleep(random.uniform(0, backoff * (2 ** (attempt - 1))))
+
+
+def lock_rows(model, pks):
+    """Lock rows of a model in primary key order and return them as a dict by pk"""
+    pks = {pk for pk in pks if pk is not None}
+    if not pks:
+        return {}
+    rows = model.objects.select_for_update().filter(pk__in=pks).order_by('pk')
+    return {row.pk: row for row in rows}
+
+
+def lock_identity_rows(visitor_ids=(), contact_ids=(), enrichment_ids=()):
+    """
+    Lock the visitors, contacts and enrichment rows an identity write touches
+
+    Always call this once per transaction with everything that will be
+    modified, so every writer acquires locks in the same order.
+    """
+    from .models import Visitor, Contact, EnrichmentData
+
+    return (
+        lock_rows(Visitor, visitor_ids),
+        lock_rows(Contact, contact_ids),
+        lock_rows(EnrichmentData, enrichment_ids),
+    )
@@ -0,0 +1,80 @@
+"""
+Promotion of hot event_data keys into typed Event columns
+
+TRACKING_PROMOTED_EVENT_FIELDS maps an event type to {column: path}, where the
+path is a dotted lookup into event_data (or a list of paths tried in order).
+Values are copied at ingest so product and revenue queries hit an index
+instead of extracting JSON from every row.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from django.conf import settings
+
+
+DEFAULT_PROMOTED_EVENT_FIELDS = {
+    'product_view': {'product_id': ['product.id', 'product.product_id']},
+    'product_abandonment': {'product_id': ['product.id', 'product.product_id']},
+    'cart_add': {'product_id': ['item.product_id', 'item.id']},
+    'checkout_start': {'cart_total': 'cart.total'},
+    'cart_abandonment': {'cart_total': 'cart.total'},
+    'checkout_abandonment': {'cart_total': ['checkout.total', 'checkout.cart.total']},
+    'purchase': {'cart_total': ['order.total', 'order.cart.total']},
+    'custom': {'element_path': 'click_data.element_path'},
+}
+
+
+def _to_text(max_length):
+    def convert(value):
+        if isinstance(value, (dict, list)):
+            return None
+        return str(value)[:max_length]
+    return convert
+
+
+def _to_money(value):
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        return None
+    # Must fit DecimalField(max_digits=12, decimal_places=2)
+    return amount if amount.is_finite() and abs(amount) < Decimal('1e10') else None
+
+
+# Promoted columns on Event and how raw JSON values are coerced into them
+PROMOTED_COLUMNS = {
+    'product_id': _to_text(255),
+    'cart_total': _to_money,
+    'element_path': _to_text(500),
+}
+
+
+def get_promoted_event_fields():
+    return getattr(settings, 'TRACKING_PROMOTED_EVENT_FIELDS', DEFAULT_PROMOTED_EVENT_FIELDS)
+
+
+def _lookup(data, path):
+    for key in path.split('.'):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def extract_promoted_fields(event_type, event_data):
+    """Return {column: typed value} for the promoted keys present in event_data"""
+    mapping = get_promoted_event_fields().get(event_type)
+    if not mapping or not isinstance(event_data, dict):
+        return {}
+
+    values = {}
+    for column, paths in mapping.items():
+        if column not in PROMOTED_COLUMNS:
+            continue
+        for path in ([paths] if isinstance(paths, str) else paths):
+            raw = _lookup(event_data, path)
+            if raw is None or raw == '':
+                continue
+            value = PROMOTED_COLUMNS[column](raw)
+            if value is not None:
+                values[column] = value
+                break
+    return values
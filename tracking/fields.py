@@ -0,0 +1,49 @@
+"""
+Custom model fields for compact event storage
+"""
+from django.db import models
+
+
+# Stable codes for Event.EVENT_TYPES; append new types, never renumber
+EVENT_TYPE_CODES = {
+    'page_view': 1,
+    'cart_view': 2,
+    'cart_add': 3,
+    'checkout_start': 4,
+    'purchase': 5,
+    'form_submit': 6,
+    'custom': 7,
+    'browse_abandonment': 8,
+    'product_view': 9,
+    'product_abandonment': 10,
+    'cart_abandonment': 11,
+    'checkout_abandonment': 12,
+}
+EVENT_TYPE_NAMES = {code: name for name, code in EVENT_TYPE_CODES.items()}
+
+
+class EventTypeField(models.PositiveSmallIntegerField):
+    """
+    Stores an event type as a small integer code while exposing the usual
+    string names to Python, querysets, forms and templates
+    """
+    description = "Event type stored as a small integer code"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return EVENT_TYPE_NAMES.get(value, value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return EVENT_TYPE_NAMES.get(int(value), value)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            return EVENT_TYPE_CODES[value]
+        except KeyError:
+            raise ValueError(f"Unknown event type: {value!r}")
+
@@ -0,0 +1,171 @@
+"""
+Fuzzy browser fingerprint matching
+
+Fingerprints are compared field by field with configurable weights; the score
+is the weight of agreeing fields over the total weight. Candidate lookup uses
+banded bucket keys (locality-sensitive hashing over field subsets): every
+minimal set of fields whose combined weight reaches the match threshold forms
+a band, and a fingerprint is filed under one bucket per band. Two fingerprints
+scoring at or above the threshold must agree on every field of at least one
+band, so probing the visitor's buckets finds all candidates without scanning.
+"""
+import threading
+from functools import lru_cache
+from itertools import combinations
+from django.conf import settings
+from .versioning import get_version
+
+
+VERSION_NAMESPACE = 'enrichment'
+
+FINGERPRINT_FIELDS = ('browser_name', 'os_name', 'device_type', 'screen_resolution', 'timezone', 'language')
+
+DEFAULT_FINGERPRINT_WEIGHTS = {
+    'browser_name': 0.2,
+    'os_name': 0.2,
+    'device_type': 0.1,
+    'screen_resolution': 0.25,
+    'timezone': 0.15,
+    'language': 0.1,
+}
+
+DEFAULT_MATCH_THRESHOLD = 0.8
+
+
+def get_weights():
+    """Normalised per-field weights from settings"""
+    weights = getattr(settings, 'TRACKING_FINGERPRINT_WEIGHTS', DEFAULT_FINGERPRINT_WEIGHTS)
+    total = sum(weights.get(field, 0) for field in FINGERPRINT_FIELDS) or 1
+    return tuple((field, weights.get(field, 0) / total) for field in FINGERPRINT_FIELDS)
+
+
+def get_threshold():
+    return getattr(settings, 'TRACKING_FINGERPRINT_MATCH_THRESHOLD', DEFAULT_MATCH_THRESHOLD)
+
+
+def normalize_fingerprint(fingerprint):
+    """Return a dict of the fingerprint fields, lower-cased, with unknown values blanked"""
+    if isinstance(fingerprint, dict):
+        values = {field: fingerprint.get(field) for field in FINGERPRINT_FIELDS}
+    else:
+        values = {field: getattr(fingerprint, field, None) for field in FINGERPRINT_FIELDS}
+
+    normalized = {}
+    for field, value in values.items():
+        value = str(value or '').strip().lower()
+        normalized[field] = '' if value == 'unknown' else value
+    return normalized
+
+
+def similarity(a, b):
+    """Weighted share of fields on which two fingerprints agree (0.0 - 1.0)"""
+    a, b = normalize_fingerprint(a), normalize_fingerprint(b)
+    return sum(weight for field, weight in get_weights() if a[field] and a[field] == b[field])
+
+
+@lru_cache(maxsize=8)
+def _bands(weights, threshold):
+    bands = []
+    for size in range(1, len(weights) + 1):
+        for combo in combinations(weights, size):
+            if sum(weight for _, weight in combo) + 1e-9 < threshold:
+                continue
+            fields = tuple(field for field, _ in combo)
+            # Only minimal subsets: supersets of a band add no recall
+            if not any(set(band) <= set(fields) for band in bands):
+                bands.append(fields)
+    return tuple(bands)
+
+
+def get_bands():
+    """Field subsets used as LSH bands for the configured weights and threshold"""
+    return _bands(get_weights(), get_threshold())
+
+
+def bucket_keys(fingerprint):
+    """Bucket keys of a fingerprint, one per band whose fields are all known"""
+    normalized = normalize_fingerprint(fingerprint)
+    keys = []
+    for i, band in enumerate(get_bands()):
+        values = [normalized[field] for field in band]
+        if all(values):
+            keys.append(f'{i}:' + '|'.join(values))
+    return keys
+
+
+class FingerprintIndex:
+    """LSH bucket index from stored enrichment fingerprints to enrichment ids"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.fingerprints = []
+
+    def add(self, enrichment_id, fingerprint):
+        position = len(self.fingerprints)
+        self.fingerprints.append((enrichment_id, normalize_fingerprint(fingerprint)))
+        for key in bucket_keys(fingerprint):
+            self.buckets.setdefault(key, []).append(position)
+
+    def match(self, fingerprint, threshold=None):
+        """Return (enrichment_id, confidence) of the best candidate at or above threshold, or None"""
+        threshold = get_threshold() if threshold is None else threshold
+        candidates = set()
+        for key in bucket_keys(fingerprint):
+            candidates.update(self.buckets.get(key, ()))
+
+        # Positions follow (created_at, pk), newest first: on equal scores the
+        # newest enrichment row wins, as in SetBasedMatcher.best_matches()
+        best = None
+        for position in sorted(candidates):
+            enrichment_id, stored = self.fingerprints[position]
+            score = similarity(fingerprint, stored)
+            if score + 1e-9 >= threshold and (best is None or score > best[1]):
+                best = (enrichment_id, score)
+        return best
+
+
+_site_indexes = {}
+_lock = threading.Lock()
+
+
+def build_site_index(site_id):
+    """Build a fingerprint index from the site's enrichment snapshot"""
+    from .snapshot import get_snapshot
+
+    index = FingerprintIndex()
+    # Snapshot rows are kept in (created_at, pk) order; index them newest first
+    for enrichment_id, (_, _, _, fingerprints) in reversed(get_snapshot(site_id).rows.items()):
+        for fingerprint in fingerprints:
+            index.add(enrichment_id, fingerprint)
+    return index
+
+
+def get_site_index(site_id):
+    """Return the current fingerprint index for a site, rebuilding it when enrichment data changed"""
+    version = get_version(VERSION_NAMESPACE, site_id)
+    cached = _site_indexes.get(site_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        cached = _site_indexes.get(site_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        index = build_site_index(site_id)
+        _site_indexes[site_id] = (version, index)
+        return index
+
+
+def match_fingerprint(site_id, fingerprint):
+    """Resolve a visitor or fingerprint dict to (enrichment_id, confidence) for a site, or None"""
+    return get_site_index(site_id).match(fingerprint)
+
+
+def add_fingerprint(enrichment, fp_dict):
+    """Store a fingerprint dict on an enrichment row unless an equivalent one is already there"""
+    normalized = normalize_fingerprint(fp_dict)
+    for stored in enrichment.browser_fingerprints:
+        if isinstance(stored, dict) and normalize_fingerprint(stored) == normalized:
+            return False
+    enrichment.browser_fingerprints.append(fp_dict)
+    return True
@@ -0,0 +1,59 @@
+"""
+Background flushing of per-process ingest buffers
+
+Ingest requests only add to in-memory buffers; a daemon thread per process
+writes them out every TRACKING_SKETCH_FLUSH_SECONDS, or as soon as a request
+wakes it because a buffer reached its size limit, so no request ever pays for
+a flush. The thread starts on first use in each process, so forked workers
+(gunicorn --preload, Celery prefork) run their own. At most one interval of
+buffered counts is lost if a process is killed without running atexit hooks.
+"""
+import logging
+import os
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFlusher:
+    """Daemon thread calling `flush` periodically and whenever woken"""
+
+    def __init__(self, flush, name):
+        self.flush = flush
+        self.name = name
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The parent's thread does not exist in the child
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    threading.Thread(target=self._run, name=self.name, daemon=True).start()
+                    self._pid = pid
+
+    def wake(self):
+        """Ask the thread to flush now instead of at the end of its interval"""
+        self.ensure_started()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(getattr(settings, 'TRACKING_SKETCH_FLUSH_SECONDS', 10))
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Background flush failed', extra={'flusher': self.name})
@@ -0,0 +1,82 @@
+"""
+Top pages, referrers and clicked elements maintained at ingest
+
+Each tracked hit counts its page URL, referrer and clicked element path.
+Counts are buffered per process and added to the day's HeavyHitterSketch rows
+(count-min sketch plus top-K heap) by a background thread (tracking.flushing)
+on the same schedule as the unique-visitor sketches: every
+TRACKING_SKETCH_FLUSH_SECONDS, or once TRACKING_SKETCH_MAX_PENDING distinct
+values are waiting.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+from django.conf import settings
+from django.utils import timezone
+from .flushing import BackgroundFlusher
+
+
+logger = logging.getLogger(__name__)
+
+
+_pending = {}  # (site_id, day, dimension) -> Counter of values
+_pending_size = 0
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+
+def record_hit(site_id, timestamp, page_url=None, referrer=None, element_path=None):
+    """Count the page, referrer and clicked element of a hit"""
+    global _pending_size
+    day = timezone.localdate(timestamp)
+    values = [('page', page_url), ('referrer', referrer), ('element', element_path)]
+
+    with _pending_lock:
+        for dimension, value in values:
+            if value:
+                counts = _pending.setdefault((site_id, day, dimension), Counter())
+                if value not in counts:
+                    _pending_size += 1
+                counts[value] += 1
+        full = _pending_size >= getattr(settings, 'TRACKING_SKETCH_MAX_PENDING', 1000)
+    if full:
+        _flusher.wake()
+    else:
+        _flusher.ensure_started()
+
+
+def flush():
+    """Add the buffered counts to the stored sketches; returns the number of rows written"""
+    from .models import HeavyHitterSketch
+
+    global _pending, _pending_size
+    # One flush at a time per process; hits keep buffering meanwhile
+    if not _flush_lock.acquire(blocking=False):
+        return 0
+    try:
+        with _pending_lock:
+            pending, _pending, _pending_size = _pending, {}, 0
+
+        # Rows are written in a fixed order so concurrent flushes lock them consistently
+        for bucket in sorted(pending, key=lambda bucket: (str(bucket[0]), bucket[1], bucket[2])):
+            try:
+                HeavyHitterSketch.objects.merge_counts(*bucket, pending[bucket])
+            except Exception:
+                logger.exception('Heavy hitter sketch flush failed', extra={'site_id': str(bucket[0])})
+        return len(pending)
+    finally:
+        _flush_lock.release()
+
+
+_flusher = BackgroundFlusher(flush, 'heavy-hitter-flush')
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,191 @@
+"""
+IP address and CIDR range matching for enrichment data
+
+Each site gets an in-memory index mapping exact IPs and CIDR blocks to the
+EnrichmentData row that owns them. Networks are stored in one hash table per
+prefix length, so a lookup masks the address once for every prefix length in
+use (longest first) - the same answer a radix trie walk gives, in a handful of
+dictionary probes. Indexes are cached per process and rebuilt from the shared
+enrichment snapshot (tracking.snapshot) when the site's 'enrichment' version
+is bumped by an upload or identity write.
+"""
+import ipaddress
+import itertools
+import threading
+from .versioning import get_version, bump_version
+from .bloom import schedule_rebuild
+from .snapshot import get_snapshot, record_change
+
+
+VERSION_NAMESPACE = 'enrichment'
+
+
+def parse_ip_field(value):
+    """
+    Split a CSV ip field into (ip_addresses, ip_ranges)
+
+    Accepts comma-separated single IPs, CIDR blocks ("10.0.0.0/24") and
+    dash ranges ("10.0.0.1-10.0.0.50"), which are converted to CIDR blocks.
+    Unparseable entries raise ValueError.
+    """
+    ip_addresses, ip_ranges = [], []
+    for token in (value or '').split(','):
+        token = token.strip()
+        if not token:
+            continue
+        if '/' in token:
+            ip_ranges.append(str(ipaddress.ip_network(token, strict=False)))
+        elif '-' in token:
+            first, last = (ipaddress.ip_address(part.strip()) for part in token.split('-', 1))
+            ip_ranges.extend(str(network) for network in ipaddress.summarize_address_range(first, last))
+        else:
+            ip_addresses.append(str(ipaddress.ip_address(token)))
+    return ip_addresses, ip_ranges
+
+
+class IPRangeIndex:
+    """Longest-prefix-match index from IP networks to enrichment ids"""
+
+    def __init__(self):
+        # ip version -> {prefix length: {network int: {enrichment ids}}}
+        self._tables = {4: {}, 6: {}}
+        # Prefix lengths in use, longest first
+        self._prefixes = {4: [], 6: []}
+        # enrichment id -> [(ip version, prefix length, network int)] for removal
+        self._owned = {}
+        # enrichment id -> rank in (created_at, pk) order; when rows share a
+        # network the highest rank (newest row) wins. Rows keep their rank
+        # across updates, so a patched index answers like a rebuilt one.
+        self._ranks = {}
+        self._next_rank = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(table) for tables in self._tables.values() for table in tables.values())
+
+    def add(self, network, enrichment_id):
+        """Add an IP or CIDR string owned by an enrichment row"""
+        network = ipaddress.ip_network(network, strict=False)
+        key = (network.version, network.prefixlen, int(network.network_address))
+        with self._lock:
+            tables = self._tables[network.version]
+            if network.prefixlen not in tables:
+                tables[network.prefixlen] = {}
+                self._prefixes[network.version] = sorted(tables, reverse=True)
+            if enrichment_id not in self._ranks:
+                self._ranks[enrichment_id] = next(self._next_rank)
+            tables[network.prefixlen].setdefault(key[2], set()).add(enrichment_id)
+            self._owned.setdefault(enrichment_id, []).append(key)
+
+    def remove(self, enrichment_id, keep_rank=False):
+        """Drop an enrichment row from every network it owns; other owners keep theirs"""
+        with self._lock:
+            if not keep_rank:
+                self._ranks.pop(enrichment_id, None)
+            for version, prefixlen, network in self._owned.pop(enrichment_id, []):
+                table = self._tables[version].get(prefixlen, {})
+                owners = table.get(network)
+                if owners is not None:
+                    owners.discard(enrichment_id)
+                    if not owners:
+                        del table[network]
+
+    def add_enrichment(self, enrichment_id, ip_addresses=(), ip_ranges=()):
+        """
+        Index all exact IPs and ranges of one enrichment row, skipping bad values
+
+        Rows must be added oldest first; a row seen for the first time ranks
+        as the newest, even if it has no networks yet.
+        """
+        with self._lock:
+            if enrichment_id not in self._ranks:
+                self._ranks[enrichment_id] = next(self._next_rank)
+        for value in list(ip_addresses or []) + list(ip_ranges or []):
+            try:
+                self.add(value, enrichment_id)
+            except ValueError:
+                continue
+
+    def update_enrichment(self, enrichment_id, ip_addresses=(), ip_ranges=()):
+        """Replace the networks of a row, keeping its place among rows that share them"""
+        self.remove(enrichment_id, keep_rank=True)
+        self.add_enrichment(enrichment_id, ip_addresses, ip_ranges)
+
+    def lookup(self, ip):
+        """Return (enrichment_id, network string) for the most specific match, or None"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        value = int(address)
+        bits = address.max_prefixlen
+        tables = self._tables[address.version]
+        for prefixlen in self._prefixes[address.version]:
+            network = value & (((1 << prefixlen) - 1) << (bits - prefixlen))
+            owners = tables[prefixlen].get(network)
+            if owners:
+                return max(owners, key=self._ranks.__getitem__), f'{ipaddress.ip_address(network)}/{prefixlen}'
+        return None
+
+
+_site_indexes = {}
+_build_lock = threading.Lock()
+
+
+def build_site_index(site_id):
+    """Build a fresh index from the site's enrichment snapshot"""
+    index = IPRangeIndex()
+    for enrichment_id, (ip_addresses, ip_ranges, _, _) in get_snapshot(site_id).rows.items():
+        index.add_enrichment(enrichment_id, ip_addresses, ip_ranges)
+    return index
+
+
+def get_site_index(site_id):
+    """Return the current index for a site, rebuilding it if another process changed the data"""
+    version = get_version(VERSION_NAMESPACE, site_id)
+    cached = _site_indexes.get(site_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _build_lock:
+        cached = _site_indexes.get(site_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        index = build_site_index(site_id)
+        _site_indexes[site_id] = (version, index)
+        return index
+
+
+def lookup_ip(site_id, ip):
+    """Resolve an IP to (enrichment_id, matched network) for a site, or None"""
+    if not ip:
+        return None
+    return get_site_index(site_id).lookup(ip)
+
+
+def update_enrichment_index(site_id, rows):
+    """
+    Apply changed enrichment rows, given as (id, ip_addresses, ip_ranges), to
+    this process's index in place and bump the site version once so other
+    processes rebuild theirs
+    """
+    cached = _site_indexes.get(site_id)
+    version = bump_version(VERSION_NAMESPACE, site_id)
+    record_change(site_id, version, [enrichment_id for enrichment_id, _, _ in rows])
+    if cached and cached[0] == version - 1:
+        # Nobody else changed the site since our copy was built: patch it
+        index = cached[1]
+        for enrichment_id, ip_addresses, ip_ranges in rows:
+            index.update_enrichment(enrichment_id, ip_addresses, ip_ranges)
+        _site_indexes[site_id] = (version, index)
+    else:
+        _site_indexes.pop(site_id, None)
+    schedule_rebuild(site_id)
+
+
+def invalidate_enrichment(site_id):
+    """Force every process to rebuild its index and filter for a site"""
+    bump_version(VERSION_NAMESPACE, site_id)
+    _site_indexes.pop(site_id, None)
+    schedule_rebuild(site_id)
@@ -0,0 +1,197 @@
+"""
+Live event fan-out for dashboard Server-Sent Events streams
+
+The tracking endpoint publishes one small message per hit (the event plus
+counter deltas) to a per-site channel. Each process keeps a hub of connected
+dashboard streams and fans every message out to the streams subscribed to that
+site or to all sites. With TRACKING_LIVE_BACKEND = 'redis' messages go through
+Redis pub/sub, and a single listener thread per process feeds the local hub, so
+hits ingested by any worker reach every dashboard. The 'memory' backend only
+delivers within the publishing process.
+
+Every stream has a bounded buffer. A dashboard that cannot keep up loses its
+oldest messages and is told how many it missed, instead of growing memory.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+ALL_SITES = 'all'
+CHANNEL_PREFIX = 'live:'
+
+
+class Subscription:
+    """One dashboard stream: a bounded buffer drained by an asyncio task"""
+
+    def __init__(self, channel, loop, buffer_size):
+        self.channel = channel
+        self.loop = loop
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self._buffer = deque()
+        self._ready = asyncio.Event()
+
+    def offer(self, message):
+        """Queue a message from any thread"""
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if len(self._buffer) >= self.buffer_size:
+            self._buffer.popleft()
+            self.dropped += 1
+        self._buffer.append(message)
+        self._ready.set()
+
+    async def get(self, timeout):
+        """Next message, a lag notice if messages were dropped, or None after `timeout` seconds"""
+        if not self._buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {'type': 'lagged', 'dropped': dropped}
+        return self._buffer.popleft()
+
+
+class LiveHub:
+    """Subscriptions of this process, by channel (a site id or ALL_SITES)"""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, buffer_size):
+        subscription = Subscription(channel, asyncio.get_running_loop(), buffer_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._channels[subscription.channel]
+
+    def dispatch(self, site_id, message):
+        """Deliver a site's message to its own streams and to the all-sites streams"""
+        with self._lock:
+            subscriptions = list(self._channels.get(site_id, ())) + list(self._channels.get(ALL_SITES, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.offer(message)
+            except RuntimeError:
+                # The stream's event loop is gone
+                self.unsubscribe(subscription)
+
+
+class MemoryLiveBackend:
+    """Delivers messages to the streams of the publishing process only"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, site_id, message):
+        self.hub.dispatch(site_id, message)
+
+    def start(self):
+        pass
+
+
+class RedisLiveBackend:
+    """Redis pub/sub, with one listener thread per process feeding the local hub"""
+
+    def __init__(self, hub, url):
+        import redis
+        self.hub = hub
+        self.client = redis.Redis.from_url(url)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, site_id, message):
+        self.client.publish(f'{CHANNEL_PREFIX}{site_id}', json.dumps(message))
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='live-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                for item in pubsub.listen():
+                    channel = item['channel'].decode()
+                    self.hub.dispatch(channel[len(CHANNEL_PREFIX):], json.loads(item['data']))
+            except Exception:
+                logger.exception('Live listener error, reconnecting')
+                time.sleep(1)
+
+
+hub = LiveHub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured publish backend (one per process)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if getattr(settings, 'TRACKING_LIVE_BACKEND', 'memory') == 'redis':
+                    _backend = RedisLiveBackend(hub, settings.TRACKING_LIVE_REDIS_URL)
+                else:
+                    _backend = MemoryLiveBackend(hub)
+    return _backend
+
+
+def publish_event(site, event, page_url, deltas):
+    """Push a tracked event and the counter changes it caused to live dashboards; never raises"""
+    message = {
+        'type': 'event',
+        'site': {'id': str(site.id), 'name': site.name},
+        'event': {
+            'id': str(event.id),
+            'event_type': event.event_type,
+            'page_url': page_url,
+            'visitor_id': str(event.visitor_id),
+            'session_id': event.session_id,
+            'timestamp': event.timestamp.isoformat(),
+        },
+        'deltas': deltas,
+    }
+    try:
+        get_backend().publish(str(site.id), message)
+    except Exception:
+        metrics.incr('live_publish_errors_total', site.site_key)
+        logger.warning('Live publish failed', exc_info=True, extra={'site_key': site.site_key})
+
+
+def subscribe(channel):
+    """Open a stream for a site id or ALL_SITES; must be called from the stream's event loop"""
+    get_backend().start()
+    return hub.subscribe(channel, getattr(settings, 'TRACKING_LIVE_BUFFER_SIZE', 100))
+
+
+def unsubscribe(subscription):
+    hub.unsubscribe(subscription)
+
+
+def format_sse(message):
+    """Encode a message as a Server-Sent Events frame named after its type"""
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
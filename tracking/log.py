@@ -0,0 +1,139 @@
+"""
+Structured, non-blocking logging for the ingest path
+
+Request threads only put records on an in-memory queue; a background
+QueueListener thread formats them as JSON lines and does the actual I/O.
+When the queue is full records are dropped rather than blocking a request,
+and SamplingFilter caps how often the same error is logged so error storms
+do not turn into log storms. Wired up through LOGGING in settings.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+
+# Attributes every LogRecord has; anything else came in through `extra`
+STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including `extra` fields"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per `per` seconds for each distinct
+    (logger, message template, exception type) at or above `level`. The next
+    record let through after a suppressed burst carries a `suppressed` count.
+    """
+
+    def __init__(self, rate=10, per=60, level='WARNING'):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self.level = logging._checkLevel(level)
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, str(record.msg), exc_type)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - window_start >= self.per:
+                window_start, count = now, 0
+            if count >= self.rate:
+                self._windows[key] = (window_start, count, suppressed + 1)
+                return False
+            self._windows[key] = (window_start, count + 1, 0)
+            if len(self._windows) > 10000:
+                self._windows.clear()
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingStreamHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that owns its listener thread and a JSON stream handler.
+    Enqueueing never blocks; records that do not fit are counted and dropped.
+
+    The listener starts on the first record of each process, so forked
+    workers (Celery prefork, gunicorn --preload) run their own instead of
+    filling a queue nobody drains.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(JSONFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=False)
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        atexit.register(self._stop_listener)
+
+    def _reset_after_fork(self):
+        # The parent's listener thread does not exist here, and its queue and
+        # locks may have been copied mid-use
+        self._start_lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=False)
+        self._listener_pid = None
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._listener_pid != pid:
+            with self._start_lock:
+                if self._listener_pid != pid:
+                    if self._listener_pid is not None:
+                        self._reset_after_fork()
+                    self.listener.start()
+                    self._listener_pid = pid
+
+    def _stop_listener(self):
+        if self._listener_pid == os.getpid():
+            self.listener.stop()
+            self._listener_pid = None
+
+    def prepare(self, record):
+        # Resolve the message now (args may be mutated later) but leave the
+        # expensive traceback formatting to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from tracking.event_fields import PROMOTED_COLUMNS, extract_promoted_fields, get_promoted_event_fields
+from tracking.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Copy promoted event_data keys (product id, cart total, element path) into their typed Event columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of events updated per batch',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-extract every matching event, not only events with empty promoted columns',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        columns = list(PROMOTED_COLUMNS)
+        event_types = list(get_promoted_event_fields())
+
+        events = Event.objects.filter(event_type__in=event_types)
+        if not options['all']:
+            events = events.filter(product_id__isnull=True, cart_total__isnull=True, element_path__isnull=True)
+        events = events.only('id', 'event_type', 'event_data', *columns).order_by()
+
+        scanned = 0
+        updated = 0
+        batch = []
+        for event in events.iterator(chunk_size=batch_size):
+            scanned += 1
+            values = extract_promoted_fields(event.event_type, event.event_data)
+            if not values and not options['all']:
+                continue
+            for column in columns:
+                setattr(event, column, values.get(column))
+            batch.append(event)
+
+            if len(batch) >= batch_size:
+                Event.objects.bulk_update(batch, columns)
+                updated += len(batch)
+                batch = []
+                self.stdout.write(f'  {updated} events updated ({scanned} scanned)')
+
+        if batch:
+            Event.objects.bulk_update(batch, columns)
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'\nScanned {scanned} events, updated {updated}'))
@@ -0,0 +1,68 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tracking.models import Site, Visitor, Event, InternedURL
+from tracking.uuids import uuid7
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare Event insert throughput with random (uuid4) and time-ordered (uuid7) primary keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100000,
+            help='Number of events inserted per key generator',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of events per INSERT',
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        batch_size = options['batch_size']
+
+        self.stdout.write(f'Inserting {rows} events per run in batches of {batch_size} (rolled back afterwards)\n')
+        results = {}
+        for name, generator in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+            elapsed = self.run(generator, rows, batch_size)
+            results[name] = elapsed
+            self.stdout.write(f'  {name}: {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)')
+
+        self.stdout.write(self.style.SUCCESS(f'\nuuid7 speed-up: {results["uuid4"] / results["uuid7"]:.2f}x'))
+
+    def run(self, generator, rows, batch_size):
+        elapsed = 0
+        try:
+            with transaction.atomic():
+                site = Site.objects.create(name='Insert benchmark', domain=f'benchmark-{uuid.uuid4().hex}.invalid')
+                visitor = Visitor.objects.create(site=site, visitor_id='benchmark')
+                # Created directly so the rolled-back row never enters the intern cache
+                page_url = InternedURL.objects.create(value_hash=uuid.uuid4().hex, value='https://benchmark.invalid/')
+
+                start = time.perf_counter()
+                for offset in range(0, rows, batch_size):
+                    Event.objects.bulk_create([
+                        Event(
+                            id=generator(),
+                            site=site,
+                            visitor=visitor,
+                            event_type='page_view',
+                            page_url=page_url,
+                        )
+                        for _ in range(min(batch_size, rows - offset))
+                    ])
+                elapsed = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed
@@ -0,0 +1,79 @@
+import ipaddress
+import random
+import time
+from django.core.management.base import BaseCommand
+from tracking.ip_index import IPRangeIndex
+
+
+class Command(BaseCommand):
+    help = 'Measure build time and lookup latency of the IP range index against a linear scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ranges',
+            type=int,
+            default=1000000,
+            help='Number of random IPv4 CIDR blocks to index',
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=100000,
+            help='Number of random addresses to resolve',
+        )
+        parser.add_argument(
+            '--scan-lookups',
+            type=int,
+            default=20,
+            help='Number of lookups to time with a linear scan for comparison (0 to skip)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['ranges']
+
+        networks = []
+        for _ in range(count):
+            prefixlen = rng.choice((16, 20, 24, 24, 28, 32))
+            address = ipaddress.IPv4Address(rng.getrandbits(32))
+            networks.append(ipaddress.ip_network(f'{address}/{prefixlen}', strict=False))
+
+        self.stdout.write(f'Indexing {count} ranges')
+        index = IPRangeIndex()
+        start = time.perf_counter()
+        for i, network in enumerate(networks):
+            index.add(network, i)
+        build = time.perf_counter() - start
+        self.stdout.write(f'  Build: {build:.2f}s ({build / count * 1e6:.2f} us/range)')
+
+        probes = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(options['lookups'])]
+        # Guarantee some hits alongside the random (mostly missing) addresses
+        probes += [str(network.network_address) for network in rng.sample(networks, min(len(networks), len(probes)))]
+
+        start = time.perf_counter()
+        hits = sum(1 for ip in probes if index.lookup(ip))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'  Index lookups: {len(probes)} in {elapsed:.2f}s '
+            f'({elapsed / len(probes) * 1e6:.2f} us/lookup, {hits} hits)'
+        )
+
+        scan_lookups = options['scan_lookups']
+        if scan_lookups:
+            start = time.perf_counter()
+            for ip in probes[:scan_lookups]:
+                address = ipaddress.ip_address(ip)
+                for network in networks:
+                    if address in network:
+                        break
+            scan = (time.perf_counter() - start) / scan_lookups
+            per_lookup = elapsed / len(probes)
+            self.stdout.write(
+                f'  Linear scan: {scan * 1e3:.2f} ms/lookup '
+                f'({scan / per_lookup:.0f}x slower than the index)'
+            )
@@ -0,0 +1,66 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from tracking.models import Visitor
+from tracking.user_agents import parse_user_agent
+
+
+class Command(BaseCommand):
+    help = 'Measure the hit rate and speed-up of the cached user agent parser on a recorded UA corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corpus',
+            type=str,
+            help='File with one recorded user agent per line (defaults to stored visitor user agents)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100000,
+            help='Maximum number of user agents to replay',
+        )
+
+    def handle(self, *args, **options):
+        corpus = self.load_corpus(options.get('corpus'), options['limit'])
+        if not corpus:
+            raise CommandError('UA corpus is empty')
+
+        distinct = len(set(corpus))
+        self.stdout.write(f'Replaying {len(corpus)} user agents ({distinct} distinct)')
+        self.stdout.write(f'Cache size: {parse_user_agent.cache_info().maxsize}\n')
+
+        # Uncached baseline: call the wrapped function directly
+        start = time.perf_counter()
+        for user_agent in corpus:
+            parse_user_agent.__wrapped__(user_agent)
+        uncached = time.perf_counter() - start
+
+        # Cached run from a cold cache, in recorded order
+        parse_user_agent.cache_clear()
+        start = time.perf_counter()
+        for user_agent in corpus:
+            parse_user_agent(user_agent)
+        cached = time.perf_counter() - start
+        info = parse_user_agent.cache_info()
+
+        lookups = info.hits + info.misses
+        hit_rate = info.hits / lookups * 100 if lookups else 0
+        self.stdout.write(f'  Hits: {info.hits}  Misses: {info.misses}  Hit rate: {hit_rate:.2f}%')
+        self.stdout.write(f'  Uncached: {uncached / len(corpus) * 1e6:.2f} us/UA')
+        self.stdout.write(f'  Cached:   {cached / len(corpus) * 1e6:.2f} us/UA')
+        if cached:
+            self.stdout.write(self.style.SUCCESS(f'\nSpeed-up: {uncached / cached:.1f}x'))
+
+    def load_corpus(self, path, limit):
+        if path:
+            try:
+                with open(path, 'r') as f:
+                    return [line.strip() for line, _ in zip(f, range(limit)) if line.strip()]
+            except OSError as e:
+                raise CommandError(f'Could not read corpus: {e}')
+
+        # Stored visitors are the recorded traffic we have without an access log
+        return list(
+            Visitor.objects.exclude(user_agent__isnull=True).exclude(user_agent='')
+            .order_by('first_seen').values_list('user_agent', flat=True)[:limit]
+        )
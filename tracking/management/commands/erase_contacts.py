@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from tracking.models import Contact, Site
+
+
+class Command(BaseCommand):
+    help = 'Erase contacts (GDPR erasure requests) with chunked set-based deletes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            action='append',
+            default=[],
+            help='Email address to erase (repeatable)',
+        )
+        parser.add_argument(
+            '--file',
+            type=str,
+            help='File with one email address per line',
+        )
+        parser.add_argument(
+            '--site',
+            type=str,
+            help='Site ID or site key to restrict the erasure to (optional)',
+        )
+        parser.add_argument(
+            '--include-visitors',
+            action='store_true',
+            help='Also delete the visitors linked to each contact with their events and sessions',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of contacts erased per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many contacts would be erased without actually making changes',
+        )
+
+    def handle(self, *args, **options):
+        emails = list(options['email'])
+        if options.get('file'):
+            with open(options['file']) as f:
+                emails.extend(line.strip() for line in f if line.strip())
+        if not emails:
+            raise CommandError('Pass at least one --email or a --file of addresses to erase')
+
+        contacts = Contact.objects.filter(email__in=emails)
+        site_filter = options.get('site')
+        if site_filter:
+            sites = Site.objects.lookup(site_filter)
+            if not sites.exists():
+                self.stdout.write(self.style.ERROR(f'Site not found: {site_filter}'))
+                return
+            contacts = contacts.filter(site__in=sites)
+
+        total = contacts.count()
+        self.stdout.write(f'Found {total} contacts for {len(set(emails))} email addresses')
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'\n[DRY RUN] Would erase {total} contacts'))
+            return
+        if not total:
+            return
+
+        def progress(erased):
+            self.stdout.write(f'  {erased}/{total} contacts erased')
+
+        _, counts = contacts.erase(
+            chunk_size=options['chunk_size'],
+            include_visitors=options['include_visitors'],
+            progress=progress,
+        )
+
+        self.stdout.write('')
+        for label, count in sorted(counts.items()):
+            self.stdout.write(f'{label}: {count} deleted')
+        self.stdout.write(self.style.SUCCESS(f'\nErased {total} contacts'))
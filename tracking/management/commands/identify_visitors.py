@@ -1,5 +1,11 @@
 from django.core.management.base import BaseCommand
-from tracking.models import Visitor, Contact, EnrichmentData, Site
+from tracking.models import Visitor, Contact, EnrichmentData, Site, IdentityLink
+from tracking.ip_index import lookup_ip, update_enrichment_index
+from tracking.bloom import get_filter
+from tracking.snapshot import match_user_agent
+from tracking.fingerprints import match_fingerprint, add_fingerprint
+from tracking.concurrency import run_with_retry, lock_identity_rows
+from tracking.set_matching import SetBasedMatcher, apply_matches
 
 
 class Command(BaseCommand):
@@ -16,6 +22,17 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be identified without actually making changes',
         )
+        parser.add_argument(
+            '--set-based',
+            action='store_true',
+            help='Match all visitors of a site with one SQL join per priority tier instead of one by one',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of matched visitors applied per transaction in --set-based mode',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -49,53 +66,67 @@ class Command(BaseCommand):
 
             self.stdout.write(f'Found {unidentified_visitors.count()} unidentified visitors')
 
+            if options['set_based']:
+                total_processed += unidentified_visitors.count()
+                total_identified += self.identify_site_set_based(site, dry_run, options['batch_size'])
+                continue
+
             # Get all enrichment data for this site
             enrichment_data = EnrichmentData.objects.filter(site=site)
             self.stdout.write(f'Found {enrichment_data.count()} enrichment records to match against\n')
 
+            enrichment_filter = get_filter(site.id)
+            skipped = 0
+
             for visitor in unidentified_visitors:
                 total_processed += 1
                 enrichment = None
                 matched_via = None
                 match_details = {}
 
+                # Skip visitors whose identifiers appear in no enrichment record
+                if enrichment_filter and not enrichment_filter.might_match(
+                    ip=visitor.ip_address,
+                    user_agent=visitor.user_agent,
+                    fingerprint=visitor if visitor.browser_name and visitor.os_name else None,
+                ):
+                    skipped += 1
+                    continue
+
                 # Priority 1: Browser fingerprint matching
                 if visitor.browser_name and visitor.os_name:
-                    for enrich in enrichment_data:
-                        for stored_fp in enrich.browser_fingerprints:
-                            if (stored_fp.get('browser_name') == visitor.browser_name and
-                                stored_fp.get('os_name') == visitor.os_name and
-                                stored_fp.get('device_type') == visitor.device_type and
-                                stored_fp.get('screen_resolution') == visitor.screen_resolution):
-                                enrichment = enrich
-                                matched_via = 'browser_fingerprint'
-                                match_details = {
-                                    'browser': visitor.browser_name,
-                                    'os': visitor.os_name,
-                                    'device': visitor.device_type,
-                                    'resolution': visitor.screen_resolution
-                                }
-                                break
+                    match = match_fingerprint(site.id, visitor)
+                    if match:
+                        enrichment = enrichment_data.filter(id=match[0]).first()
                         if enrichment:
-                            break
+                            matched_via = 'browser_fingerprint'
+                            match_details = {
+                                'browser': visitor.browser_name,
+                                'os': visitor.os_name,
+                                'device': visitor.device_type,
+                                'resolution': visitor.screen_resolution,
+                                'timezone': visitor.timezone,
+                                'language': visitor.language,
+                                'confidence': round(match[1], 3),
+                            }
 
                 # Priority 2: User agent matching
                 if not enrichment and visitor.user_agent:
-                    for enrich in enrichment_data:
-                        if visitor.user_agent in enrich.user_agents:
-                            enrichment = enrich
+                    enrichment_id = match_user_agent(site.id, visitor.user_agent)
+                    if enrichment_id:
+                        enrichment = enrichment_data.filter(id=enrichment_id).first()
+                        if enrichment:
                             matched_via = 'user_agent'
                             match_details = {'user_agent': visitor.user_agent}
-                            break
 
-                # Priority 3: IP address matching
+                # Priority 3: IP address / CIDR range matching
                 if not enrichment and visitor.ip_address:
-                    for enrich in enrichment_data:
-                        if visitor.ip_address in enrich.ip_addresses:
-                            enrichment = enrich
+                    match = lookup_ip(site.id, visitor.ip_address)
+                    if match:
+                        enrichment = enrichment_data.filter(id=match[0]).first()
+                        if enrichment:
                             matched_via = 'ip_address'
-                            match_details = {'ip': visitor.ip_address}
-                            break
+                            match_details = {'ip': visitor.ip_address, 'network': match[1]}
 
                 # If we found a match, create/update contact
                 if enrichment:
@@ -105,64 +136,19 @@ class Command(BaseCommand):
                         self.stdout.write(
                             self.style.SUCCESS(
                                 f'[DRY RUN] Would identify visitor {visitor.visitor_id[:20]}... '
-                                f'as {enrichment.email} via {matched_via}'
+                                f'as {enrichment.email} via {matched_via} {match_details}'
                             )
                         )
                     else:
                         try:
-                            # Create or get contact
-                            contact, contact_created = Contact.objects.get_or_create(
-                                site=site,
-                                email=enrichment.email,
-                                defaults={
-                                    'visitor': visitor,
-                                    'enrichment_data': enrichment,
-                                    'name': f"{enrichment.first_name} {enrichment.last_name}".strip(),
-                                    'phone': enrichment.phone,
-                                    'linkedin_url': enrichment.linkedin_url,
-                                    'facebook_url': enrichment.facebook_url,
-                                    'extra_data': {
-                                        'company': enrichment.company,
-                                        'job_title': enrichment.job_title,
-                                        'location': enrichment.location,
-                                        'matched_via': matched_via,
-                                        'match_details': match_details,
-                                    }
-                                }
+                            contact_created, updated_enrichment = run_with_retry(
+                                self.identify_visitor, visitor.pk, enrichment.pk, matched_via, match_details,
+                                site_key=site.site_key,
                             )
-
-                            # If contact exists but linked to different visitor, update it
-                            if not contact_created and contact.visitor != visitor:
-                                contact.visitor = visitor
-                                contact.save()
-
-                            # Mark visitor as identified
-                            visitor.is_identified = True
-                            visitor.matched_via = matched_via
-                            visitor.save()
-
-                            # Store this visitor's fingerprint for future matching
-                            if visitor.browser_name and visitor.os_name:
-                                fp_dict = {
-                                    'browser_name': visitor.browser_name,
-                                    'os_name': visitor.os_name,
-                                    'device_type': visitor.device_type,
-                                    'screen_resolution': visitor.screen_resolution,
-                                    'timezone': visitor.timezone,
-                                    'language': visitor.language
-                                }
-                                if fp_dict not in enrichment.browser_fingerprints:
-                                    enrichment.browser_fingerprints.append(fp_dict)
-
-                                # Store user agent if not already stored
-                                if visitor.user_agent and visitor.user_agent not in enrichment.user_agents:
-                                    enrichment.user_agents.append(visitor.user_agent)
-
-                                # Store IP if not already stored
-                                if visitor.ip_address and visitor.ip_address not in enrichment.ip_addresses:
-                                    enrichment.ip_addresses.append(visitor.ip_address)
-
-                                enrichment.save()
+                            if updated_enrichment:
+                                update_enrichment_index(site.id, [(
+                                    updated_enrichment.id, updated_enrichment.ip_addresses, updated_enrichment.ip_ranges
+                                )])
 
                             action = 'Created' if contact_created else 'Updated'
                             self.stdout.write(
@@ -178,6 +164,9 @@ class Command(BaseCommand):
                                 )
                             )
 
+            if skipped:
+                self.stdout.write(f'Skipped {skipped} visitors with no possible match (Bloom filter)')
+
         self.stdout.write('\n' + '=' * 80)
         self.stdout.write(self.style.SUCCESS(f'\nSummary:'))
         self.stdout.write(f'  Total visitors processed: {total_processed}')
@@ -188,3 +177,112 @@ class Command(BaseCommand):
             self.stdout.write('Run without --dry-run to actually identify visitors.')
         else:
             self.stdout.write(self.style.SUCCESS('\nIdentification complete!'))
+
+    def identify_site_set_based(self, site, dry_run, batch_size):
+        """Match a site's unidentified visitors in SQL and apply the matches in bulk chunks"""
+        with SetBasedMatcher(site) as matcher:
+            keys, fingerprints = matcher.stage_enrichment()
+            self.stdout.write(f'Staged {keys} enrichment identifiers and {fingerprints} fingerprints')
+            candidates = matcher.build_candidates()
+            matches = list(matcher.best_matches())
+        self.stdout.write(f'Found {candidates} match candidates for {len(matches)} visitors\n')
+
+        if dry_run:
+            emails = dict(EnrichmentData.objects.filter(
+                pk__in={enrichment_id for _, enrichment_id, _, _, _ in matches}
+            ).values_list('id', 'email'))
+            for visitor_id, enrichment_id, matched_via, score, detail in matches:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'[DRY RUN] Would identify visitor {visitor_id} as {emails.get(enrichment_id)} '
+                        f'via {matched_via} (score {score:g})'
+                    )
+                )
+            return len(matches)
+
+        identified = 0
+        for start in range(0, len(matches), batch_size):
+            chunk = matches[start:start + batch_size]
+            try:
+                count, created, changed = run_with_retry(apply_matches, site, chunk, site_key=site.site_key)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Error applying {len(chunk)} matches: {e}'))
+                continue
+            if changed:
+                update_enrichment_index(site.id, [
+                    (enrichment.id, enrichment.ip_addresses, enrichment.ip_ranges) for enrichment in changed
+                ])
+            identified += count
+            self.stdout.write(self.style.SUCCESS(f'Identified {count} visitors, created {created} contacts'))
+        return identified
+
+    def identify_visitor(self, visitor_pk, enrichment_pk, matched_via, match_details):
+        """
+        Link one visitor to an enrichment match inside a locked transaction
+
+        Returns (contact_created, enrichment row if it gained identifiers).
+        """
+        enrichment = EnrichmentData.objects.get(pk=enrichment_pk)
+        contact_ids = Contact.objects.filter(
+            site_id=enrichment.site_id, email=enrichment.email
+        ).values_list('id', flat=True)
+        visitors, _, enrichments = lock_identity_rows([visitor_pk], contact_ids, [enrichment_pk])
+        visitor, enrichment = visitors[visitor_pk], enrichments[enrichment_pk]
+
+        # Create or get contact
+        contact, contact_created = Contact.objects.get_or_create(
+            site_id=visitor.site_id,
+            email=enrichment.email,
+            defaults={
+                'visitor': visitor,
+                'enrichment_data': enrichment,
+                'name': f"{enrichment.first_name} {enrichment.last_name}".strip(),
+                'phone': enrichment.phone,
+                'linkedin_url': enrichment.linkedin_url,
+                'facebook_url': enrichment.facebook_url,
+                'extra_data': {
+                    'company': enrichment.company,
+                    'job_title': enrichment.job_title,
+                    'location': enrichment.location,
+                    'matched_via': matched_via,
+                    'match_details': match_details,
+                }
+            }
+        )
+
+        # If contact exists but linked to different visitor, update it
+        if not contact_created and contact.visitor != visitor:
+            if contact.visitor_id:
+                IdentityLink.objects.link(contact.visitor, visitor, via=matched_via)
+            contact.visitor = visitor
+            contact.save()
+
+        # Mark visitor as identified
+        visitor.is_identified = True
+        visitor.matched_via = matched_via
+        visitor.save(update_fields=['is_identified', 'matched_via'])
+
+        # Store this visitor's fingerprint for future matching
+        if visitor.browser_name and visitor.os_name:
+            fp_dict = {
+                'browser_name': visitor.browser_name,
+                'os_name': visitor.os_name,
+                'device_type': visitor.device_type,
+                'screen_resolution': visitor.screen_resolution,
+                'timezone': visitor.timezone,
+                'language': visitor.language
+            }
+            add_fingerprint(enrichment, fp_dict)
+
+            # Store user agent if not already stored
+            if visitor.user_agent and visitor.user_agent not in enrichment.user_agents:
+                enrichment.user_agents.append(visitor.user_agent)
+
+            # Store IP if not already stored
+            if visitor.ip_address and visitor.ip_address not in enrichment.ip_addresses:
+                enrichment.ip_addresses.append(visitor.ip_address)
+
+            enrichment.save()
+            return contact_created, enrichment
+
+        return contact_created, None
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tracking.models import Event, Session, Site
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized Session rows from raw events (backfill for existing data)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            type=str,
+            help='Site ID or site key to process (optional, processes all sites if not specified)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of sessions written per INSERT',
+        )
+
+    def handle(self, *args, **options):
+        site_filter = options.get('site')
+        batch_size = options['batch_size']
+
+        if site_filter:
+            sites = Site.objects.lookup(site_filter)
+            if not sites.exists():
+                self.stdout.write(self.style.ERROR(f'Site not found: {site_filter}'))
+                return
+        else:
+            sites = Site.objects.all()
+
+        total = 0
+        for site in sites:
+            with transaction.atomic():
+                Session.objects.filter(site=site).delete()
+                count = self.rebuild_site(site, batch_size)
+            total += count
+            self.stdout.write(f'{site.name}: rebuilt {count} sessions')
+
+        self.stdout.write(self.style.SUCCESS(f'\nRebuilt {total} sessions'))
+
+    def rebuild_site(self, site, batch_size):
+        # Stream events in session order so each session is folded in one pass
+        events = Event.objects.filter(site=site).exclude(session_id__isnull=True).exclude(session_id='').order_by(
+            'session_id', 'timestamp'
+        ).values_list(
+            'session_id', 'visitor_id', 'event_type', 'page_url__value', 'timestamp', 'referrer__value',
+            'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+        )
+
+        batch = []
+        count = 0
+        current = None
+        for (session_id, visitor_id, event_type, page_url, timestamp, referrer,
+             utm_source, utm_medium, utm_campaign, utm_term, utm_content) in events.iterator(chunk_size=2000):
+            if current is None or current.session_id != session_id:
+                if current is not None:
+                    batch.append(current)
+                current = Session(
+                    site=site,
+                    visitor_id=visitor_id,
+                    session_id=session_id,
+                    started_at=timestamp,
+                    entry_url=page_url,
+                    referrer=referrer,
+                    utm_source=utm_source,
+                    utm_medium=utm_medium,
+                    utm_campaign=utm_campaign,
+                    utm_term=utm_term,
+                    utm_content=utm_content,
+                )
+            current.ended_at = timestamp
+            current.exit_url = page_url
+            current.event_count += 1
+            if event_type == 'page_view':
+                current.page_view_count += 1
+
+            if len(batch) >= batch_size:
+                Session.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+
+        if current is not None:
+            batch.append(current)
+        Session.objects.bulk_create(batch)
+        return count + len(batch)
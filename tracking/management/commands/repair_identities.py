@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from tracking.models import Visitor, Site
+from tracking.tasks import repair_identities, repair_identities_sync
+
+
+class Command(BaseCommand):
+    help = 'Restore missing Contacts of identified visitors from their identify events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            type=str,
+            help='Site ID or site key to process (optional, processes all sites if not specified)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of visitors repaired per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be repaired without actually making changes',
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='run_async',
+            help='Queue the repair as a Celery task instead of running it here',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        site_filter = options.get('site')
+
+        if site_filter:
+            sites = Site.objects.lookup(site_filter)
+            if not sites.exists():
+                self.stdout.write(self.style.ERROR(f'Site not found: {site_filter}'))
+                return
+        else:
+            sites = Site.objects.all()
+
+        total_repaired = 0
+        total_reset = 0
+
+        for site in sites:
+            broken = Visitor.objects.missing_contacts().filter(site=site).count()
+            if not broken:
+                continue
+
+            if options['run_async'] and not dry_run:
+                repair_identities.delay(str(site.id), batch_size)
+                self.stdout.write(f'{site.name}: queued repair of {broken} visitors')
+                continue
+
+            repaired, reset = repair_identities_sync(site.id, batch_size, dry_run=dry_run)
+            total_repaired += repaired
+            total_reset += reset
+            self.stdout.write(
+                f'{site.name}: {repaired} contacts restored from identify events, '
+                f'{reset} visitors without one marked unidentified'
+            )
+
+        prefix = '[DRY RUN] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{prefix}Repaired {total_repaired} visitors, reset {total_reset} visitors'
+        ))
@@ -0,0 +1,42 @@
+"""
+Per-site counters for ingest-side metrics
+
+Counters are stored in the Django cache so that every worker process adds to
+the same totals when a shared cache (Redis) is configured. Only names listed
+in COUNTERS are reported by the metrics endpoint.
+"""
+from django.core.cache import cache
+
+
+COUNTERS = {
+    'bot_hits_total': 'Tracking hits dropped by the bot classifier',
+    'ratelimit_site_rejected_total': 'Tracking hits rejected by the per-site token bucket',
+    'ratelimit_visitor_rejected_total': 'Tracking hits rejected by the per-visitor token bucket',
+    'ratelimit_backend_errors_total': 'Rate limiter backend failures (requests were let through)',
+    'identity_enqueued_total': 'Identity resolution tasks sent to the broker',
+    'identity_coalesced_total': 'Identify events merged into an already pending resolution',
+    'identity_write_conflicts_total': 'Identity write transactions that hit a conflict and were retried',
+    'identity_write_retries_exhausted_total': 'Identity write transactions that failed after all retries',
+    'live_publish_errors_total': 'Live dashboard messages that could not be published',
+}
+
+
+def _key(name, site_key):
+    return f'metrics:{name}:{site_key}'
+
+
+def incr(name, site_key, amount=1):
+    """Increment a counter for a site"""
+    key = _key(name, str(site_key)[:64])
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Key was evicted between add() and incr()
+        cache.set(key, amount, timeout=None)
+
+
+def get_counters(site_key):
+    """Return all registered counters for a site as a dict"""
+    values = cache.get_many([_key(name, site_key) for name in COUNTERS])
+    return {name: values.get(_key(name, site_key), 0) for name in COUNTERS}
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_enrichmentdata_browser_fingerprints_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(blank=True, help_text='Max burst of tracking events above the steady rate', null=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='rate_limit_per_minute',
+            field=models.PositiveIntegerField(blank=True, help_text='Max tracking events per minute for this site', null=True),
+        ),
+    ]
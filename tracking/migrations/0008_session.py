@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_site_rate_limit_burst_site_rate_limit_per_minute'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Session',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('session_id', models.CharField(max_length=255)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('event_count', models.PositiveIntegerField(default=0)),
+                ('page_view_count', models.PositiveIntegerField(default=0)),
+                ('entry_url', models.TextField()),
+                ('exit_url', models.TextField()),
+                ('referrer', models.TextField(blank=True, null=True)),
+                ('utm_source', models.CharField(blank=True, max_length=255, null=True)),
+                ('utm_medium', models.CharField(blank=True, max_length=255, null=True)),
+                ('utm_campaign', models.CharField(blank=True, max_length=255, null=True)),
+                ('utm_term', models.CharField(blank=True, max_length=255, null=True)),
+                ('utm_content', models.CharField(blank=True, max_length=255, null=True)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='tracking.site')),
+                ('visitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='tracking.visitor')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['site', '-started_at'], name='tracking_se_site_id_6b3121_idx'), models.Index(fields=['visitor', '-started_at'], name='tracking_se_visitor_1dead0_idx')],
+                'unique_together': {('site', 'session_id')},
+            },
+        ),
+    ]
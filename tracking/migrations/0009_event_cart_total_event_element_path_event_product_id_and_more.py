@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='cart_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='element_path',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='product_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['site', 'product_id'], name='tracking_ev_site_id_083f55_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['site', 'event_type', 'cart_total'], name='tracking_ev_site_id_7534f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['site', 'element_path'], name='tracking_ev_site_id_c27e7f_idx'),
+        ),
+    ]
@@ -0,0 +1,204 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import tracking.fields
+
+
+# Frozen copy of tracking.fields.EVENT_TYPE_CODES at the time of this migration
+EVENT_TYPE_CODES = {
+    'page_view': 1,
+    'cart_view': 2,
+    'cart_add': 3,
+    'checkout_start': 4,
+    'purchase': 5,
+    'form_submit': 6,
+    'custom': 7,
+    'browse_abandonment': 8,
+    'product_view': 9,
+    'product_abandonment': 10,
+    'cart_abandonment': 11,
+    'checkout_abandonment': 12,
+}
+EVENT_TYPE_NAMES = {code: name for name, code in EVENT_TYPE_CODES.items()}
+BATCH_SIZE = 2000
+
+
+def _intern(model, cache, value):
+    if not value:
+        return None
+    if value not in cache:
+        value_hash = hashlib.sha1(value.encode('utf-8')).hexdigest()
+        cache[value] = model.objects.get_or_create(value_hash=value_hash, defaults={'value': value})[0].id
+    return cache[value]
+
+
+def intern_event_strings(apps, schema_editor):
+    """Move URLs, titles and referrers into dictionary tables and encode event types"""
+    Event = apps.get_model('tracking', 'Event')
+    InternedURL = apps.get_model('tracking', 'InternedURL')
+    InternedTitle = apps.get_model('tracking', 'InternedTitle')
+    urls, titles = {}, {}
+
+    batch = []
+    events = Event.objects.only('id', 'event_type', 'event_name', 'page_url', 'page_title', 'referrer')
+    for event in events.iterator(chunk_size=BATCH_SIZE):
+        event.page_url_ref_id = _intern(InternedURL, urls, event.page_url)
+        event.page_title_ref_id = _intern(InternedTitle, titles, event.page_title)
+        event.referrer_ref_id = _intern(InternedURL, urls, event.referrer)
+        if event.event_type not in EVENT_TYPE_CODES:
+            # Types outside EVENT_TYPES become named custom events, as at ingest
+            event.event_name = event.event_name or event.event_type
+        event.event_type_code = EVENT_TYPE_CODES.get(event.event_type, EVENT_TYPE_CODES['custom'])
+        batch.append(event)
+        if len(batch) >= BATCH_SIZE:
+            Event.objects.bulk_update(batch, ['page_url_ref', 'page_title_ref', 'referrer_ref', 'event_type_code', 'event_name'])
+            batch = []
+    Event.objects.bulk_update(batch, ['page_url_ref', 'page_title_ref', 'referrer_ref', 'event_type_code', 'event_name'])
+
+
+def restore_event_strings(apps, schema_editor):
+    """Copy dictionary values and event type names back into the text columns"""
+    Event = apps.get_model('tracking', 'Event')
+
+    batch = []
+    events = Event.objects.select_related('page_url_ref', 'page_title_ref', 'referrer_ref')
+    for event in events.iterator(chunk_size=BATCH_SIZE):
+        event.page_url = event.page_url_ref.value if event.page_url_ref else ''
+        event.page_title = event.page_title_ref.value[:500] if event.page_title_ref else None
+        event.referrer = event.referrer_ref.value if event.referrer_ref else None
+        # Unknown types stay custom events; their original name is kept in event_name
+        event.event_type = EVENT_TYPE_NAMES.get(event.event_type_code, 'custom')
+        batch.append(event)
+        if len(batch) >= BATCH_SIZE:
+            Event.objects.bulk_update(batch, ['page_url', 'page_title', 'referrer', 'event_type'])
+            batch = []
+    Event.objects.bulk_update(batch, ['page_url', 'page_title', 'referrer', 'event_type'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_event_cart_total_event_element_path_event_product_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InternedTitle',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('value_hash', models.CharField(max_length=40, unique=True)),
+                ('value', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'interned title',
+            },
+        ),
+        migrations.CreateModel(
+            name='InternedURL',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('value_hash', models.CharField(max_length=40, unique=True)),
+                ('value', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'interned URL',
+            },
+        ),
+        # New compact columns live next to the old ones while data is copied
+        migrations.AddField(
+            model_name='event',
+            name='page_url_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tracking.internedurl'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='page_title_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tracking.internedtitle'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='referrer_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tracking.internedurl'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='event_type_code',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(intern_event_strings, restore_event_strings),
+        # Swap the compact columns in under the original field names
+        migrations.RemoveIndex(
+            model_name='event',
+            name='tracking_ev_site_id_4a1dce_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='tracking_ev_site_id_7534f2_idx',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='page_url',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='page_url',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='page_title',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='referrer',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='event_type',
+            field=models.CharField(max_length=50, blank=True, default=''),
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='event_type',
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='page_url_ref',
+            new_name='page_url',
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='page_title_ref',
+            new_name='page_title',
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='referrer_ref',
+            new_name='referrer',
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='event_type_code',
+            new_name='event_type',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='page_url',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='tracking.internedurl'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='event_type',
+            field=tracking.fields.EventTypeField(choices=[('page_view', 'Page View'), ('cart_view', 'Cart View'), ('cart_add', 'Add to Cart'), ('checkout_start', 'Checkout Started'), ('purchase', 'Purchase'), ('form_submit', 'Form Submit'), ('custom', 'Custom Event'), ('browse_abandonment', 'Browse Abandonment'), ('product_view', 'Product View'), ('product_abandonment', 'Product Abandonment'), ('cart_abandonment', 'Cart Abandonment'), ('checkout_abandonment', 'Checkout Abandonment')], db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['site', 'event_type', '-timestamp'], name='tracking_ev_site_id_4a1dce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['site', 'event_type', 'cart_total'], name='tracking_ev_site_id_7534f2_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:02
+
+from django.db import migrations, models
+import tracking.uuids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0010_compact_event_rows'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='id',
+            field=models.UUIDField(default=tracking.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='id',
+            field=models.UUIDField(default=tracking.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='visitor',
+            name='id',
+            field=models.UUIDField(default=tracking.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
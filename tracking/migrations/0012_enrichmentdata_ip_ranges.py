@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0011_alter_event_id_alter_session_id_alter_visitor_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrichmentdata',
+            name='ip_ranges',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
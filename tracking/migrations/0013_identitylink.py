@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0012_enrichmentdata_ip_ranges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentityLink',
+            fields=[
+                ('visitor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='identity_link', serialize=False, to='tracking.visitor')),
+                ('size', models.PositiveIntegerField(default=1)),
+                ('linked_via', models.CharField(blank=True, max_length=50, null=True)),
+                ('linked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('root', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='identity_members', to='tracking.visitor')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identity_links', to='tracking.site')),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 2000
+
+
+def backfill_event_counts(apps, schema_editor):
+    """Seed the per-visitor event counter from the existing Event rows"""
+    Visitor = apps.get_model('tracking', 'Visitor')
+    Event = apps.get_model('tracking', 'Event')
+    counts = Event.objects.filter(visitor=OuterRef('pk')).order_by().values('visitor').annotate(
+        total=Count('id')
+    ).values('total')
+
+    last_pk = None
+    while True:
+        visitors = Visitor.objects.order_by('pk')
+        if last_pk is not None:
+            visitors = visitors.filter(pk__gt=last_pk)
+        pks = list(visitors.values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        Visitor.objects.filter(pk__in=pks).update(event_count=Coalesce(Subquery(counts), 0))
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0013_identitylink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitor',
+            name='event_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['created_at', 'id'], name='tracking_co_created_5880a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['site', 'created_at', 'id'], name='tracking_co_site_id_324fff_idx'),
+        ),
+        migrations.RunPython(backfill_event_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0014_visitor_event_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueVisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('dimension', models.CharField(choices=[('site', 'Site'), ('page', 'Page'), ('campaign', 'UTM campaign')], max_length=20)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('registers', models.BinaryField()),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unique_visitor_sketches', to='tracking.site')),
+            ],
+            options={
+                'unique_together': {('site', 'dimension', 'day', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0015_uniquevisitorsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeavyHitterSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('dimension', models.CharField(choices=[('page', 'Page'), ('referrer', 'Referrer'), ('element', 'Clicked element')], max_length=20)),
+                ('sketch', models.BinaryField()),
+                ('top', models.JSONField(default=list)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heavy_hitter_sketches', to='tracking.site')),
+            ],
+            options={
+                'unique_together': {('site', 'dimension', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:44
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0016_heavyhittersketch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='tracking_contact_email_lower'),
+        ),
+    ]
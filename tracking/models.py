@@ -1,7 +1,34 @@
-from django.db import models
+from django.db import models, connections, transaction, IntegrityError
+from django.db.models import F, Q, Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Lower
 import uuid
+import hashlib
 import secrets
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
 from django.utils import timezone
+from .fields import EventTypeField
+from .uuids import uuid7
+from .sketches import CountMinSketch, HyperLogLog, TopK
+
+
+class SiteManager(models.Manager):
+    def lookup(self, value):
+        """
+        Sites matching a --site style value: a site key, or else a site ID
+
+        The ID is only tried when the value parses as a UUID, so a site key
+        never reaches the UUID field.
+        """
+        sites = self.filter(site_key=value)
+        if sites.exists():
+            return sites
+        try:
+            site_id = uuid.UUID(str(value))
+        except ValueError:
+            return self.none()
+        return self.filter(id=site_id)
 
 
 class Site(models.Model):
@@ -13,6 +40,12 @@ class Site(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    # Admission control for /api/track/ (falls back to settings when empty)
+    rate_limit_per_minute = models.PositiveIntegerField(blank=True, null=True, help_text="Max tracking events per minute for this site")
+    rate_limit_burst = models.PositiveIntegerField(blank=True, null=True, help_text="Max burst of tracking events above the steady rate")
+
+    objects = SiteManager()
+
     class Meta:
         ordering = ['-created_at']
 
@@ -25,9 +58,76 @@ class Site(models.Model):
         super().save(*args, **kwargs)
 
 
+class VisitorManager(models.Manager):
+    def upsert(self, site, visitor_id, defaults=None, merge_fields=(), increment_fields=()):
+        """
+        Insert a visitor or refresh the existing row in a single statement
+
+        Runs INSERT ... ON CONFLICT (site, visitor_id) DO UPDATE ... RETURNING, so
+        simultaneous first hits from a new visitor cannot race each other.
+        last_seen is always bumped, `merge_fields` take the new value unless
+        it is empty and `increment_fields` (counters) go up by one. Backends
+        without upsert + RETURNING (e.g. SQLite < 3.35) fall back to
+        get_or_create(). Returns (visitor, created).
+        """
+        defaults = dict(defaults or {}, **{name: 1 for name in increment_fields})
+        connection = connections[self.db]
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert):
+            return self._upsert_fallback(site, visitor_id, defaults, merge_fields, increment_fields)
+
+        visitor = self.model(site=site, visitor_id=visitor_id, **defaults)
+        fields = self.model._meta.concrete_fields
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        columns = [qn(field.column) for field in fields]
+        params = [field.get_db_prep_save(field.pre_save(visitor, add=True), connection) for field in fields]
+
+        last_seen = qn(self.model._meta.get_field('last_seen').column)
+        updates = [f'{last_seen} = EXCLUDED.{last_seen}']
+        for name in merge_fields:
+            column = qn(self.model._meta.get_field(name).column)
+            updates.append(f"{column} = COALESCE(NULLIF(EXCLUDED.{column}, ''), {table}.{column})")
+        for name in increment_fields:
+            column = qn(self.model._meta.get_field(name).column)
+            updates.append(f'{column} = {table}.{column} + 1')
+
+        sql = (
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+            f'ON CONFLICT ({qn("site_id")}, {qn("visitor_id")}) DO UPDATE SET {", ".join(updates)} '
+            f'RETURNING {", ".join(columns)}'
+        )
+        row = list(self.raw(sql, params))[0]
+        # The generated primary key only survives if our INSERT won
+        return row, row.id == visitor.id
+
+    def _upsert_fallback(self, site, visitor_id, defaults, merge_fields, increment_fields):
+        visitor, created = self.get_or_create(site=site, visitor_id=visitor_id, defaults=defaults)
+        if not created:
+            for name in merge_fields:
+                if defaults.get(name):
+                    setattr(visitor, name, defaults[name])
+            for name in increment_fields:
+                setattr(visitor, name, F(name) + 1)
+            visitor.save()
+            if increment_fields:
+                visitor.refresh_from_db(fields=list(increment_fields))
+        return visitor, created
+
+    def missing_contacts(self):
+        """
+        Identified visitors whose identity set has no Contact
+
+        One anti-join query: visitors linked to the one holding the contact
+        (see IdentityLink) are consistent and not returned.
+        """
+        linked_contact = Contact.objects.filter(visitor__identity_link__root_id=OuterRef('identity_link__root_id'))
+        return self.filter(is_identified=True, contact__isnull=True).exclude(Exists(linked_contact))
+
+
 class Visitor(models.Model):
     """Represents an anonymous visitor with a unique tracking ID"""
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)  # Time-ordered for insert locality
     site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='visitors')
     visitor_id = models.CharField(max_length=255, db_index=True)  # Cookie/fingerprint ID
     first_seen = models.DateTimeField(auto_now_add=True)
@@ -51,6 +151,9 @@ class Visitor(models.Model):
     is_identified = models.BooleanField(default=False)
     matched_via = models.CharField(max_length=50, blank=True, null=True)  # ip, email, phone, etc.
 
+    # Maintained by the tracking upsert so listings never COUNT the Event table
+    event_count = models.PositiveIntegerField(default=0)
+
     # UTM parameters (first-touch attribution)
     utm_source = models.CharField(max_length=255, blank=True, null=True)
     utm_medium = models.CharField(max_length=255, blank=True, null=True)
@@ -58,6 +161,8 @@ class Visitor(models.Model):
     utm_term = models.CharField(max_length=255, blank=True, null=True)
     utm_content = models.CharField(max_length=255, blank=True, null=True)
 
+    objects = VisitorManager()
+
     class Meta:
         ordering = ['-last_seen']
         unique_together = [['site', 'visitor_id']]
@@ -69,6 +174,201 @@ class Visitor(models.Model):
     def __str__(self):
         return f"Visitor {self.visitor_id[:8]}... on {self.site.name}"
 
+    def delete(self, using=None, keep_parents=False):
+        """Delete the visitor, keeping the rest of its identity set stitched together"""
+        with transaction.atomic(using=using):
+            IdentityLink.objects.db_manager(using).detach([self.pk])
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+class IdentityLinkManager(models.Manager):
+    def find(self, visitor_id):
+        """Return the root visitor id of a visitor's identity set, compressing the path to it"""
+        path = []
+        current = visitor_id
+        while True:
+            parent = self.filter(visitor_id=current).values_list('root_id', flat=True).first()
+            # Stop at a singleton (no row), the root, or a cycle left by a manual edit
+            if parent is None or parent == current or parent in path:
+                break
+            path.append(current)
+            current = parent
+        if len(path) > 1:
+            # The last node on the path already points at the root
+            self.filter(visitor_id__in=path[:-1]).update(root_id=current)
+        return current
+
+    def link(self, visitor, other, via=None):
+        """
+        Union the identity sets of two visitors of the same site and return the root visitor id
+
+        Union by size: every member of the smaller set is re-pointed at the
+        larger set's root in one UPDATE, so paths stay one hop long and
+        find() is a single primary key lookup.
+        """
+        if visitor.site_id != other.site_id:
+            raise ValueError("Cannot link visitors of different sites")
+
+        with transaction.atomic():
+            while True:
+                root_a, root_b = self.find(visitor.pk), self.find(other.pk)
+                if root_a == root_b:
+                    return root_a
+
+                for root in (root_a, root_b):
+                    self.get_or_create(
+                        visitor_id=root,
+                        defaults={'root_id': root, 'site_id': visitor.site_id, 'linked_via': via},
+                    )
+                # Lock both roots in key order; if a concurrent union moved either, start over
+                locked = self.select_for_update().filter(visitor_id__in=[root_a, root_b]).order_by('visitor_id')
+                sizes = {link.visitor_id: link.size for link in locked if link.root_id == link.visitor_id}
+                if len(sizes) == 2:
+                    break
+
+            large, small = (root_a, root_b) if sizes[root_a] >= sizes[root_b] else (root_b, root_a)
+
+            self.filter(root_id=small).update(root_id=large)
+            self.filter(visitor_id=small).update(linked_via=via, linked_at=timezone.now())
+            self.filter(visitor_id=large).update(size=F('size') + sizes[small])
+            return large
+
+    def detach(self, visitor_ids):
+        """
+        Take visitors out of their identity sets ahead of deleting them
+
+        The rest of each set stays stitched: a set whose root is leaving is
+        re-rooted at its remaining member with the smallest id, and root sizes
+        are recounted. The leaving visitors' own link rows are deleted.
+        """
+        visitor_ids = set(visitor_ids)
+        with transaction.atomic():
+            roots = set(self.filter(visitor_id__in=visitor_ids).values_list('root_id', flat=True))
+            # Lock every affected set in key order, like link()
+            rows = list(self.select_for_update().filter(root_id__in=roots).order_by('visitor_id'))
+            for root in roots:
+                remaining = [row.visitor_id for row in rows if row.root_id == root and row.visitor_id not in visitor_ids]
+                if not remaining:
+                    continue
+                new_root = root if root not in visitor_ids else remaining[0]
+                if new_root != root:
+                    self.filter(visitor_id__in=remaining).update(root_id=new_root)
+                self.filter(visitor_id=new_root).update(size=len(remaining))
+            self.filter(visitor_id__in=visitor_ids).delete()
+
+    def members(self, visitor_id):
+        """Ids of all visitors stitched to a visitor, as a subquery (the visitor itself included)"""
+        root = self.filter(visitor_id=visitor_id).values('root_id')
+        return Visitor.objects.filter(
+            Q(id=visitor_id) | Q(identity_link__root_id=Subquery(root))
+        ).values('id')
+
+
+class IdentityLink(models.Model):
+    """
+    Identity graph node: the union-find parent of a visitor
+
+    Visitors recognised as the same person (same email on several devices,
+    enrichment matches) share a root visitor. Visitors without a row are
+    singleton sets. `size` is only maintained on root rows.
+    """
+    visitor = models.OneToOneField(Visitor, on_delete=models.CASCADE, primary_key=True, related_name='identity_link')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='identity_links')
+    # Deleting a root would take the whole set with it: detach() re-roots first
+    root = models.ForeignKey(Visitor, on_delete=models.RESTRICT, related_name='identity_members', db_index=True)
+    size = models.PositiveIntegerField(default=1)
+
+    linked_via = models.CharField(max_length=50, blank=True, null=True)  # email, ip_address, browser_fingerprint, etc.
+    linked_at = models.DateTimeField(default=timezone.now)
+
+    objects = IdentityLinkManager()
+
+    def __str__(self):
+        return f"{self.visitor_id} -> {self.root_id}"
+
+
+class ContactQuerySet(models.QuerySet):
+    def erase(self, chunk_size=500, include_visitors=False, progress=None):
+        """
+        Erase these contacts with set-based statements, one short transaction per chunk
+
+        Every chunk deletes its contacts, dissolves their identity sets (every
+        stitched visitor is marked unidentified and its links are deleted, so
+        repair_identities cannot rebuild the contact) and deletes enrichment
+        rows no remaining contact uses. With include_visitors the visitors of
+        each identity set are deleted as well, along with their events and
+        sessions; events and sessions go first in their own chunks so no
+        transaction holds many row locks.
+        `progress` is called with the running number of erased contacts after
+        each chunk. An interrupted erase can simply be re-run. Returns
+        (total, {model label: count}) like QuerySet.delete().
+        """
+        from .ip_index import invalidate_enrichment
+
+        counts = Counter()
+        changed_sites = set()
+        erased = 0
+        contacts = self.order_by('pk')
+        last_pk = None
+        while True:
+            page = contacts.filter(pk__gt=last_pk) if last_pk else contacts
+            rows = list(page.values_list('pk', 'visitor_id')[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            contact_ids = [pk for pk, _ in rows]
+            visitor_ids = {visitor_id for _, visitor_id in rows if visitor_id}
+
+            if visitor_ids:
+                # The whole identity set: root plus every stitched member
+                root_ids = set(IdentityLink.objects.filter(visitor_id__in=visitor_ids).values_list('root_id', flat=True))
+                visitor_ids.update(root_ids)
+                visitor_ids.update(IdentityLink.objects.filter(root_id__in=root_ids).values_list('visitor_id', flat=True))
+
+            if include_visitors and visitor_ids:
+                for model in (Event, Session):
+                    counts.update(_delete_in_chunks(model.objects.filter(visitor_id__in=visitor_ids), chunk_size))
+
+            with transaction.atomic():
+                doomed = Contact.objects.filter(pk__in=contact_ids)
+                if include_visitors:
+                    doomed = Contact.objects.filter(Q(pk__in=contact_ids) | Q(visitor_id__in=visitor_ids))
+                enrichment_ids = set(
+                    doomed.exclude(enrichment_data=None).values_list('enrichment_data_id', flat=True)
+                )
+                counts.update(doomed.delete()[1])
+
+                if visitor_ids:
+                    counts.update(
+                        IdentityLink.objects.filter(Q(visitor_id__in=visitor_ids) | Q(root_id__in=visitor_ids)).delete()[1]
+                    )
+                if include_visitors:
+                    counts.update(Visitor.objects.filter(pk__in=visitor_ids).delete()[1])
+                elif visitor_ids:
+                    Visitor.objects.filter(pk__in=visitor_ids).update(is_identified=False, matched_via=None)
+
+                orphans = EnrichmentData.objects.filter(pk__in=enrichment_ids, contacts__isnull=True)
+                changed_sites.update(orphans.values_list('site_id', flat=True))
+                counts.update(orphans.delete()[1])
+
+            erased += len(rows)
+            if progress:
+                progress(erased)
+
+        for site_id in changed_sites:
+            invalidate_enrichment(site_id)
+        return sum(counts.values()), dict(counts)
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    """Delete a queryset chunk_size rows per statement and return the per-model counts"""
+    counts = Counter()
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return counts
+        counts.update(queryset.model.objects.filter(pk__in=pks).delete()[1])
+
 
 class Contact(models.Model):
     """Represents an identified contact (email + visitor data)"""
@@ -95,17 +395,38 @@ class Contact(models.Model):
     # Additional data (flexible JSON field for extra attributes)
     extra_data = models.JSONField(default=dict, blank=True)
 
+    objects = ContactQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         unique_together = [['site', 'email']]
         indexes = [
             models.Index(fields=['site', 'email']),
+            # Case-insensitive prefix search of the contact list
+            models.Index(Lower('email'), name='tracking_contact_email_lower'),
+            # Keyset pagination of the contact list
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['site', 'created_at', 'id']),
         ]
 
     def __str__(self):
         return f"{self.email} ({self.site.name})"
 
-    def delete(self, *args, **kwargs):
+    def get_events(self):
+        """Events of every visitor stitched to this contact's identity"""
+        if not self.visitor_id:
+            return Event.objects.none()
+        return Event.objects.filter(visitor_id__in=IdentityLink.objects.members(self.visitor_id))
+
+    def get_event_count(self):
+        """Event total of this contact's identity, summed from the maintained visitor counters"""
+        if not self.visitor_id:
+            return 0
+        return Visitor.objects.filter(
+            id__in=IdentityLink.objects.members(self.visitor_id)
+        ).aggregate(total=Sum('event_count'))['total'] or 0
+
+    def delete(self, using=None, keep_parents=False):
         """
         Override delete to also delete associated EnrichmentData and reset Visitor.
         This prevents auto-recreation of the contact when they visit again.
@@ -113,27 +434,10 @@ class Contact(models.Model):
         If the EnrichmentData is linked to other Contacts, only this Contact is deleted.
         If this is the last Contact using the EnrichmentData, the EnrichmentData is also deleted.
         """
-        enrichment = self.enrichment_data
-        visitor = self.visitor
-
-        # Delete the contact first
-        result = super().delete(*args, **kwargs)
-
-        # Reset visitor identification status since their contact was deleted
-        if visitor:
-            visitor.is_identified = False
-            visitor.matched_via = None
-            visitor.save()
-
-        # If there was enrichment data, check if it should also be deleted
-        if enrichment:
-            # Check if any other contacts are still using this enrichment data
-            remaining_contacts = Contact.objects.filter(enrichment_data=enrichment).exists()
-
-            if not remaining_contacts:
-                # This was the last contact using this enrichment data, delete it
-                enrichment.delete()
-
+        result = Contact.objects.using(using).filter(pk=self.pk).erase()
+        if self.visitor_id and 'visitor' in self._state.fields_cache:
+            self.visitor.is_identified = False
+            self.visitor.matched_via = None
         return result
 
 
@@ -158,6 +462,7 @@ class EnrichmentData(models.Model):
 
     # Technical identifiers for matching
     ip_addresses = models.JSONField(default=list, blank=True)  # List of known IPs
+    ip_ranges = models.JSONField(default=list, blank=True)  # List of known CIDR blocks, e.g. "10.0.0.0/24"
     phone_numbers = models.JSONField(default=list, blank=True)  # List of known phone numbers
     user_agents = models.JSONField(default=list, blank=True)  # List of known user agents
 
@@ -190,6 +495,83 @@ class EnrichmentData(models.Model):
         return f"{name} ({self.site.name})"
 
 
+class InternedStringManager(models.Manager):
+    """
+    Resolves strings to dictionary row ids through a per-process LRU cache,
+    so ingest only touches the dictionary table the first time a value is seen
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __copy__(self):
+        # Django hands every model a shallow copy of the managers it inherits
+        # from the abstract InternedString; each copy needs its own cache so
+        # URL and title ids never mix
+        manager = self.__class__.__new__(self.__class__)
+        manager.__dict__.update(self.__dict__)
+        manager._ids = OrderedDict()
+        manager._lock = threading.Lock()
+        return manager
+
+    def intern(self, value):
+        """Return the id of the row holding `value`, creating it if needed (None for empty values)"""
+        if not value:
+            return None
+
+        with self._lock:
+            interned_id = self._ids.get(value)
+            if interned_id is not None:
+                self._ids.move_to_end(value)
+                return interned_id
+
+        value_hash = hashlib.sha1(value.encode('utf-8')).hexdigest()
+        interned_id = self.filter(value_hash=value_hash).values_list('id', flat=True).first()
+        if interned_id is None:
+            try:
+                with transaction.atomic():
+                    interned_id = self.create(value_hash=value_hash, value=value).id
+            except IntegrityError:
+                interned_id = self.filter(value_hash=value_hash).values_list('id', flat=True).get()
+
+        with self._lock:
+            self._ids[value] = interned_id
+            while len(self._ids) > getattr(settings, 'TRACKING_INTERN_CACHE_SIZE', 10000):
+                self._ids.popitem(last=False)
+        return interned_id
+
+
+class InternedString(models.Model):
+    """Dictionary row for a string repeated across many events"""
+    id = models.BigAutoField(primary_key=True)
+    value_hash = models.CharField(max_length=40, unique=True)  # sha1 of value; long URLs cannot be indexed directly
+    value = models.TextField()
+
+    objects = InternedStringManager()
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.value
+
+
+class InternedURL(InternedString):
+    """Page URLs and referrers shared by events"""
+
+    class Meta:
+        verbose_name = 'interned URL'
+
+
+class InternedTitle(InternedString):
+    """Page titles shared by events"""
+
+    class Meta:
+        verbose_name = 'interned title'
+
+
 class Event(models.Model):
     """Represents a tracking event (page view, cart view, etc.)"""
 
@@ -209,28 +591,33 @@ class Event(models.Model):
         ('checkout_abandonment', 'Checkout Abandonment'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)  # Time-ordered for insert locality
     site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='events')
     visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='events')
 
-    # Event details
-    event_type = models.CharField(max_length=50, choices=EVENT_TYPES, db_index=True)
+    # Event details (event_type is stored as a small integer code)
+    event_type = EventTypeField(choices=EVENT_TYPES, db_index=True)
     event_name = models.CharField(max_length=255, blank=True, null=True)
 
-    # Page/URL info
-    page_url = models.TextField()
-    page_title = models.CharField(max_length=500, blank=True, null=True)
+    # Page/URL info, interned in dictionary tables
+    page_url = models.ForeignKey(InternedURL, on_delete=models.PROTECT, related_name='+')
+    page_title = models.ForeignKey(InternedTitle, on_delete=models.PROTECT, related_name='+', blank=True, null=True)
 
     # Event data (flexible JSON for cart items, form data, etc.)
     event_data = models.JSONField(default=dict, blank=True)
 
+    # Hot event_data keys copied into typed columns at ingest (see tracking.event_fields)
+    product_id = models.CharField(max_length=255, blank=True, null=True)
+    cart_total = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    element_path = models.CharField(max_length=500, blank=True, null=True)
+
     # UTM parameters (last-touch attribution per event)
     utm_source = models.CharField(max_length=255, blank=True, null=True)
     utm_medium = models.CharField(max_length=255, blank=True, null=True)
     utm_campaign = models.CharField(max_length=255, blank=True, null=True)
     utm_term = models.CharField(max_length=255, blank=True, null=True)
     utm_content = models.CharField(max_length=255, blank=True, null=True)
-    referrer = models.TextField(blank=True, null=True)
+    referrer = models.ForeignKey(InternedURL, on_delete=models.PROTECT, related_name='+', blank=True, null=True)
 
     # Metadata
     timestamp = models.DateTimeField(default=timezone.now, db_index=True)
@@ -242,12 +629,241 @@ class Event(models.Model):
             models.Index(fields=['site', 'event_type', '-timestamp']),
             models.Index(fields=['visitor', '-timestamp']),
             models.Index(fields=['session_id', '-timestamp']),
+            models.Index(fields=['site', 'product_id']),
+            models.Index(fields=['site', 'event_type', 'cart_total']),
+            models.Index(fields=['site', 'element_path']),
         ]
 
     def __str__(self):
         return f"{self.event_type} on {self.site.name} at {self.timestamp}"
 
 
+class SessionManager(models.Manager):
+    def record_event(self, site, visitor, session_id, event_type, page_url, timestamp, referrer=None, utm=None):
+        """
+        Fold one event into its session row
+
+        Existing sessions are advanced with a single UPDATE; the first event of
+        a session inserts the row. A concurrent insert for the same session is
+        resolved by re-running the UPDATE.
+        """
+        if not session_id:
+            return
+
+        page_views = 1 if event_type == 'page_view' else 0
+        changes = {
+            'ended_at': timestamp,
+            'exit_url': page_url,
+            'event_count': F('event_count') + 1,
+            'page_view_count': F('page_view_count') + page_views,
+        }
+        if self.filter(site=site, session_id=session_id).update(**changes):
+            return
+
+        utm = utm or {}
+        try:
+            with transaction.atomic():
+                self.create(
+                    site=site,
+                    visitor=visitor,
+                    session_id=session_id,
+                    started_at=timestamp,
+                    ended_at=timestamp,
+                    event_count=1,
+                    page_view_count=page_views,
+                    entry_url=page_url,
+                    exit_url=page_url,
+                    referrer=referrer,
+                    utm_source=utm.get('utm_source'),
+                    utm_medium=utm.get('utm_medium'),
+                    utm_campaign=utm.get('utm_campaign'),
+                    utm_term=utm.get('utm_term'),
+                    utm_content=utm.get('utm_content'),
+                )
+        except IntegrityError:
+            self.filter(site=site, session_id=session_id).update(**changes)
+
+
+class Session(models.Model):
+    """
+    Materialized browsing session, maintained incrementally from events
+    so session analytics do not need to GROUP BY the Event table
+    """
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)  # Time-ordered for insert locality
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='sessions')
+    visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='sessions')
+    session_id = models.CharField(max_length=255)
+
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    event_count = models.PositiveIntegerField(default=0)
+    page_view_count = models.PositiveIntegerField(default=0)
+
+    # Entry/exit pages and traffic source of the first event
+    entry_url = models.TextField()
+    exit_url = models.TextField()
+    referrer = models.TextField(blank=True, null=True)
+    utm_source = models.CharField(max_length=255, blank=True, null=True)
+    utm_medium = models.CharField(max_length=255, blank=True, null=True)
+    utm_campaign = models.CharField(max_length=255, blank=True, null=True)
+    utm_term = models.CharField(max_length=255, blank=True, null=True)
+    utm_content = models.CharField(max_length=255, blank=True, null=True)
+
+    objects = SessionManager()
+
+    class Meta:
+        ordering = ['-started_at']
+        unique_together = [['site', 'session_id']]
+        indexes = [
+            models.Index(fields=['site', '-started_at']),
+            models.Index(fields=['visitor', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id[:12]}... on {self.site.name}"
+
+    @property
+    def duration(self):
+        return self.ended_at - self.started_at
+
+
+class UniqueVisitorSketchManager(models.Manager):
+    def merge_sketch(self, site_id, day, dimension, key, sketch):
+        """Fold a HyperLogLog into the stored sketch of a bucket, creating it if needed"""
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    row = self.select_for_update().filter(site_id=site_id, day=day, dimension=dimension, key=key).first()
+                    if row is None:
+                        self.create(site_id=site_id, day=day, dimension=dimension, key=key, registers=sketch.to_bytes())
+                    else:
+                        row.registers = HyperLogLog.from_bytes(bytes(row.registers)).merge(sketch).to_bytes()
+                        row.save(update_fields=['registers'])
+                return
+            except IntegrityError:
+                # Another process created the bucket first; merge into its row
+                if attempt:
+                    raise
+
+    def _merged(self, site_id, start, end, dimension, **filters):
+        """Per-key union of a dimension's daily sketches over a date range (inclusive)"""
+        merged = {}
+        rows = self.filter(site_id=site_id, day__range=(start, end), dimension=dimension, **filters)
+        for key, registers in rows.values_list('key', 'registers').iterator():
+            sketch = HyperLogLog.from_bytes(bytes(registers))
+            merged[key] = merged[key].merge(sketch) if key in merged else sketch
+        return merged
+
+    def estimate(self, site_id, start, end, dimension='site', key=''):
+        """Approximate distinct visitors of one bucket key over a date range (inclusive)"""
+        sketch = self._merged(site_id, start, end, dimension, key=key).get(key)
+        return sketch.count() if sketch else 0
+
+    def top(self, site_id, start, end, dimension, limit=10):
+        """(key, approximate distinct visitors) of a dimension's keys over a date range, largest first"""
+        counts = [(key, sketch.count()) for key, sketch in self._merged(site_id, start, end, dimension).items()]
+        return sorted(counts, key=lambda item: item[1], reverse=True)[:limit]
+
+
+class UniqueVisitorSketch(models.Model):
+    """
+    HyperLogLog of the visitors seen in one (site, day, dimension, key) bucket
+
+    Dimensions: 'site' (key is empty), 'page' (key is the sha1 of the page URL,
+    i.e. its InternedURL.value_hash) and 'campaign' (key is utm_campaign).
+    Written by tracking.uniques; sketches merge across days, so range queries
+    never COUNT DISTINCT the Event table.
+    """
+    DIMENSIONS = [
+        ('site', 'Site'),
+        ('page', 'Page'),
+        ('campaign', 'UTM campaign'),
+    ]
+
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='unique_visitor_sketches')
+    day = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    key = models.CharField(max_length=255, blank=True, default='')
+    registers = models.BinaryField()
+
+    objects = UniqueVisitorSketchManager()
+
+    class Meta:
+        unique_together = [['site', 'dimension', 'day', 'key']]
+
+    def __str__(self):
+        return f"{self.dimension} {self.key[:40]} on {self.day} ({self.site.name})"
+
+
+class HeavyHitterSketchManager(models.Manager):
+    def merge_counts(self, site_id, day, dimension, counts):
+        """Add {value: count} to the stored top-K of a (site, day, dimension), creating it if needed"""
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    row = self.select_for_update().filter(site_id=site_id, day=day, dimension=dimension).first()
+                    top_k = row.to_top_k() if row else TopK()
+                    for value, count in counts.items():
+                        top_k.add(value, count)
+                    if row is None:
+                        row = self.model(site_id=site_id, day=day, dimension=dimension)
+                    row.sketch = top_k.sketch.to_bytes()
+                    row.top = top_k.top()
+                    row.save()
+                return
+            except IntegrityError:
+                # Another process created the row first; merge into it
+                if attempt:
+                    raise
+
+    def top(self, site_id, start, end, dimension, limit=10):
+        """[(value, estimated count)] of a dimension over a date range (inclusive), largest first"""
+        rows = self.filter(site_id=site_id, day__range=(start, end), dimension=dimension)
+        if start == end:
+            # A single day is served from the stored list without loading the sketch
+            top = rows.values_list('top', flat=True).first() or []
+            return [tuple(item) for item in top[:limit]]
+
+        merged = None
+        for row in rows.only('sketch', 'top').iterator():
+            top_k = row.to_top_k()
+            merged = merged.merge(top_k) if merged else top_k
+        return merged.top(limit) if merged else []
+
+
+class HeavyHitterSketch(models.Model):
+    """
+    Count-min sketch and top-K list of one (site, day, dimension)
+
+    Dimensions: 'page' (page URLs), 'referrer' (referrer URLs) and 'element'
+    (clicked element paths). Written by tracking.heavy_hitters; `top` holds the
+    K heaviest values with their estimated counts, so a day's top list is a
+    single small read.
+    """
+    DIMENSIONS = [
+        ('page', 'Page'),
+        ('referrer', 'Referrer'),
+        ('element', 'Clicked element'),
+    ]
+
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='heavy_hitter_sketches')
+    day = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    sketch = models.BinaryField()
+    top = models.JSONField(default=list)  # [[value, count], ...] largest first
+
+    objects = HeavyHitterSketchManager()
+
+    class Meta:
+        unique_together = [['site', 'dimension', 'day']]
+
+    def __str__(self):
+        return f"Top {self.dimension}s on {self.day} ({self.site.name})"
+
+    def to_top_k(self):
+        return TopK(sketch=CountMinSketch.from_bytes(bytes(self.sketch)), items=dict(self.top))
+
+
 class ConversionGoal(models.Model):
     """Defines conversion goals for tracking"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
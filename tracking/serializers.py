@@ -30,11 +30,15 @@ class ContactSerializer(serializers.ModelSerializer):
 
 
 class EventSerializer(serializers.ModelSerializer):
+    page_url = serializers.CharField(source='page_url.value', read_only=True)
+    page_title = serializers.CharField(source='page_title.value', read_only=True, allow_null=True)
+
     class Meta:
         model = Event
         fields = [
             'id', 'site', 'visitor', 'event_type', 'event_name',
-            'page_url', 'page_title', 'event_data', 'timestamp', 'session_id'
+            'page_url', 'page_title', 'event_data', 'timestamp', 'session_id',
+            'product_id', 'cart_total', 'element_path'
         ]
         read_only_fields = ['id', 'timestamp']
 
@@ -60,6 +64,13 @@ class TrackEventSerializer(serializers.Serializer):
     utm_params = serializers.JSONField(required=False, default=dict)
     stored_utm_params = serializers.JSONField(required=False, default=dict)
 
+    def validate(self, attrs):
+        """Record event types outside Event.EVENT_TYPES as named custom events"""
+        if attrs['event_type'] not in dict(Event.EVENT_TYPES):
+            attrs['event_name'] = attrs.get('event_name') or attrs['event_type']
+            attrs['event_type'] = 'custom'
+        return attrs
+
     def validate_site_key(self, value):
         """Validate that the site key exists"""
         try:
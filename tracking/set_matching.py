@@ -0,0 +1,363 @@
+"""
+Set-based identity matching for identify_visitors --set-based
+
+Enrichment identifiers are normalized once into temporary staging tables
+(one row per known user agent, IP, CIDR block and fingerprint), then each
+priority tier is a single INSERT ... SELECT joining the site's unidentified
+visitors against them into a candidate table:
+
+1. Browser fingerprint: one join per LSH band (see tracking.fingerprints),
+   scored with the configured field weights in SQL
+2. User agent: exact join, for visitors without a fingerprint candidate
+3. IP address: exact join, then CIDR containment (in SQL on PostgreSQL,
+   through the in-memory range index for distinct leftover IPs elsewhere)
+
+The best candidate per visitor is then applied in bulk, a chunk of visitors
+per transaction.
+"""
+import ipaddress
+from django.db import connection, IntegrityError
+from .models import Visitor, Contact, EnrichmentData, IdentityLink
+from .fingerprints import FINGERPRINT_FIELDS, get_bands, get_threshold, get_weights, normalize_fingerprint, add_fingerprint
+from .ip_index import lookup_ip
+from .snapshot import get_snapshot
+from .concurrency import lock_identity_rows, WriteConflict
+
+
+TIER_FINGERPRINT = 1
+TIER_USER_AGENT = 2
+TIER_IP = 3
+
+MATCHED_VIA = {
+    TIER_FINGERPRINT: 'browser_fingerprint',
+    TIER_USER_AGENT: 'user_agent',
+    TIER_IP: 'ip_address',
+}
+
+KEYS_TABLE = 'tmp_identify_keys'
+FINGERPRINTS_TABLE = 'tmp_identify_fingerprints'
+CANDIDATES_TABLE = 'tmp_identify_candidates'
+
+
+class SetBasedMatcher:
+    """Stages a site's enrichment identifiers and joins its unidentified visitors against them"""
+
+    def __init__(self, site):
+        self.site = site
+        self.qn = connection.ops.quote_name
+        self.visitor_pk = Visitor._meta.pk
+        self.enrichment_pk = EnrichmentData._meta.pk
+
+    def __enter__(self):
+        self.create_tables()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.drop_tables()
+
+    def create_tables(self):
+        self.drop_tables()
+        visitor_type = self.visitor_pk.db_type(connection)
+        enrichment_type = self.enrichment_pk.db_type(connection)
+        fp_columns = ', '.join(f'{self.qn(field)} varchar(255)' for field in FINGERPRINT_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {KEYS_TABLE} '
+                f'(enrichment_id {enrichment_type} NOT NULL, kind varchar(8) NOT NULL, value text NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX {KEYS_TABLE}_value ON {KEYS_TABLE} (kind, value)')
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {FINGERPRINTS_TABLE} (enrichment_id {enrichment_type} NOT NULL, {fp_columns})'
+            )
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {CANDIDATES_TABLE} '
+                f'(visitor_id {visitor_type} NOT NULL, enrichment_id {enrichment_type} NOT NULL, '
+                f'tier integer NOT NULL, score real NOT NULL, detail text)'
+            )
+            cursor.execute(f'CREATE INDEX {CANDIDATES_TABLE}_visitor ON {CANDIDATES_TABLE} (visitor_id)')
+
+    def drop_tables(self):
+        with connection.cursor() as cursor:
+            for table in (KEYS_TABLE, FINGERPRINTS_TABLE, CANDIDATES_TABLE):
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def stage_enrichment(self, batch_size=2000):
+        """Normalize the site's enrichment identifiers into the staging tables"""
+        keys = []
+        fingerprints = []
+        for enrichment_id, (ip_addresses, ip_ranges, user_agents, browser_fingerprints) in get_snapshot(self.site.id).rows.items():
+            db_id = self.enrichment_pk.get_db_prep_value(enrichment_id, connection)
+            for ip in ip_addresses or []:
+                try:
+                    keys.append((db_id, 'ip', str(ipaddress.ip_address(ip))))
+                except ValueError:
+                    continue
+            for value in ip_ranges or []:
+                try:
+                    keys.append((db_id, 'net', str(ipaddress.ip_network(value, strict=False))))
+                except ValueError:
+                    continue
+            keys.extend((db_id, 'ua', user_agent) for user_agent in set(user_agents or []) if user_agent)
+            for fingerprint in browser_fingerprints or []:
+                if isinstance(fingerprint, dict):
+                    normalized = normalize_fingerprint(fingerprint)
+                    fingerprints.append((db_id, *(normalized[field] for field in FINGERPRINT_FIELDS)))
+
+        fp_columns = ', '.join(self.qn(field) for field in FINGERPRINT_FIELDS)
+        fp_params = ', '.join(['%s'] * len(FINGERPRINT_FIELDS))
+        with connection.cursor() as cursor:
+            for start in range(0, len(keys), batch_size):
+                cursor.executemany(
+                    f'INSERT INTO {KEYS_TABLE} (enrichment_id, kind, value) VALUES (%s, %s, %s)',
+                    keys[start:start + batch_size],
+                )
+            for start in range(0, len(fingerprints), batch_size):
+                cursor.executemany(
+                    f'INSERT INTO {FINGERPRINTS_TABLE} (enrichment_id, {fp_columns}) VALUES (%s, {fp_params})',
+                    fingerprints[start:start + batch_size],
+                )
+        return len(keys), len(fingerprints)
+
+    def _visitor_filter(self, unmatched=False):
+        """WHERE clause (and params) selecting the site's unidentified visitors"""
+        where = f'v.{self.qn("site_id")} = %s AND v.{self.qn("is_identified")} = %s'
+        if unmatched:
+            where += f' AND NOT EXISTS (SELECT 1 FROM {CANDIDATES_TABLE} c WHERE c.visitor_id = v.{self.qn("id")})'
+        site_id = Visitor._meta.get_field('site').target_field.get_db_prep_value(self.site.id, connection)
+        return where, [site_id, False]
+
+    def _normalized(self, field):
+        return f"LOWER(TRIM(COALESCE(v.{self.qn(field)}, '')))"
+
+    def match_fingerprints(self):
+        """Tier 1: one join per LSH band, scored in SQL and cut at the match threshold"""
+        table = self.qn(Visitor._meta.db_table)
+        score_sql = ' + '.join(
+            f"CASE WHEN f.{self.qn(field)} <> '' AND {self._normalized(field)} = f.{self.qn(field)} THEN %s ELSE 0 END"
+            for field, _ in get_weights()
+        )
+        score_params = [weight for _, weight in get_weights()]
+        where, params = self._visitor_filter()
+        where += f" AND COALESCE(v.{self.qn('browser_name')}, '') <> '' AND COALESCE(v.{self.qn('os_name')}, '') <> ''"
+
+        with connection.cursor() as cursor:
+            for band in get_bands():
+                join = ' AND '.join(
+                    f"f.{self.qn(field)} <> '' AND {self._normalized(field)} = f.{self.qn(field)}" for field in band
+                )
+                cursor.execute(
+                    f'INSERT INTO {CANDIDATES_TABLE} (visitor_id, enrichment_id, tier, score, detail) '
+                    f'SELECT v.{self.qn("id")}, f.enrichment_id, {TIER_FINGERPRINT}, {score_sql}, NULL '
+                    f'FROM {table} v JOIN {FINGERPRINTS_TABLE} f ON {join} WHERE {where}',
+                    score_params + params,
+                )
+            cursor.execute(
+                f'DELETE FROM {CANDIDATES_TABLE} WHERE tier = %s AND score < %s',
+                [TIER_FINGERPRINT, get_threshold() - 1e-6],
+            )
+
+    def match_user_agents(self):
+        """Tier 2: exact user agent join for visitors without a fingerprint candidate"""
+        table = self.qn(Visitor._meta.db_table)
+        where, params = self._visitor_filter(unmatched=True)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {CANDIDATES_TABLE} (visitor_id, enrichment_id, tier, score, detail) '
+                f'SELECT v.{self.qn("id")}, k.enrichment_id, {TIER_USER_AGENT}, 1, NULL '
+                f"FROM {table} v JOIN {KEYS_TABLE} k ON k.kind = 'ua' AND k.value = v.{self.qn('user_agent')} "
+                f'WHERE {where}',
+                params,
+            )
+
+    def match_ips(self):
+        """Tier 3: exact IP join, then the most specific containing CIDR block"""
+        table = self.qn(Visitor._meta.db_table)
+        ip_column = f'v.{self.qn("ip_address")}'
+        postgres = connection.vendor == 'postgresql'
+        ip_text = f'HOST({ip_column})' if postgres else ip_column
+
+        where, params = self._visitor_filter(unmatched=True)
+        with connection.cursor() as cursor:
+            # Exact addresses outrank any network (score above the longest prefix)
+            cursor.execute(
+                f'INSERT INTO {CANDIDATES_TABLE} (visitor_id, enrichment_id, tier, score, detail) '
+                f'SELECT v.{self.qn("id")}, k.enrichment_id, {TIER_IP}, 129, k.value '
+                f"FROM {table} v JOIN {KEYS_TABLE} k ON k.kind = 'ip' AND k.value = {ip_text} "
+                f'WHERE {where}',
+                params,
+            )
+
+            if postgres:
+                cursor.execute(
+                    f'INSERT INTO {CANDIDATES_TABLE} (visitor_id, enrichment_id, tier, score, detail) '
+                    f'SELECT v.{self.qn("id")}, k.enrichment_id, {TIER_IP}, MASKLEN(CAST(k.value AS inet)), k.value '
+                    f"FROM {table} v JOIN {KEYS_TABLE} k ON k.kind = 'net' AND {ip_column} <<= CAST(k.value AS inet) "
+                    f'WHERE {where}',
+                    params,
+                )
+                return
+
+            # No portable containment operator: resolve each distinct leftover IP once
+            cursor.execute(
+                f'SELECT DISTINCT {ip_column} FROM {table} v WHERE {where} AND {ip_column} IS NOT NULL',
+                params,
+            )
+            matches = []
+            for (ip,) in cursor.fetchall():
+                match = lookup_ip(self.site.id, ip)
+                if match:
+                    enrichment_id, network = match
+                    db_id = self.enrichment_pk.get_db_prep_value(enrichment_id, connection)
+                    matches.append([db_id, ipaddress.ip_network(network, strict=False).prefixlen, network, ip] + params)
+            cursor.executemany(
+                f'INSERT INTO {CANDIDATES_TABLE} (visitor_id, enrichment_id, tier, score, detail) '
+                f'SELECT v.{self.qn("id")}, %s, {TIER_IP}, %s, %s FROM {table} v '
+                f'WHERE {ip_column} = %s AND {where}',
+                matches,
+            )
+
+    def build_candidates(self):
+        """Run every tier in priority order and return the number of candidate rows"""
+        self.match_fingerprints()
+        self.match_user_agents()
+        self.match_ips()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {CANDIDATES_TABLE}')
+            return cursor.fetchone()[0]
+
+    def best_matches(self):
+        """Yield (visitor_id, enrichment_id, matched_via, score, detail), one per matched visitor"""
+        with connection.cursor() as cursor:
+            # Ties go to the newest enrichment row, as in the row-by-row path
+            cursor.execute(
+                f'SELECT c.visitor_id, c.enrichment_id, c.tier, c.score, c.detail FROM {CANDIDATES_TABLE} c '
+                f'JOIN {self.qn(EnrichmentData._meta.db_table)} e ON e.{self.qn("id")} = c.enrichment_id '
+                f'ORDER BY c.visitor_id, c.tier, c.score DESC, e.{self.qn("created_at")} DESC, e.{self.qn("id")} DESC'
+            )
+            last = None
+            for visitor_id, enrichment_id, tier, score, detail in cursor.fetchall():
+                if visitor_id == last:
+                    continue
+                last = visitor_id
+                yield (
+                    self.visitor_pk.to_python(visitor_id),
+                    self.enrichment_pk.to_python(enrichment_id),
+                    MATCHED_VIA[tier],
+                    score,
+                    detail,
+                )
+
+
+def _match_details(visitor, matched_via, score, detail):
+    """match_details as identify_visitors records them for the row-by-row path"""
+    if matched_via == 'browser_fingerprint':
+        return {
+            'browser': visitor.browser_name,
+            'os': visitor.os_name,
+            'device': visitor.device_type,
+            'resolution': visitor.screen_resolution,
+            'timezone': visitor.timezone,
+            'language': visitor.language,
+            'confidence': round(score, 3),
+        }
+    if matched_via == 'user_agent':
+        return {'user_agent': visitor.user_agent}
+    return {'ip': visitor.ip_address, 'network': detail}
+
+
+def apply_matches(site, matches):
+    """
+    Identify a chunk of visitors from (visitor_id, enrichment_id, matched_via, score, detail)
+
+    Must run inside a transaction. Rows are locked in the global order, new
+    contacts are bulk-inserted, visitors matching an email that already has a
+    contact are stitched to it, and visitors, contacts and enrichment rows
+    are written back with one bulk UPDATE each. Returns (identified, contacts
+    created, enrichment rows that gained identifiers).
+    """
+    enrichment_ids = {enrichment_id for _, enrichment_id, _, _, _ in matches}
+    emails = EnrichmentData.objects.filter(pk__in=enrichment_ids).values_list('email', flat=True)
+    contact_ids = Contact.objects.filter(site=site, email__in=emails).values_list('id', flat=True)
+    visitors, contacts, enrichments = lock_identity_rows(
+        [visitor_id for visitor_id, _, _, _, _ in matches], contact_ids, enrichment_ids
+    )
+    contacts_by_email = {contact.email: contact for contact in contacts.values()}
+
+    # Group still-unidentified visitors by the enrichment row they matched
+    groups = {}
+    for visitor_id, enrichment_id, matched_via, score, detail in matches:
+        visitor = visitors.get(visitor_id)
+        if visitor and not visitor.is_identified and enrichment_id in enrichments:
+            groups.setdefault(enrichment_id, []).append((visitor, matched_via, score, detail))
+
+    new_contacts = []
+    moved_contacts = []
+    changed_enrichments = []
+    identified = []
+    for enrichment_id, group in groups.items():
+        enrichment = enrichments[enrichment_id]
+        # The most recently seen visitor holds the contact, the rest are stitched to it
+        group.sort(key=lambda item: item[0].last_seen)
+        holder, matched_via, score, detail = group[-1]
+
+        contact = contacts_by_email.get(enrichment.email)
+        if contact is None:
+            new_contacts.append(Contact(
+                site=site,
+                email=enrichment.email,
+                visitor=holder,
+                enrichment_data=enrichment,
+                name=f"{enrichment.first_name} {enrichment.last_name}".strip(),
+                phone=enrichment.phone,
+                linkedin_url=enrichment.linkedin_url,
+                facebook_url=enrichment.facebook_url,
+                extra_data={
+                    'company': enrichment.company,
+                    'job_title': enrichment.job_title,
+                    'location': enrichment.location,
+                    'matched_via': matched_via,
+                    'match_details': _match_details(holder, matched_via, score, detail),
+                },
+            ))
+        elif contact.visitor_id != holder.pk:
+            if contact.visitor_id:
+                IdentityLink.objects.link(contact.visitor, holder, via=matched_via)
+            contact.visitor = holder
+            moved_contacts.append(contact)
+
+        updated = False
+        for visitor, visitor_matched_via, _, _ in group:
+            if visitor is not holder:
+                IdentityLink.objects.link(holder, visitor, via=visitor_matched_via)
+            visitor.is_identified = True
+            visitor.matched_via = visitor_matched_via
+            identified.append(visitor)
+
+            # Store this visitor's identifiers for future matching
+            if visitor.browser_name and visitor.os_name:
+                updated |= add_fingerprint(enrichment, {
+                    'browser_name': visitor.browser_name,
+                    'os_name': visitor.os_name,
+                    'device_type': visitor.device_type,
+                    'screen_resolution': visitor.screen_resolution,
+                    'timezone': visitor.timezone,
+                    'language': visitor.language,
+                })
+                if visitor.user_agent and visitor.user_agent not in enrichment.user_agents:
+                    enrichment.user_agents.append(visitor.user_agent)
+                    updated = True
+                if visitor.ip_address and visitor.ip_address not in enrichment.ip_addresses:
+                    enrichment.ip_addresses.append(visitor.ip_address)
+                    updated = True
+        if updated:
+            changed_enrichments.append(enrichment)
+
+    try:
+        Contact.objects.bulk_create(new_contacts)
+    except IntegrityError as exc:
+        # A concurrent writer created a contact for one of these emails first
+        raise WriteConflict('Contact created concurrently') from exc
+    Contact.objects.bulk_update(moved_contacts, ['visitor'])
+    Visitor.objects.bulk_update(identified, ['is_identified', 'matched_via'])
+    EnrichmentData.objects.bulk_update(changed_enrichments, ['browser_fingerprints', 'user_agents', 'ip_addresses'])
+    return len(identified), len(new_contacts), changed_enrichments
@@ -0,0 +1,204 @@
+"""
+Probabilistic sketches for approximate analytics over the event stream
+
+HyperLogLog estimates the number of distinct values added to it in a fixed
+number of bytes, and sketches of the same precision merge by taking the
+register-wise maximum, so per-day sketches can be combined over any range.
+CountMinSketch estimates how often each value was added (never under-counting),
+and TopK pairs one with a min-heap to track the heaviest hitters of a stream.
+Both merge by adding counters.
+"""
+import hashlib
+import heapq
+import math
+import operator
+import struct
+import sys
+from array import array
+
+
+def hash64(value):
+    """Stable 64-bit hash of a string, bytes or UUID"""
+    if not isinstance(value, bytes):
+        value = getattr(value, 'bytes', None) or str(value).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch with 2**precision one-byte registers
+
+    The standard error is about 1.04 / sqrt(2**precision): 1.6% for the
+    default precision of 12 (4 KB per sketch).
+    """
+
+    DEFAULT_PRECISION = 12
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError('HyperLogLog precision must be between 4 and 18')
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError('Register count does not match the precision')
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a sketch from to_bytes(); the precision follows from the length"""
+        precision = len(data).bit_length() - 1
+        return cls(precision, data)
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    def add_hash(self, hashed):
+        """Add a value already hashed with hash64()"""
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added"""
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Small cardinalities: linear counting is more accurate
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """
+    Frequency sketch: `depth` rows of `width` counters
+
+    Estimates never undercount and overcount by at most e / width of the total
+    added, with probability 1 - exp(-depth).
+    """
+
+    DEFAULT_WIDTH = 2048
+    DEFAULT_DEPTH = 4
+    HEADER = struct.Struct('<II')
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, counts=None):
+        if not 1 <= depth <= 8:
+            raise ValueError('CountMinSketch depth must be between 1 and 8')
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array('I', [0]) * (width * depth)
+        self.total = 0
+
+    @classmethod
+    def from_bytes(cls, data):
+        width, depth = cls.HEADER.unpack_from(data)
+        counts = array('I')
+        counts.frombytes(data[cls.HEADER.size:])
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        sketch = cls(width, depth, counts)
+        sketch.total = sum(counts[:width])
+        return sketch
+
+    def to_bytes(self):
+        """Header plus little-endian 32-bit counters"""
+        counts = self.counts
+        if sys.byteorder == 'big':
+            counts = array('I', counts)
+            counts.byteswap()
+        return self.HEADER.pack(self.width, self.depth) + counts.tobytes()
+
+    def _cells(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=4 * self.depth).digest()
+        for row in range(self.depth):
+            yield row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], 'big') % self.width
+
+    def add(self, value, count=1):
+        """Count a value `count` times and return its new estimate"""
+        estimate = None
+        for cell in self._cells(value):
+            self.counts[cell] += count
+            estimate = self.counts[cell] if estimate is None else min(estimate, self.counts[cell])
+        self.total += count
+        return estimate
+
+    def estimate(self, value):
+        return min(self.counts[cell] for cell in self._cells(value))
+
+    def merge(self, other):
+        """Add another sketch of the same shape into this one"""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('Cannot merge CountMinSketches of different shape')
+        self.counts = array('I', map(operator.add, self.counts, other.counts))
+        self.total += other.total
+        return self
+
+
+class TopK:
+    """
+    Heaviest `k` values of a stream, counted by a CountMinSketch
+
+    A value enters the tracked set when its estimate beats the smallest
+    tracked count, which the min-heap keeps at the top. Heap entries are
+    invalidated lazily when a tracked count grows.
+    """
+
+    DEFAULT_K = 50
+
+    def __init__(self, k=DEFAULT_K, sketch=None, items=None):
+        self.k = k
+        self.sketch = sketch if sketch is not None else CountMinSketch()
+        self.items = dict(items or {})
+        self._heap = [(count, value) for value, count in self.items.items()]
+        heapq.heapify(self._heap)
+
+    def _smallest(self):
+        while self._heap and self.items.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+    def _track(self, value, count):
+        self.items[value] = count
+        heapq.heappush(self._heap, (count, value))
+        if len(self._heap) > 4 * self.k:
+            # Drop stale entries once they outnumber live ones
+            self._heap = [(count, value) for value, count in self.items.items()]
+            heapq.heapify(self._heap)
+
+    def add(self, value, count=1):
+        estimate = self.sketch.add(value, count)
+        if value in self.items or len(self.items) < self.k:
+            self._track(value, estimate)
+        else:
+            smallest_count, smallest_value = self._smallest()
+            if estimate > smallest_count:
+                del self.items[smallest_value]
+                self._track(value, estimate)
+
+    def merge(self, other):
+        """Combine two streams: sum the sketches and re-rank the union of tracked values"""
+        self.sketch.merge(other.sketch)
+        candidates = set(self.items) | set(other.items)
+        ranked = sorted(((self.sketch.estimate(value), value) for value in candidates), reverse=True)[:self.k]
+        self.items = {value: count for count, value in ranked}
+        self._heap = [(count, value) for value, count in self.items.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, limit=None):
+        """[(value, estimated count)] largest first"""
+        ranked = sorted(self.items.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
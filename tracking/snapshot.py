@@ -0,0 +1,178 @@
+"""
+Versioned per-site enrichment snapshot shared through the Django cache
+
+The identity indexes (tracking.ip_index, tracking.fingerprints,
+tracking.bloom) and user agent matching all derive from the identifier lists
+of a site's enrichment rows. The snapshot holds those lists already decoded,
+keyed by enrichment id, plus a user agent -> enrichment ids hash table.
+
+One process builds a site's snapshot and publishes it to the cache (Redis in
+production); other processes load it with a single GET instead of scanning
+EnrichmentData. Writers record which rows they changed under the version they
+bumped to, so a process holding an older snapshot (its own, or the last
+published one) catches up by re-reading just those rows.
+"""
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from .versioning import get_version
+
+
+VERSION_NAMESPACE = 'enrichment'
+
+# How many versions behind a process may be and still catch up from deltas
+MAX_DELTAS = 50
+
+
+class EnrichmentSnapshot:
+    """Decoded identifiers of a site's enrichment rows"""
+
+    def __init__(self, rows=None):
+        # enrichment id -> (ip_addresses, ip_ranges, user_agents, browser_fingerprints)
+        self.rows = rows if rows is not None else {}
+        self.user_agents = {}
+        for enrichment_id, row in self.rows.items():
+            self._index_row(enrichment_id, row)
+
+    def _index_row(self, enrichment_id, row):
+        # Owners are kept oldest first; the newest owner of a user agent wins
+        # (lists are replaced, never mutated, as copies share them)
+        for user_agent in row[2]:
+            owners = [owner for owner in self.user_agents.get(user_agent, ()) if owner != enrichment_id]
+            self.user_agents[user_agent] = owners + [enrichment_id]
+
+    def set_row(self, enrichment_id, ip_addresses, ip_ranges, user_agents, fingerprints):
+        # Rows stay in (created_at, pk) order: an updated row keeps its place
+        # and a new one, being the newest, goes last
+        self._unindex_row(enrichment_id, self.rows.get(enrichment_id))
+        row = (
+            list(ip_addresses or []),
+            list(ip_ranges or []),
+            [user_agent for user_agent in user_agents or [] if user_agent],
+            [fingerprint for fingerprint in fingerprints or [] if isinstance(fingerprint, dict)],
+        )
+        self.rows[enrichment_id] = row
+        self._index_row(enrichment_id, row)
+
+    def remove(self, enrichment_id):
+        self._unindex_row(enrichment_id, self.rows.pop(enrichment_id, None))
+
+    def _unindex_row(self, enrichment_id, row):
+        if row:
+            for user_agent in row[2]:
+                owners = [owner for owner in self.user_agents.get(user_agent, ()) if owner != enrichment_id]
+                if owners:
+                    self.user_agents[user_agent] = owners
+                else:
+                    self.user_agents.pop(user_agent, None)
+
+    def copy(self):
+        snapshot = EnrichmentSnapshot.__new__(EnrichmentSnapshot)
+        snapshot.rows = dict(self.rows)
+        snapshot.user_agents = dict(self.user_agents)
+        return snapshot
+
+    def match_user_agent(self, user_agent):
+        """Return the id of the enrichment row that knows this exact user agent, or None"""
+        owners = self.user_agents.get(user_agent) if user_agent else None
+        return owners[-1] if owners else None
+
+
+def _rows(queryset):
+    return queryset.order_by('created_at', 'pk').values_list(
+        'id', 'ip_addresses', 'ip_ranges', 'user_agents', 'browser_fingerprints'
+    )
+
+
+def build_snapshot(site_id):
+    """Build a snapshot from all enrichment rows of a site"""
+    from .models import EnrichmentData
+
+    snapshot = EnrichmentSnapshot()
+    for row in _rows(EnrichmentData.objects.filter(site_id=site_id)).iterator(chunk_size=2000):
+        snapshot.set_row(*row)
+    return snapshot
+
+
+def _cache_key(site_id, version):
+    return f'enrichment:snapshot:{site_id}:{version}'
+
+
+def _latest_key(site_id):
+    return f'enrichment:snapshot:latest:{site_id}'
+
+
+def _delta_key(site_id, version):
+    return f'enrichment:delta:{site_id}:{version}'
+
+
+def _timeout():
+    return getattr(settings, 'TRACKING_SNAPSHOT_TIMEOUT', 86400)
+
+
+def record_change(site_id, version, enrichment_ids):
+    """Note the enrichment rows changed by the write that bumped the site to `version`"""
+    cache.set(_delta_key(site_id, version), [str(enrichment_id) for enrichment_id in enrichment_ids], timeout=_timeout())
+
+
+def _catch_up(site_id, snapshot, from_version, to_version):
+    """Apply recorded deltas to an older snapshot, or return None if any is missing"""
+    from .models import EnrichmentData
+
+    keys = [_delta_key(site_id, version) for version in range(from_version + 1, to_version + 1)]
+    deltas = cache.get_many(keys)
+    if len(deltas) != len(keys):
+        return None
+
+    to_python = EnrichmentData._meta.pk.to_python
+    changed = {to_python(enrichment_id) for ids in deltas.values() for enrichment_id in ids}
+    snapshot = snapshot.copy()
+    for row in _rows(EnrichmentData.objects.filter(site_id=site_id, id__in=changed)):
+        snapshot.set_row(*row)
+        changed.discard(row[0])
+    # Whatever was not found has been deleted
+    for enrichment_id in changed:
+        snapshot.remove(enrichment_id)
+    return snapshot
+
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def get_snapshot(site_id):
+    """Return the current snapshot for a site, catching up or reloading when its version moved"""
+    version = get_version(VERSION_NAMESPACE, site_id)
+    cached = _snapshots.get(site_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        cached = _snapshots.get(site_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        snapshot = None
+        if cached and 0 < version - cached[0] <= MAX_DELTAS:
+            snapshot = _catch_up(site_id, cached[1], cached[0], version)
+        if snapshot is None:
+            # Start from the last published snapshot, if it is recent enough
+            published = cache.get(_latest_key(site_id))
+            if published and 0 <= version - published <= MAX_DELTAS:
+                rows = cache.get(_cache_key(site_id, published))
+                if rows is not None:
+                    snapshot = EnrichmentSnapshot(rows)
+                    if published != version:
+                        snapshot = _catch_up(site_id, snapshot, published, version)
+        if snapshot is None:
+            snapshot = build_snapshot(site_id)
+            cache.set(_cache_key(site_id, version), snapshot.rows, timeout=_timeout())
+            cache.set(_latest_key(site_id), version, timeout=_timeout())
+
+        _snapshots[site_id] = (version, snapshot)
+        return snapshot
+
+
+def match_user_agent(site_id, user_agent):
+    """Resolve an exact user agent to an enrichment id for a site, or None"""
+    return get_snapshot(site_id).match_user_agent(user_agent)
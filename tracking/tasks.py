@@ -1,6 +1,16 @@
+import hashlib
+import time
+from contextlib import contextmanager
 from celery import shared_task
-from django.db import transaction
-from .models import Visitor, Contact
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from .models import Visitor, Contact, EnrichmentData, Event, IdentityLink
+from .ip_index import update_enrichment_index
+from .fingerprints import add_fingerprint
+from .concurrency import run_with_retry, lock_identity_rows
+from . import metrics
 
 
 def process_identity_resolution_sync(visitor_id, identity_data):
@@ -9,213 +19,304 @@ def process_identity_resolution_sync(visitor_id, identity_data):
     Associates a visitor with an email and creates/updates a Contact
     Also checks enrichment data for matching email
     """
-    try:
-        visitor = Visitor.objects.get(id=visitor_id)
-    except Visitor.DoesNotExist:
-        return
+    contact_ids = process_identity_resolution_batch_sync([(visitor_id, identity_data)])
+    return contact_ids[0] if contact_ids else None
+
+
+def process_identity_resolution_batch_sync(items):
+    """
+    Resolve many (visitor_id, identity_data) pairs in one transaction
+
+    Visitors, contacts and enrichment rows are read in bulk and locked in a
+    fixed order up front; repeated pairs for the same visitor and email are
+    merged so each is written once. Conflicting concurrent writers are retried
+    in place (see tracking.concurrency). Returns the ids of the resolved contacts.
+    """
+    pending = {}
+    for visitor_id, identity_data in items:
+        email = (identity_data or {}).get('email')
+        if email:
+            key = (str(visitor_id), email)
+            pending[key] = _merge_identity_data(pending.get(key), identity_data)
+    if not pending:
+        return []
+
+    site_keys = set(
+        Visitor.objects.filter(id__in={visitor_id for visitor_id, _ in pending}).values_list('site__site_key', flat=True)
+    )
+    if not site_keys:
+        return []
+
+    changed_enrichments = []
+    contact_ids = run_with_retry(
+        _resolve_pending, pending, changed_enrichments,
+        site_key=site_keys.pop() if len(site_keys) == 1 else None,
+    )
+    _refresh_enrichment_indexes(changed_enrichments)
+    return contact_ids
+
+
+def _resolve_pending(pending, changed_enrichments):
+    """One locked attempt at resolving a merged {(visitor_id, email): identity_data} batch"""
+    # A retried attempt starts from scratch
+    changed_enrichments.clear()
+
+    visitor_ids = {visitor_id for visitor_id, _ in pending}
+    emails = {email for _, email in pending}
+    site_ids = set(Visitor.objects.filter(id__in=visitor_ids).values_list('site_id', flat=True))
+
+    visitors, contacts, enrichments = lock_identity_rows(
+        visitor_ids,
+        Contact.objects.filter(
+            Q(site_id__in=site_ids, email__in=emails) | Q(visitor_id__in=visitor_ids)
+        ).values_list('id', flat=True),
+        EnrichmentData.objects.filter(site_id__in=site_ids, email__in=emails).values_list('id', flat=True),
+    )
+    visitors = {str(pk): visitor for pk, visitor in visitors.items()}
+    enrichments = {(enrichment.site_id, enrichment.email): enrichment for enrichment in enrichments.values()}
+    contacts_by_email = {}
+    contacts_by_visitor = {}
+    for contact in contacts.values():
+        contacts_by_email[(contact.site_id, contact.email)] = contact
+        if contact.visitor_id:
+            contacts_by_visitor[str(contact.visitor_id)] = contact
+
+    contact_ids = []
+    for (visitor_id, email), identity_data in pending.items():
+        visitor = visitors.get(visitor_id)
+        if not visitor:
+            continue
+        contact = _resolve_identity(
+            visitor,
+            identity_data,
+            enrichments.get((visitor.site_id, email)),
+            contacts_by_visitor.get(visitor_id),
+            contacts_by_email.get((visitor.site_id, email)),
+            changed_enrichments,
+        )
+        # Later items in the batch see this item's writes
+        contacts_by_email[(contact.site_id, contact.email)] = contact
+        contacts_by_visitor[visitor_id] = contact
+        if contact.enrichment_data_id:
+            enrichments[(visitor.site_id, email)] = contact.enrichment_data
+        contact_ids.append(str(contact.id))
+    return contact_ids
+
 
+def _refresh_enrichment_indexes(enrichments):
+    """Apply changed enrichment rows to the IP index once per site"""
+    by_site = {}
+    for enrichment in enrichments:
+        by_site.setdefault(enrichment.site_id, {})[enrichment.id] = (
+            enrichment.id, enrichment.ip_addresses, enrichment.ip_ranges
+        )
+    for site_id, rows in by_site.items():
+        update_enrichment_index(site_id, list(rows.values()))
+
+
+def _resolve_identity(visitor, identity_data, enrichment, existing_contact, email_contact, changed_enrichments):
+    """
+    Associate a visitor with the email in identity_data and return its Contact
+
+    Callers pass in the already-loaded enrichment row for (site, email), the
+    visitor's current contact and the contact holding that email (any may be
+    None). Enrichment rows that gained identifiers are appended to
+    changed_enrichments for the caller to re-index after commit.
+    """
     email = identity_data.get('email')
-    if not email:
-        return
-
-    with transaction.atomic():
-        # Check if we have enrichment data for this email
-        from .models import EnrichmentData
-        enrichment = None
-        try:
-            enrichment = EnrichmentData.objects.get(site=visitor.site, email=email)
-        except EnrichmentData.DoesNotExist:
-            pass
-
-        # Collect all visitor information for comprehensive contact data
-        from django.utils import timezone
-        visitor_info = {
-            # Browser fingerprint data
-            'browser_fingerprint': {
-                'browser_name': visitor.browser_name,
-                'browser_version': visitor.browser_version,
-                'os_name': visitor.os_name,
-                'device_type': visitor.device_type,
-                'screen_resolution': visitor.screen_resolution,
-                'timezone': visitor.timezone,
-                'language': visitor.language,
-            },
-            # Tracking data
-            'ip_address': visitor.ip_address,
-            'user_agent': visitor.user_agent,
-            'referrer': visitor.referrer,
-            # UTM attribution data (first-touch)
-            'utm_data': {
-                'utm_source': visitor.utm_source,
-                'utm_medium': visitor.utm_medium,
-                'utm_campaign': visitor.utm_campaign,
-                'utm_term': visitor.utm_term,
-                'utm_content': visitor.utm_content,
-            },
-            # Identification metadata
-            'matched_via': 'email',
-            'first_seen': visitor.first_seen.isoformat() if visitor.first_seen else None,
-            'identified_at': timezone.now().isoformat(),
-        }
 
-        # Prepare contact defaults
-        defaults = {
-            'visitor': visitor,
-            'name': identity_data.get('name', ''),
-            'phone': identity_data.get('phone', ''),
-            'extra_data': {
-                **{k: v for k, v in identity_data.items() if k not in ['email', 'name', 'phone']},
-                **visitor_info,  # Include all visitor information
-            }
+    # Collect all visitor information for comprehensive contact data
+    visitor_info = {
+        # Browser fingerprint data
+        'browser_fingerprint': {
+            'browser_name': visitor.browser_name,
+            'browser_version': visitor.browser_version,
+            'os_name': visitor.os_name,
+            'device_type': visitor.device_type,
+            'screen_resolution': visitor.screen_resolution,
+            'timezone': visitor.timezone,
+            'language': visitor.language,
+        },
+        # Tracking data
+        'ip_address': visitor.ip_address,
+        'user_agent': visitor.user_agent,
+        'referrer': visitor.referrer,
+        # UTM attribution data (first-touch)
+        'utm_data': {
+            'utm_source': visitor.utm_source,
+            'utm_medium': visitor.utm_medium,
+            'utm_campaign': visitor.utm_campaign,
+            'utm_term': visitor.utm_term,
+            'utm_content': visitor.utm_content,
+        },
+        # Identification metadata
+        'matched_via': 'email',
+        'first_seen': visitor.first_seen.isoformat() if visitor.first_seen else None,
+        'identified_at': timezone.now().isoformat(),
+    }
+
+    # Prepare contact defaults
+    defaults = {
+        'visitor': visitor,
+        'name': identity_data.get('name', ''),
+        'phone': identity_data.get('phone', ''),
+        'extra_data': {
+            **{k: v for k, v in identity_data.items() if k not in ['email', 'name', 'phone']},
+            **visitor_info,  # Include all visitor information
         }
+    }
 
-        # If we have enrichment data, use it to populate contact fields
-        if enrichment:
-            defaults['enrichment_data'] = enrichment
-            defaults['name'] = f"{enrichment.first_name} {enrichment.last_name}".strip() or defaults['name']
-            defaults['phone'] = enrichment.phone or defaults['phone']
-            defaults['linkedin_url'] = enrichment.linkedin_url
-            defaults['facebook_url'] = enrichment.facebook_url
-            defaults['extra_data'].update({
-                'company': enrichment.company,
-                'job_title': enrichment.job_title,
-                'location': enrichment.location,
-            })
-
-        # Check if visitor already has a contact
-        try:
-            existing_contact = visitor.contact
-            # Visitor already has a contact, update it with new email/data
-            contact = existing_contact
-            created = False
-            updated = False
-            # Update email if it changed
-            if contact.email != email:
-                contact.email = email
-                updated = True
-            # Update other fields from identity_data
-            if identity_data.get('name'):
-                contact.name = identity_data.get('name')
-                updated = True
-            if identity_data.get('phone'):
-                contact.phone = identity_data.get('phone')
-                updated = True
-            # Update enrichment data if we found matching enrichment
-            if enrichment and contact.enrichment_data != enrichment:
-                contact.enrichment_data = enrichment
-                contact.name = f"{enrichment.first_name} {enrichment.last_name}".strip() or contact.name
-                contact.phone = enrichment.phone or contact.phone
-                contact.linkedin_url = enrichment.linkedin_url
-                contact.facebook_url = enrichment.facebook_url
-                updated = True
-            # Update extra_data with latest visitor information
-            if not contact.extra_data:
-                contact.extra_data = {}
-            contact.extra_data.update(visitor_info)
+    # If we have enrichment data, use it to populate contact fields
+    if enrichment:
+        defaults['enrichment_data'] = enrichment
+        defaults['name'] = f"{enrichment.first_name} {enrichment.last_name}".strip() or defaults['name']
+        defaults['phone'] = enrichment.phone or defaults['phone']
+        defaults['linkedin_url'] = enrichment.linkedin_url
+        defaults['facebook_url'] = enrichment.facebook_url
+        defaults['extra_data'].update({
+            'company': enrichment.company,
+            'job_title': enrichment.job_title,
+            'location': enrichment.location,
+        })
+
+    # Check if visitor already has a contact
+    if existing_contact:
+        # Visitor already has a contact, update it with new email/data
+        contact = existing_contact
+        created = False
+        updated = False
+        # Update email if it changed
+        if contact.email != email:
+            contact.email = email
+            updated = True
+        # Update other fields from identity_data
+        if identity_data.get('name'):
+            contact.name = identity_data.get('name')
+            updated = True
+        if identity_data.get('phone'):
+            contact.phone = identity_data.get('phone')
             updated = True
-            if updated:
-                contact.save()
-        except Contact.DoesNotExist:
-            # Visitor doesn't have a contact yet, create or get one
+        # Update enrichment data if we found matching enrichment
+        if enrichment and contact.enrichment_data != enrichment:
+            contact.enrichment_data = enrichment
+            contact.name = f"{enrichment.first_name} {enrichment.last_name}".strip() or contact.name
+            contact.phone = enrichment.phone or contact.phone
+            contact.linkedin_url = enrichment.linkedin_url
+            contact.facebook_url = enrichment.facebook_url
+            updated = True
+        # Update extra_data with latest visitor information
+        if not contact.extra_data:
+            contact.extra_data = {}
+        contact.extra_data.update(visitor_info)
+        updated = True
+        if updated:
+            contact.save()
+    else:
+        # Visitor doesn't have a contact yet, use the one for this email or create it
+        if email_contact:
+            contact, created = email_contact, False
+        else:
             contact, created = Contact.objects.get_or_create(
-                site=visitor.site,
+                site_id=visitor.site_id,
                 email=email,
                 defaults=defaults
             )
 
-            # If contact already exists but linked to different visitor, update it
-            if not created and contact.visitor != visitor:
-                # Optionally merge visitors here if you want
-                contact.visitor = visitor
-                contact.save()
-
-        # Update contact data if provided
-        if not created:
-            updated = False
-            if 'name' in identity_data and identity_data['name']:
-                contact.name = identity_data['name']
-                updated = True
-            if 'phone' in identity_data and identity_data['phone']:
-                contact.phone = identity_data['phone']
-                updated = True
-
-            # Merge extra data
-            if not contact.extra_data:
-                contact.extra_data = {}
-            for k, v in identity_data.items():
-                if k not in ['email', 'name', 'phone'] and v:
-                    contact.extra_data[k] = v
-                    updated = True
+        # If contact already exists but linked to different visitor, update it
+        if not created and contact.visitor != visitor:
+            # Same email seen on another visitor: stitch both into one identity
+            if contact.visitor_id:
+                IdentityLink.objects.link(contact.visitor, visitor, via='email')
+            contact.visitor = visitor
+            contact.save()
 
-            # Update visitor information
-            contact.extra_data.update(visitor_info)
+    # Update contact data if provided
+    if not created:
+        updated = False
+        if 'name' in identity_data and identity_data['name']:
+            contact.name = identity_data['name']
+            updated = True
+        if 'phone' in identity_data and identity_data['phone']:
+            contact.phone = identity_data['phone']
             updated = True
 
-            if updated:
-                contact.save()
+        # Merge extra data
+        if not contact.extra_data:
+            contact.extra_data = {}
+        for k, v in identity_data.items():
+            if k not in ['email', 'name', 'phone'] and v:
+                contact.extra_data[k] = v
+                updated = True
+
+        # Update visitor information
+        contact.extra_data.update(visitor_info)
+        updated = True
+
+        if updated:
+            contact.save()
 
-        # Mark visitor as identified
+    # Mark visitor as identified
+    if not visitor.is_identified or visitor.matched_via != 'email':
         visitor.is_identified = True
         visitor.matched_via = 'email'
-        visitor.save()
-
-        # Store visitor's browser fingerprint, IP, and phone in enrichment data for future matching
-        # Create enrichment data if it doesn't exist
-        if not enrichment:
-            from .models import EnrichmentData
-            enrichment, created = EnrichmentData.objects.get_or_create(
-                site=visitor.site,
-                email=email,
-                defaults={
-                    'first_name': identity_data.get('name', '').split()[0] if identity_data.get('name') else '',
-                    'last_name': ' '.join(identity_data.get('name', '').split()[1:]) if identity_data.get('name') and len(identity_data.get('name', '').split()) > 1 else '',
-                    'phone': identity_data.get('phone', ''),
-                    'source': 'visitor_identification'
-                }
-            )
-            # Link enrichment to contact
-            if contact and not contact.enrichment_data:
-                contact.enrichment_data = enrichment
-                contact.save()
-
-        if enrichment:
-            updated_enrichment = False
-
-            # Store browser fingerprint
-            if visitor.browser_name and visitor.os_name:
-                fp_dict = {
-                    'browser_name': visitor.browser_name,
-                    'os_name': visitor.os_name,
-                    'device_type': visitor.device_type,
-                    'screen_resolution': visitor.screen_resolution,
-                    'timezone': visitor.timezone,
-                    'language': visitor.language
-                }
-                if fp_dict not in enrichment.browser_fingerprints:
-                    enrichment.browser_fingerprints.append(fp_dict)
-                    updated_enrichment = True
-
-            # Store user agent
-            if visitor.user_agent and visitor.user_agent not in enrichment.user_agents:
-                enrichment.user_agents.append(visitor.user_agent)
-                updated_enrichment = True
+        visitor.save(update_fields=['is_identified', 'matched_via'])
+
+    # Store visitor's browser fingerprint, IP, and phone in enrichment data for future matching
+    # Create enrichment data if it doesn't exist
+    if not enrichment:
+        enrichment, created = EnrichmentData.objects.get_or_create(
+            site_id=visitor.site_id,
+            email=email,
+            defaults={
+                'first_name': identity_data.get('name', '').split()[0] if identity_data.get('name') else '',
+                'last_name': ' '.join(identity_data.get('name', '').split()[1:]) if identity_data.get('name') and len(identity_data.get('name', '').split()) > 1 else '',
+                'phone': identity_data.get('phone', ''),
+                'source': 'visitor_identification'
+            }
+        )
+        # Link enrichment to contact
+        if contact and not contact.enrichment_data:
+            contact.enrichment_data = enrichment
+            contact.save()
 
-            # Store IP address
-            if visitor.ip_address and visitor.ip_address not in enrichment.ip_addresses:
-                enrichment.ip_addresses.append(visitor.ip_address)
+    if enrichment:
+        updated_enrichment = False
+
+        # Store browser fingerprint
+        if visitor.browser_name and visitor.os_name:
+            fp_dict = {
+                'browser_name': visitor.browser_name,
+                'os_name': visitor.os_name,
+                'device_type': visitor.device_type,
+                'screen_resolution': visitor.screen_resolution,
+                'timezone': visitor.timezone,
+                'language': visitor.language
+            }
+            if add_fingerprint(enrichment, fp_dict):
                 updated_enrichment = True
 
-            # Store phone number from identity data
-            if identity_data.get('phone'):
-                phone = identity_data.get('phone')
-                if phone not in enrichment.phone_numbers:
-                    enrichment.phone_numbers.append(phone)
-                    updated_enrichment = True
+        # Store user agent
+        if visitor.user_agent and visitor.user_agent not in enrichment.user_agents:
+            enrichment.user_agents.append(visitor.user_agent)
+            updated_enrichment = True
+
+        # Store IP address
+        if visitor.ip_address and visitor.ip_address not in enrichment.ip_addresses:
+            enrichment.ip_addresses.append(visitor.ip_address)
+            updated_enrichment = True
+
+        # Store phone number from identity data
+        if identity_data.get('phone'):
+            phone = identity_data.get('phone')
+            if phone not in enrichment.phone_numbers:
+                enrichment.phone_numbers.append(phone)
+                updated_enrichment = True
 
-            if updated_enrichment:
-                enrichment.save()
+        if updated_enrichment:
+            enrichment.save()
+            changed_enrichments.append(enrichment)
 
-        return str(contact.id)
+    return contact
 
 
 @shared_task(bind=True, max_retries=3)
@@ -229,3 +330,175 @@ def process_identity_resolution(self, visitor_id, identity_data):
     except Exception as exc:
         # Retry on failure
         raise self.retry(exc=exc, countdown=60)
+
+
+@shared_task(bind=True, max_retries=3)
+def process_identity_resolution_batch(self, items):
+    """
+    Celery task resolving a list of [visitor_id, identity_data] pairs in one transaction
+    """
+    try:
+        return process_identity_resolution_batch_sync(items)
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=60)
+
+
+def _merge_identity_data(pending, identity_data):
+    """Merge a newer identify payload into a pending one; blank values never overwrite"""
+    merged = dict(pending or {})
+    merged.update({k: v for k, v in identity_data.items() if v not in (None, '')})
+    return merged
+
+
+def _pending_key(visitor_id, email):
+    email_hash = hashlib.sha1(email.strip().lower().encode('utf-8')).hexdigest()
+    return f'identity:pending:{visitor_id}:{email_hash}'
+
+
+@contextmanager
+def _locked_payload(key):
+    """
+    Hold a short cache lock over a pending payload while it is read and rewritten
+
+    Merges and the task taking the payload would otherwise interleave between
+    get() and set()/delete() and lose an identify event. A holder that died
+    leaves the lock to expire; waiters give up after a second and go ahead.
+    """
+    lock = f'{key}:lock'
+    deadline = time.monotonic() + 1
+    acquired = cache.add(lock, 1, timeout=5)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.005)
+        acquired = cache.add(lock, 1, timeout=5)
+    try:
+        yield
+    finally:
+        if acquired:
+            cache.delete(lock)
+
+
+def schedule_identity_resolution(visitor_id, identity_data, site_key=None):
+    """
+    Queue identity resolution for a visitor, coalescing repeated identify events
+
+    Payloads for the same (visitor, email) arriving within
+    TRACKING_IDENTITY_DEBOUNCE_SECONDS are merged in the cache and resolved by
+    one delayed task. Returns True if resolution ran synchronously because
+    Celery is not available.
+    """
+    window = getattr(settings, 'TRACKING_IDENTITY_DEBOUNCE_SECONDS', 5)
+    visitor_id = str(visitor_id)
+    key = _pending_key(visitor_id, identity_data['email'])
+
+    with _locked_payload(key):
+        payload = _merge_identity_data(cache.get(key), identity_data)
+        cache.set(key, payload, timeout=window * 10)
+    if not cache.add(f'{key}:scheduled', 1, timeout=window):
+        # A task for this visitor and email is already waiting; it will read the merged payload
+        if site_key:
+            metrics.incr('identity_coalesced_total', site_key)
+        return False
+
+    try:
+        # Run just after the debounce key expires so late merges are never missed
+        resolve_pending_identity.apply_async((visitor_id, identity_data['email']), countdown=window + 1)
+    except Exception:
+        # Fallback to synchronous processing if Celery is not available,
+        # skipping exact repeats of the payload resolved moments ago
+        with _locked_payload(key):
+            payload = cache.get(key) or payload
+            cache.delete_many([key, f'{key}:scheduled'])
+        if cache.get(f'{key}:resolved') == payload:
+            if site_key:
+                metrics.incr('identity_coalesced_total', site_key)
+            return False
+        process_identity_resolution_sync(visitor_id, payload)
+        cache.set(f'{key}:resolved', payload, timeout=window)
+        return True
+
+    if site_key:
+        metrics.incr('identity_enqueued_total', site_key)
+    return False
+
+
+@shared_task(bind=True, max_retries=3)
+def resolve_pending_identity(self, visitor_id, email):
+    """
+    Celery task resolving the coalesced identify payload for (visitor, email)
+    """
+    key = _pending_key(visitor_id, email)
+    # Take the payload atomically: a merge lands either before (and is
+    # resolved now) or after (and schedules the next task)
+    with _locked_payload(key):
+        identity_data = cache.get(key)
+        cache.delete(key)
+    if not identity_data:
+        return None
+    try:
+        return process_identity_resolution_sync(visitor_id, identity_data)
+    except Exception as exc:
+        # Put the payload back, under anything newer that arrived meanwhile
+        with _locked_payload(key):
+            cache.set(key, _merge_identity_data(identity_data, cache.get(key) or {}), timeout=3600)
+        raise self.retry(exc=exc, countdown=60)
+
+
+def repair_identities_sync(site_id=None, batch_size=500, dry_run=False):
+    """
+    Restore the Contact of every identified visitor that lost it
+
+    Broken visitors are found with one anti-join per batch, walked in primary
+    key order. Visitors with an identify event are re-resolved from its latest
+    payload through the batch resolver; the rest cannot be recovered and are
+    marked unidentified again so matching can pick them up. Returns
+    (repaired, reset) counts.
+    """
+    visitors = Visitor.objects.missing_contacts().order_by('pk')
+    if site_id:
+        visitors = visitors.filter(site_id=site_id)
+
+    repaired = reset = 0
+    last_pk = None
+    while True:
+        page = visitors.filter(pk__gt=last_pk) if last_pk else visitors
+        batch = list(page.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1]
+
+        identities = {}
+        events = Event.objects.filter(
+            visitor_id__in=batch,
+            event_type='custom',
+            event_data__event_name='identify',
+        ).order_by('-timestamp').values_list('visitor_id', 'event_data')
+        for visitor_id, event_data in events.iterator(chunk_size=2000):
+            identity_data = (event_data or {}).get('identity_data') or {}
+            if visitor_id not in identities and identity_data.get('email'):
+                identities[visitor_id] = identity_data
+        unrecoverable = [pk for pk in batch if pk not in identities]
+
+        if not dry_run:
+            if identities:
+                process_identity_resolution_batch_sync(list(identities.items()))
+            if unrecoverable:
+                Visitor.objects.missing_contacts().filter(pk__in=unrecoverable).update(
+                    is_identified=False, matched_via=None
+                )
+        repaired += len(identities)
+        reset += len(unrecoverable)
+
+    return repaired, reset
+
+
+@shared_task
+def repair_identities(site_id=None, batch_size=500):
+    """Celery task repairing identified visitors without a Contact"""
+    return repair_identities_sync(site_id, batch_size)
+
+
+@shared_task
+def rebuild_enrichment_filter(site_id):
+    """Rebuild and publish a site's negative-lookup Bloom filter"""
+    from .bloom import rebuild_filter
+    rebuild_filter(site_id)
@@ -1,3 +1,501 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import RestrictedError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from . import heavy_hitters, tasks, throttling, uniques
+from .bot_detection import is_bot_user_agent
+from .flushing import BackgroundFlusher
+from .models import (
+    InternedURL, InternedTitle, Site, EnrichmentData, Contact, UniqueVisitorSketch, HeavyHitterSketch,
+    Visitor, IdentityLink,
+)
+from .sketches import CountMinSketch, HyperLogLog, TopK
+from .fingerprints import match_fingerprint
+from .ip_index import build_site_index, invalidate_enrichment, lookup_ip, update_enrichment_index
+from .throttling import TrackingRateThrottle
 
-# Create your tests here.
+
+class InternedStringTests(TestCase):
+    def test_each_dictionary_has_its_own_cache(self):
+        value = 'https://example.com/shared'
+        url_id = InternedURL.objects.intern(value)
+        title_id = InternedTitle.objects.intern(value)
+
+        self.assertIsNot(InternedURL.objects._ids, InternedTitle.objects._ids)
+        self.assertEqual(InternedURL.objects.get(id=url_id).value, value)
+        self.assertEqual(InternedTitle.objects.get(id=title_id).value, value)
+        # Served from the per-model caches on the second call
+        self.assertEqual(InternedURL.objects.intern(value), url_id)
+        self.assertEqual(InternedTitle.objects.intern(value), title_id)
+
+
+
+class BotUserAgentTests(TestCase):
+    def test_crawlers_are_bots_but_cubot_handsets_are_not(self):
+        crawlers = [
+            'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+            'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+            'AdsBot-Google (+http://www.google.com/adsbot.html)',
+            'Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)',
+            'Mozilla/5.0 (compatible; PetalBot;+https://webmaster.petalsearch.com/site/petalbot)',
+            'Mozilla/5.0 (compatible; bot)',
+        ]
+        handsets = [
+            'Mozilla/5.0 (Linux; Android 10; CUBOT P30) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
+            'Mozilla/5.0 (Linux; Android 11; CUBOT_X30 Build/RP1A.200720.011) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/118.0.0.0 Mobile Safari/537.36',
+            'Mozilla/5.0 (Linux; Android 12; KINGKONG 7) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36 CUBOT',
+        ]
+        for user_agent in crawlers:
+            self.assertTrue(is_bot_user_agent(user_agent), user_agent)
+        for user_agent in handsets:
+            self.assertFalse(is_bot_user_agent(user_agent), user_agent)
+
+@mock.patch('tracking.ip_index.schedule_rebuild')
+class FingerprintTieBreakTests(TestCase):
+    def test_newest_row_wins_after_an_older_row_changes(self, schedule_rebuild):
+        site = Site.objects.create(name='Site', domain='tie.example.com')
+        fingerprint = {
+            'browser_name': 'Firefox', 'os_name': 'Linux', 'device_type': 'desktop',
+            'screen_resolution': '1920x1080', 'timezone': 'UTC', 'language': 'en',
+        }
+        older = EnrichmentData.objects.create(site=site, email='old@example.com', browser_fingerprints=[fingerprint])
+        newer = EnrichmentData.objects.create(site=site, email='new@example.com', browser_fingerprints=[fingerprint])
+        invalidate_enrichment(site.id)
+        self.assertEqual(match_fingerprint(site.id, fingerprint)[0], newer.id)
+
+        # Catching up on a change must not make the older row look newest
+        older.ip_addresses = ['192.0.2.1']
+        older.save()
+        update_enrichment_index(site.id, [(older.id, older.ip_addresses, older.ip_ranges)])
+        self.assertEqual(match_fingerprint(site.id, fingerprint)[0], newer.id)
+
+
+@mock.patch('tracking.ip_index.schedule_rebuild')
+class IPIndexSharedNetworkTests(TestCase):
+    def test_patched_index_matches_rebuilt_index(self, schedule_rebuild):
+        site = Site.objects.create(name='Site', domain='ip.example.com')
+        older = EnrichmentData.objects.create(site=site, email='old@example.com', ip_ranges=['203.0.113.0/24'])
+        newer = EnrichmentData.objects.create(site=site, email='new@example.com', ip_ranges=['203.0.113.0/24'])
+        invalidate_enrichment(site.id)
+        self.assertEqual(lookup_ip(site.id, '203.0.113.7')[0], newer.id)
+
+        # This process patches its index in place...
+        older.ip_addresses = ['192.0.2.1']
+        older.save()
+        update_enrichment_index(site.id, [(older.id, older.ip_addresses, older.ip_ranges)])
+        patched = lookup_ip(site.id, '203.0.113.7')
+
+        # ...while any other process rebuilds it from scratch
+        rebuilt = build_site_index(site.id).lookup('203.0.113.7')
+        self.assertEqual(patched, rebuilt)
+        self.assertEqual(patched[0], newer.id)
+
+        # Removing one owner keeps the network for the other
+        newer_id = newer.id
+        newer.delete()
+        update_enrichment_index(site.id, [(newer_id, [], [])])
+        self.assertEqual(lookup_ip(site.id, '203.0.113.7')[0], older.id)
+
+
+class EraseContactsCommandTests(TestCase):
+    def test_site_option_accepts_a_site_key(self):
+        site = Site.objects.create(name='Site', domain='erase.example.com')
+        other = Site.objects.create(name='Other', domain='other.example.com')
+        Contact.objects.create(site=site, email='gone@example.com')
+        Contact.objects.create(site=other, email='gone@example.com')
+
+        call_command('erase_contacts', email=['gone@example.com'], site=site.site_key, stdout=StringIO())
+
+        self.assertFalse(Contact.objects.filter(site=site).exists())
+        self.assertTrue(Contact.objects.filter(site=other).exists())
+
+    def test_site_option_accepts_a_site_id_and_reports_unknown_values(self):
+        site = Site.objects.create(name='Site', domain='erase.example.com')
+        Contact.objects.create(site=site, email='gone@example.com')
+
+        out = StringIO()
+        call_command('erase_contacts', email=['gone@example.com'], site='no-such-site', stdout=out)
+        self.assertIn('Site not found', out.getvalue())
+        self.assertTrue(Contact.objects.filter(site=site).exists())
+
+        call_command('erase_contacts', email=['gone@example.com'], site=str(site.id), stdout=StringIO())
+        self.assertFalse(Contact.objects.filter(site=site).exists())
+
+
+class SiteOptionTests(TestCase):
+    def test_maintenance_commands_accept_a_site_key(self):
+        site = Site.objects.create(name='Keyed', domain='keyed.example.com')
+        Site.objects.create(name='Other', domain='other.example.com')
+
+        out = StringIO()
+        call_command('rebuild_sessions', site=site.site_key, stdout=out)
+        self.assertIn('Keyed: rebuilt 0 sessions', out.getvalue())
+        self.assertNotIn('Other', out.getvalue())
+
+        out = StringIO()
+        call_command('repair_identities', site=site.site_key, dry_run=True, stdout=out)
+        self.assertNotIn('Error', out.getvalue())
+        self.assertNotIn('Site not found', out.getvalue())
+
+
+class HyperLogLogTests(TestCase):
+    def test_cardinality_error_within_expected_bound(self):
+        for count in (1000, 20000):
+            sketch = HyperLogLog()
+            for i in range(count):
+                sketch.add(f'visitor-{i}')
+            # Standard error is 1.04 / sqrt(4096) = 1.6%; allow three of them
+            self.assertLess(abs(sketch.count() - count), 0.05 * count)
+
+    def test_small_cardinalities_are_near_exact(self):
+        sketch = HyperLogLog()
+        self.assertEqual(sketch.count(), 0)
+        for _ in range(3):
+            for i in range(50):
+                sketch.add(f'visitor-{i}')
+        self.assertLessEqual(abs(sketch.count() - 50), 1)
+
+    def test_merge_takes_register_wise_maximum(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            a.add(f'visitor-{i}')
+        for i in range(2000, 5000):
+            b.add(f'visitor-{i}')
+        expected = bytes(map(max, a.registers, b.registers))
+
+        merged = HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+        self.assertEqual(merged.to_bytes(), expected)
+        self.assertLess(abs(merged.count() - 5000), 250)
+        # Merging the same data again changes nothing
+        self.assertEqual(merged.merge(b).to_bytes(), expected)
+        with self.assertRaises(ValueError):
+            a.merge(HyperLogLog(precision=10))
+
+
+@mock.patch('tracking.uniques._flusher')
+class UniqueVisitorFlushTests(TestCase):
+    def test_flush_merges_into_existing_rows(self, flusher):
+        site = Site.objects.create(name='Site', domain='uniques.example.com')
+        now = timezone.now()
+        day = timezone.localdate(now)
+        for i in range(40):
+            uniques.record_visit(site.id, f'visitor-{i}', now, 'https://example.com/a', 'spring')
+        self.assertEqual(uniques.flush(), 3)
+
+        # A second flush overlaps the first batch and must merge, not replace
+        for i in range(20, 60):
+            uniques.record_visit(site.id, f'visitor-{i}', now, 'https://example.com/a')
+        self.assertEqual(uniques.flush(), 2)
+
+        self.assertEqual(UniqueVisitorSketch.objects.filter(site=site).count(), 3)
+        self.assertEqual(UniqueVisitorSketch.objects.estimate(site.id, day, day), 60)
+        page = uniques.page_key('https://example.com/a')
+        self.assertEqual(UniqueVisitorSketch.objects.estimate(site.id, day, day, 'page', page), 60)
+        self.assertEqual(UniqueVisitorSketch.objects.estimate(site.id, day, day, 'campaign', 'spring'), 40)
+        self.assertEqual(uniques.flush(), 0)
+
+    def test_a_full_buffer_wakes_the_flusher_instead_of_flushing_inline(self, flusher):
+        site = Site.objects.create(name='Site', domain='uniques.example.com')
+        with self.settings(TRACKING_SKETCH_MAX_PENDING=2):
+            uniques.record_visit(site.id, 'visitor-1', timezone.now())
+            flusher.wake.assert_not_called()
+            uniques.record_visit(site.id, 'visitor-2', timezone.now(), 'https://example.com/a')
+            flusher.wake.assert_called_once()
+        self.assertFalse(UniqueVisitorSketch.objects.exists())
+        uniques.flush()
+
+
+class BackgroundFlusherTests(TestCase):
+    def test_wake_runs_flush_on_the_background_thread(self):
+        flushed = threading.Event()
+        threads = []
+
+        def flush():
+            threads.append(threading.current_thread().name)
+            flushed.set()
+
+        flusher = BackgroundFlusher(flush, 'test-flush')
+        flusher.ensure_started()
+        flusher.ensure_started()
+        flusher.wake()
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(threads[0], 'test-flush')
+        self.assertEqual([thread.name for thread in threading.enumerate()].count('test-flush'), 1)
+
+
+class CountMinTopKTests(TestCase):
+    def test_count_min_never_undercounts(self):
+        # A narrow sketch forces collisions
+        sketch = CountMinSketch(width=64, depth=3)
+        counts = {f'value-{i}': i % 7 + 1 for i in range(500)}
+        for value, count in counts.items():
+            sketch.add(value, count)
+        for value, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(value), count)
+        self.assertEqual(sketch.total, sum(counts.values()))
+
+        restored = CountMinSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(list(restored.counts), list(sketch.counts))
+        self.assertEqual(restored.total, sketch.total)
+
+    def test_merge_adds_counters(self):
+        a, b = CountMinSketch(), CountMinSketch()
+        a.add('page', 3)
+        b.add('page', 4)
+        self.assertEqual(a.merge(b).estimate('page'), 7)
+
+    def test_top_k_evicts_the_smallest_value(self):
+        top_k = TopK(k=2)
+        top_k.add('a', 5)
+        top_k.add('b', 1)
+        top_k.add('c', 3)
+        self.assertEqual(top_k.top(), [('a', 5), ('c', 3)])
+        # Values below the smallest tracked count do not get in
+        top_k.add('d', 2)
+        self.assertEqual(top_k.top(), [('a', 5), ('c', 3)])
+        # A tracked value's count keeps growing in place
+        top_k.add('c', 4)
+        self.assertEqual(top_k.top(), [('c', 7), ('a', 5)])
+
+    def test_top_k_merge_reranks_both_streams(self):
+        a, b = TopK(k=2), TopK(k=2)
+        a.add('x', 5)
+        a.add('y', 4)
+        b.add('z', 3)
+        b.add('y', 3)
+        self.assertEqual(a.merge(b).top(), [('y', 7), ('x', 5)])
+
+
+@mock.patch('tracking.heavy_hitters._flusher')
+class HeavyHitterFlushTests(TestCase):
+    def test_flush_merges_into_existing_rows(self, flusher):
+        site = Site.objects.create(name='Site', domain='top.example.com')
+        now = timezone.now()
+        day = timezone.localdate(now)
+        for _ in range(3):
+            heavy_hitters.record_hit(site.id, now, 'https://example.com/a', 'https://ref.example.com/')
+        heavy_hitters.record_hit(site.id, now, 'https://example.com/b', element_path='div > a')
+        self.assertEqual(heavy_hitters.flush(), 3)
+
+        for _ in range(4):
+            heavy_hitters.record_hit(site.id, now, 'https://example.com/b')
+        self.assertEqual(heavy_hitters.flush(), 1)
+
+        self.assertEqual(HeavyHitterSketch.objects.filter(site=site).count(), 3)
+        self.assertEqual(
+            HeavyHitterSketch.objects.top(site.id, day, day, 'page'),
+            [('https://example.com/b', 5), ('https://example.com/a', 3)],
+        )
+        self.assertEqual(HeavyHitterSketch.objects.top(site.id, day, day, 'referrer'), [('https://ref.example.com/', 3)])
+        # Ranges merge the stored sketches instead of reading one day's list
+        self.assertEqual(
+            HeavyHitterSketch.objects.top(site.id, day - timedelta(days=1), day, 'page', limit=1),
+            [('https://example.com/b', 5)],
+        )
+
+
+class IdentityLinkTests(TestCase):
+    def setUp(self):
+        self.site = Site.objects.create(name='Site', domain='graph.example.com')
+        self.a, self.b, self.c, self.d = (
+            Visitor.objects.create(site=self.site, visitor_id=visitor_id) for visitor_id in 'abcd'
+        )
+
+    def members(self, visitor):
+        return set(IdentityLink.objects.members(visitor.pk).values_list('id', flat=True))
+
+    def test_singletons_are_their_own_root(self):
+        self.assertEqual(IdentityLink.objects.find(self.a.pk), self.a.pk)
+        self.assertEqual(self.members(self.a), {self.a.pk})
+
+    def test_link_unions_by_size(self):
+        root = IdentityLink.objects.link(self.a, self.b, via='email')
+        self.assertEqual(IdentityLink.objects.link(self.b, self.a), root)
+        # The larger set's root absorbs the singleton
+        self.assertEqual(IdentityLink.objects.link(self.c, self.a), root)
+        self.assertEqual(IdentityLink.objects.link(self.d, self.c), root)
+
+        for visitor in (self.a, self.b, self.c, self.d):
+            self.assertEqual(IdentityLink.objects.find(visitor.pk), root)
+            self.assertEqual(self.members(visitor), {self.a.pk, self.b.pk, self.c.pk, self.d.pk})
+        self.assertEqual(IdentityLink.objects.get(visitor_id=root).size, 4)
+
+        other = Site.objects.create(name='Other', domain='other.example.com')
+        with self.assertRaises(ValueError):
+            IdentityLink.objects.link(self.a, Visitor.objects.create(site=other, visitor_id='x'))
+
+    def test_find_compresses_paths(self):
+        IdentityLink.objects.create(visitor=self.a, site=self.site, root=self.a, size=3)
+        IdentityLink.objects.create(visitor=self.b, site=self.site, root=self.a)
+        IdentityLink.objects.create(visitor=self.c, site=self.site, root=self.b)
+        self.assertEqual(IdentityLink.objects.find(self.c.pk), self.a.pk)
+        self.assertEqual(IdentityLink.objects.get(visitor=self.c).root_id, self.a.pk)
+
+    def test_deleting_the_root_re_roots_the_set(self):
+        root = IdentityLink.objects.link(self.a, self.b)
+        IdentityLink.objects.link(self.c, self.a)
+        Visitor.objects.get(pk=root).delete()
+
+        remaining = {self.a.pk, self.b.pk, self.c.pk} - {root}
+        new_root = min(remaining)
+        for visitor_id in remaining:
+            self.assertEqual(IdentityLink.objects.find(visitor_id), new_root)
+        self.assertEqual(IdentityLink.objects.get(visitor_id=new_root).size, 2)
+
+    def test_bulk_deleting_visitors_without_detaching_is_refused(self):
+        root = IdentityLink.objects.link(self.a, self.b)
+        with self.assertRaises(RestrictedError):
+            Visitor.objects.filter(pk=root).delete()
+        # Deleting the whole site still cascades through the graph
+        self.site.delete()
+        self.assertFalse(IdentityLink.objects.exists())
+
+
+@override_settings(TRACKING_RATE_LIMIT_BACKEND='memory', TRACKING_RATE_LIMIT_ENABLED=True, TRACKING_BOT_FILTER='count')
+class TrackingRateThrottleTests(TestCase):
+    human = 'Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0'
+
+    def setUp(self):
+        throttling._backend = None
+        throttling._site_quotas.clear()
+        throttling._unknown_sites.clear()
+        self.site = Site.objects.create(
+            name='Site', domain='throttle.example.com', rate_limit_per_minute=1, rate_limit_burst=2,
+        )
+
+    def allow(self, visitor_id, user_agent=human):
+        request = Request(
+            APIRequestFactory().post(
+                '/api/track/', {'site_key': self.site.site_key, 'visitor_id': visitor_id}, format='json',
+                HTTP_USER_AGENT=user_agent, HTTP_ACCEPT_LANGUAGE='en',
+            ),
+            parsers=[JSONParser()],
+        )
+        throttle = TrackingRateThrottle()
+        return throttle.allow_request(request, None), throttle.wait()
+
+    @override_settings(TRACKING_VISITOR_RATE_LIMIT_BURST=1)
+    def test_visitor_rejections_do_not_spend_the_site_quota(self):
+        self.assertTrue(self.allow('loop')[0])
+        self.assertFalse(self.allow('loop')[0])
+        self.assertFalse(self.allow('loop')[0])
+        # The site bucket still has its second token
+        self.assertTrue(self.allow('other')[0])
+        allowed, wait = self.allow('third')
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+
+    def test_bot_hits_are_not_charged(self):
+        for _ in range(5):
+            self.assertTrue(self.allow('crawler', 'Googlebot/2.1 (+http://www.google.com/bot.html)')[0])
+        self.assertTrue(self.allow('a')[0])
+        self.assertTrue(self.allow('b')[0])
+        self.assertFalse(self.allow('c')[0])
+
+    def test_zero_quota_blocks_the_site(self):
+        self.site.rate_limit_per_minute = 0
+        self.site.save()
+        self.assertEqual(self.allow('a'), (False, None))
+
+    @override_settings(TRACKING_RATE_LIMIT_SITE_CACHE_SIZE=1, TRACKING_RATE_LIMIT_UNKNOWN_SITE_CACHE_SIZE=3)
+    def test_quota_caches_are_bounded(self):
+        self.assertEqual(throttling.get_site_quota(self.site.site_key), (1, 2))
+        with self.assertNumQueries(0):
+            self.assertEqual(throttling.get_site_quota(self.site.site_key), (1, 2))
+
+        for i in range(10):
+            self.assertEqual(throttling.get_site_quota(f'unknown-{i}'), (6000, 1000))
+        self.assertEqual(len(throttling._unknown_sites), 3)
+        with self.assertNumQueries(0):
+            throttling.get_site_quota('unknown-9')
+
+        other = Site.objects.create(name='Other', domain='other.example.com')
+        throttling.get_site_quota(other.site_key)
+        self.assertEqual(list(throttling._site_quotas), [other.site_key])
+
+
+
+@override_settings(TRACKING_RATE_LIMIT_ENABLED=False)
+@mock.patch('tracking.views.record_hit')
+@mock.patch('tracking.views.record_visit')
+class TrackEventCounterTests(TestCase):
+    def setUp(self):
+        self.site = Site.objects.create(name='Site', domain='counter.example.com')
+        self.client = APIClient(HTTP_USER_AGENT=TrackingRateThrottleTests.human, HTTP_ACCEPT_LANGUAGE='en')
+
+    def track(self):
+        return self.client.post('/api/track/', {
+            'site_key': self.site.site_key, 'visitor_id': 'counted', 'event_type': 'page_view',
+            'page_url': 'https://counter.example.com/', 'session_id': 's1',
+        }, format='json')
+
+    def test_event_count_matches_stored_events(self, *recorders):
+        self.assertEqual(self.track().status_code, 201)
+        self.assertEqual(self.track().status_code, 201)
+        with mock.patch('tracking.views.Event.objects.create', side_effect=DatabaseError('insert failed')):
+            self.assertEqual(self.track().status_code, 500)
+
+        visitor = Visitor.objects.get(site=self.site, visitor_id='counted')
+        self.assertEqual(visitor.events.count(), 2)
+        self.assertEqual(visitor.event_count, 2)
+
+class StatsSiteParameterTests(TestCase):
+    def setUp(self):
+        self.site = Site.objects.create(name='Site', domain='stats.example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('staff', 'staff@example.com', 'pw'))
+
+    def test_staff_pick_the_site_by_id_on_every_stats_endpoint(self):
+        for url in ('/api/metrics/', '/api/stats/uniques/', '/api/stats/top/'):
+            self.assertEqual(self.client.get(url, {'site': str(self.site.id)}).status_code, 200, url)
+            self.assertEqual(self.client.get(url, {'site': self.site.site_key}).status_code, 400, url)
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+        response = self.client.get('/api/metrics/', {'site': str(self.site.id)})
+        self.assertEqual(response.json()['site_key'], self.site.site_key)
+
+
+class PendingIdentityTests(TestCase):
+    def test_identify_merged_while_the_task_takes_the_payload_is_kept(self):
+        key = tasks._pending_key('visitor-1', 'a@example.com')
+        cache.set(key, {'email': 'a@example.com', 'name': 'Alice'})
+        writer = threading.Thread(
+            target=tasks.schedule_identity_resolution,
+            args=('visitor-1', {'email': 'a@example.com', 'phone': '555'}),
+        )
+
+        class RacingCache:
+            """Starts a concurrent identify event right after the task reads the payload"""
+
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def get(self, cache_key, *args, **kwargs):
+                value = cache.get(cache_key, *args, **kwargs)
+                if cache_key == key and writer.ident is None:
+                    writer.start()
+                    writer.join(0.2)
+                return value
+
+        with mock.patch('tracking.tasks.cache', RacingCache()), \
+                mock.patch.object(tasks.resolve_pending_identity, 'apply_async') as apply_async, \
+                mock.patch('tracking.tasks.process_identity_resolution_sync') as resolve:
+            tasks.resolve_pending_identity.run('visitor-1', 'a@example.com')
+            writer.join(5)
+
+        resolve.assert_called_once_with('visitor-1', {'email': 'a@example.com', 'name': 'Alice'})
+        # The later event is still pending, with a task scheduled for it
+        self.assertEqual(cache.get(key), {'email': 'a@example.com', 'phone': '555'})
+        apply_async.assert_called_once()
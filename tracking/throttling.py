@@ -0,0 +1,201 @@
+"""
+Token-bucket admission control for the tracking endpoint
+
+Each site and each (site, visitor) pair gets a bucket that refills at a steady
+rate up to a burst capacity. Buckets live in process memory by default, or in
+Redis when TRACKING_RATE_LIMIT_BACKEND = 'redis' so limits hold across workers.
+Requests over quota are rejected by DRF with a 429 before the view runs; the
+visitor bucket is checked before the site bucket, and bot traffic is not
+charged.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+from . import metrics
+from .bot_detection import classify_request
+
+
+QUOTA_CACHE_TTL = 60  # Seconds a site's quota is kept before re-reading it
+
+
+class MemoryTokenBucketBackend:
+    """In-process token buckets, bounded with LRU eviction"""
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, cost=1):
+        """Take `cost` tokens from the bucket; return (allowed, wait_seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            # Evicted buckets simply start full again
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        wait = 0 if allowed else (cost - tokens) / rate
+        return allowed, wait
+
+
+class RedisTokenBucketBackend:
+    """Token buckets shared across processes through an atomic Redis script"""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def consume(self, key, rate, burst, cost=1):
+        allowed, tokens = self.script(keys=[f'ratelimit:{key}'], args=[rate, burst, time.time(), cost])
+        allowed = bool(int(allowed))
+        wait = 0 if allowed else (cost - float(tokens)) / rate
+        return allowed, wait
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured token bucket backend (created once per process)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if getattr(settings, 'TRACKING_RATE_LIMIT_BACKEND', 'memory') == 'redis':
+                    _backend = RedisTokenBucketBackend(settings.TRACKING_RATE_LIMIT_REDIS_URL)
+                else:
+                    _backend = MemoryTokenBucketBackend()
+    return _backend
+
+
+_site_quotas = OrderedDict()  # site_key -> (expires_at, quota), LRU order
+_unknown_sites = OrderedDict()  # site_key -> expires_at for keys with no Site row
+_quota_lock = threading.Lock()
+
+
+def _remember(entries, key, value, max_size):
+    with _quota_lock:
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+
+def get_site_quota(site_key):
+    """
+    Return (per_minute, burst) for a site
+
+    Per-site overrides come from the Site row and are cached in process for
+    QUOTA_CACHE_TTL seconds so the limiter does not query on every hit. Both
+    caches are bounded LRUs; unknown site_keys are remembered in a smaller one
+    so random keys cannot grow memory or evict real sites.
+    """
+    now = time.monotonic()
+    default = (settings.TRACKING_SITE_RATE_LIMIT_PER_MINUTE, settings.TRACKING_SITE_RATE_LIMIT_BURST)
+    cached = _site_quotas.get(site_key)
+    if cached and cached[0] > now:
+        return cached[1]
+    expires_at = _unknown_sites.get(site_key)
+    if expires_at and expires_at > now:
+        return default
+
+    from .models import Site
+    override = Site.objects.filter(site_key=site_key).values_list(
+        'rate_limit_per_minute', 'rate_limit_burst'
+    ).first()
+    if override is None:
+        _remember(_unknown_sites, site_key, now + QUOTA_CACHE_TTL,
+                  getattr(settings, 'TRACKING_RATE_LIMIT_UNKNOWN_SITE_CACHE_SIZE', 1000))
+        return default
+
+    # A blank override falls back to the default; 0 is a valid limit
+    quota = tuple(default[i] if override[i] is None else override[i] for i in range(2))
+    _remember(_site_quotas, site_key, (now + QUOTA_CACHE_TTL, quota),
+              getattr(settings, 'TRACKING_RATE_LIMIT_SITE_CACHE_SIZE', 10000))
+    return quota
+
+
+class TrackingRateThrottle(BaseThrottle):
+    """
+    Per-visitor and per-site token buckets for the tracking endpoint
+
+    Buckets are charged in order and checking stops at the first rejection, so
+    a visitor over its own quota does not also spend its site's tokens. Requests
+    the bot filter will drop are not charged at all.
+    """
+
+    def get_buckets(self, site_key, data):
+        """Yield (bucket_key, per_minute, burst, rejection metric), cheapest first"""
+        visitor_id = data.get('visitor_id')
+        if visitor_id:
+            yield (
+                f'visitor:{site_key}:{str(visitor_id)[:255]}',
+                settings.TRACKING_VISITOR_RATE_LIMIT_PER_MINUTE,
+                settings.TRACKING_VISITOR_RATE_LIMIT_BURST,
+                'ratelimit_visitor_rejected_total',
+            )
+        per_minute, burst = get_site_quota(site_key)
+        yield f'site:{site_key}', per_minute, burst, 'ratelimit_site_rejected_total'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not getattr(settings, 'TRACKING_RATE_LIMIT_ENABLED', True):
+            return True
+
+        data = request.data if hasattr(request.data, 'get') else {}
+        site_key = data.get('site_key')
+        if not site_key:
+            # Let the serializer reject the payload
+            return True
+        if getattr(settings, 'TRACKING_BOT_FILTER', 'count') != 'off' and classify_request(request):
+            # Dropped by the view before any work; do not spend the site's quota on it
+            return True
+        site_key = str(site_key)[:64]
+
+        for key, per_minute, burst, metric_name in self.get_buckets(site_key, data):
+            if per_minute <= 0:
+                # A limit of 0 blocks the site outright
+                allowed, wait = False, None
+            else:
+                try:
+                    allowed, wait = get_backend().consume(key, per_minute / 60.0, burst)
+                except Exception:
+                    # Never turn a limiter outage into a tracking outage
+                    metrics.incr('ratelimit_backend_errors_total', site_key)
+                    return True
+            if not allowed:
+                self.wait_seconds = wait
+                metrics.incr(metric_name, site_key)
+                return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,102 @@
+"""
+Unique-visitor sketches maintained at ingest
+
+Each tracked hit adds the visitor to the HyperLogLog buckets of its site, page
+and UTM campaign for the day. Hits are buffered per process as sets of visitor
+hashes and merged into the UniqueVisitorSketch rows by a background thread
+(tracking.flushing) every TRACKING_SKETCH_FLUSH_SECONDS, or sooner once
+TRACKING_SKETCH_MAX_PENDING buckets are waiting. Merging is a register-wise
+maximum, so flushes from several processes (or of the same visitor twice)
+never over-count.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+from django.conf import settings
+from django.utils import timezone
+from .flushing import BackgroundFlusher
+from .sketches import HyperLogLog, hash64
+
+
+logger = logging.getLogger(__name__)
+
+
+def page_key(page_url):
+    """Bucket key of a page: the sha1 also used as its InternedURL.value_hash"""
+    return hashlib.sha1(page_url.encode('utf-8')).hexdigest()
+
+
+_pending = {}  # (site_id, day, dimension, key) -> set of visitor hashes
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+
+def record_visit(site_id, visitor_pk, timestamp, page_url=None, campaign=None):
+    """Add a visitor to the site, page and campaign buckets of the hit's day"""
+    day = timezone.localdate(timestamp)
+    hashed = hash64(visitor_pk)
+    buckets = [('site', '')]
+    if page_url:
+        buckets.append(('page', page_key(page_url)))
+    if campaign:
+        buckets.append(('campaign', campaign[:255]))
+
+    with _pending_lock:
+        for dimension, key in buckets:
+            _pending.setdefault((site_id, day, dimension, key), set()).add(hashed)
+        full = len(_pending) >= getattr(settings, 'TRACKING_SKETCH_MAX_PENDING', 1000)
+    if full:
+        _flusher.wake()
+    else:
+        _flusher.ensure_started()
+
+
+def flush():
+    """Merge the buffered visitors into the stored sketches; returns the number of buckets written"""
+    from .models import UniqueVisitorSketch
+
+    global _pending
+    # One flush at a time per process; hits keep buffering meanwhile
+    if not _flush_lock.acquire(blocking=False):
+        return 0
+    try:
+        with _pending_lock:
+            pending, _pending = _pending, {}
+
+        # Buckets are written in a fixed order so concurrent flushes lock rows consistently
+        for bucket in sorted(pending, key=lambda bucket: (str(bucket[0]), bucket[1], bucket[2], bucket[3])):
+            sketch = HyperLogLog()
+            for hashed in pending[bucket]:
+                sketch.add_hash(hashed)
+            try:
+                UniqueVisitorSketch.objects.merge_sketch(*bucket, sketch)
+            except Exception:
+                logger.exception('Unique visitor sketch flush failed', extra={'site_id': str(bucket[0])})
+        return len(pending)
+    finally:
+        _flush_lock.release()
+
+
+def top_keys(site_id, start, end, dimension, limit=10):
+    """Top keys of a dimension by unique visitors, with page keys resolved to URLs"""
+    from .models import InternedURL, UniqueVisitorSketch
+
+    top = UniqueVisitorSketch.objects.top(site_id, start, end, dimension, limit)
+    labels = {}
+    if dimension == 'page':
+        labels = dict(InternedURL.objects.filter(value_hash__in=[key for key, _ in top]).values_list('value_hash', 'value'))
+    return [{'key': key, 'label': labels.get(key, key), 'uniques': uniques} for key, uniques in top]
+
+
+_flusher = BackgroundFlusher(flush, 'unique-visitor-flush')
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
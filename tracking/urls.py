@@ -11,5 +11,8 @@ router.register(r'conversion-goals', views.ConversionGoalViewSet)
 
 urlpatterns = [
     path('track/', views.track_event, name='track-event'),
+    path('metrics/', views.ingest_metrics, name='ingest-metrics'),
+    path('stats/uniques/', views.unique_visitors, name='unique-visitors'),
+    path('stats/top/', views.top_values, name='top-values'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,87 @@
+"""
+Server-side user agent parsing
+
+Fills browser, version, OS and device fields that the pixel's client-side
+fingerprint left empty. Results are cached in a bounded LRU keyed by the raw
+UA string; real traffic only has a few thousand distinct UAs, so almost every
+request is a dictionary hit instead of a round of regex matching.
+"""
+import re
+from functools import lru_cache
+from django.conf import settings
+
+
+# Order matters: many browsers embed "Chrome" and "Safari" tokens in their UA
+BROWSER_PATTERNS = [
+    ('Edge', re.compile(r'(?:Edg|EdgA|EdgiOS|Edge)/([\d.]+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/([\d.]+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/([\d.]+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/([\d.]+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/([\d.]+)')),
+    ('Safari', re.compile(r'Version/([\d.]+).*Safari/')),
+    ('Internet Explorer', re.compile(r'(?:MSIE |Trident/.*rv:)([\d.]+)')),
+]
+
+# Same OS names the pixel reports, checked most specific first
+OS_PATTERNS = [
+    ('iOS', re.compile(r'iPhone|iPad|iPod')),
+    ('Android', re.compile(r'Android')),
+    ('Chrome OS', re.compile(r'CrOS')),
+    ('Windows', re.compile(r'Windows')),
+    ('MacOS', re.compile(r'Macintosh|Mac OS X')),
+    ('Linux', re.compile(r'Linux|X11')),
+]
+
+TABLET_PATTERN = re.compile(r'tablet|ipad|playbook|silk|android(?!.*mobi)', re.IGNORECASE)
+MOBILE_PATTERN = re.compile(r'mobi|iphone|ipod|android|blackberry|opera mini|iemobile', re.IGNORECASE)
+
+FINGERPRINT_FIELDS = ('browser_name', 'browser_version', 'os_name', 'device_type')
+
+
+@lru_cache(maxsize=getattr(settings, 'TRACKING_UA_PARSE_CACHE_SIZE', 2048))
+def parse_user_agent(user_agent):
+    """
+    Parse a user agent string into browser_name, browser_version, os_name
+    and device_type. Unrecognised parts are None.
+    """
+    parsed = dict.fromkeys(FINGERPRINT_FIELDS)
+    if not user_agent:
+        return parsed
+
+    for name, pattern in BROWSER_PATTERNS:
+        match = pattern.search(user_agent)
+        if match:
+            parsed['browser_name'] = name
+            parsed['browser_version'] = match.group(1)[:50]
+            break
+
+    for name, pattern in OS_PATTERNS:
+        if pattern.search(user_agent):
+            parsed['os_name'] = name
+            break
+
+    if TABLET_PATTERN.search(user_agent):
+        parsed['device_type'] = 'tablet'
+    elif MOBILE_PATTERN.search(user_agent):
+        parsed['device_type'] = 'mobile'
+    else:
+        parsed['device_type'] = 'desktop'
+
+    return parsed
+
+
+def fill_fingerprint(browser_fp, user_agent):
+    """
+    Return a copy of the client fingerprint with missing or 'Unknown'
+    browser/OS/device fields filled from the server-side UA parse
+    """
+    filled = dict(browser_fp or {})
+    parsed = parse_user_agent(user_agent or '')
+    for field in FINGERPRINT_FIELDS:
+        if not filled.get(field) or filled.get(field) == 'Unknown':
+            filled[field] = parsed[field]
+
+    # A parsed version only makes sense for the browser we parsed it from
+    if filled['browser_name'] != parsed['browser_name'] and not (browser_fp or {}).get('browser_version'):
+        filled['browser_version'] = None
+    return filled
@@ -0,0 +1,45 @@
+"""
+Time-ordered UUIDs for insert-heavy tables
+
+uuid7() follows the UUIDv7 layout: a 48-bit Unix millisecond timestamp,
+the version and variant bits, and random bits. New keys sort after older
+ones, so inserts append to the right edge of the primary-key B-tree instead
+of splitting random pages. The values are ordinary UUIDs and fit the existing
+UUID columns and URL patterns unchanged.
+"""
+import os
+import threading
+import time
+import uuid
+
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """Return a new time-ordered (version 7) UUID, monotonic within a process"""
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Random 12-bit starting point leaves room to count up within the ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # Counter exhausted: borrow the next millisecond
+                _last_ms += 1
+                _counter = 0
+        timestamp_ms = _last_ms
+        counter = _counter
+
+    rand_b = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76  # version
+    value |= counter << 64
+    value |= 0x2 << 62  # RFC 4122 variant
+    value |= rand_b
+    return uuid.UUID(int=value)
@@ -0,0 +1,58 @@
+"""
+Per-site version counters shared through the Django cache
+
+Writers bump a counter after changing data; readers holding a derived,
+in-process structure compare versions and rebuild when theirs is stale.
+"""
+from django.core.cache import cache
+
+
+def _key(namespace, site_id):
+    return f'version:{namespace}:{site_id}'
+
+
+def get_version(namespace, site_id):
+    """Return the current version for (namespace, site), initialising it to 1"""
+    key = _key(namespace, site_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(namespace, site_id):
+    """Invalidate everything derived from (namespace, site) and return the new version"""
+    key = _key(namespace, site_id)
+    cache.add(key, 1, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); any new value invalidates readers
+        cache.set(key, 2, timeout=None)
+        return 2
+
+
+def touch_version(namespace, site_id, min_interval):
+    """
+    Record a change to (namespace, site) from a hot write path
+
+    Bumps at most once per min_interval seconds; changes inside that window
+    leave a pending flag that settle_version() turns into a bump later, so
+    readers are never more than min_interval seconds behind.
+    """
+    key = _key(namespace, site_id)
+    if cache.add(f'{key}:throttle', 1, timeout=min_interval):
+        cache.delete(f'{key}:pending')
+        return bump_version(namespace, site_id)
+    cache.set(f'{key}:pending', 1, timeout=None)
+    return None
+
+
+def settle_version(namespace, site_id, min_interval):
+    """Apply a pending touch_version() bump once its window has passed and return the version"""
+    key = _key(namespace, site_id)
+    if cache.get(f'{key}:pending') and cache.add(f'{key}:throttle', 1, timeout=min_interval):
+        cache.delete(f'{key}:pending')
+        return bump_version(namespace, site_id)
+    return get_version(namespace, site_id)
@@ -1,19 +1,50 @@
+import logging
+import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes, action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from .models import Site, Visitor, Contact, Event, ConversionGoal, APIKey
+from .models import (
+    Site, Visitor, Contact, Event, Session, ConversionGoal, APIKey, InternedURL, InternedTitle, IdentityLink,
+    UniqueVisitorSketch, HeavyHitterSketch,
+)
 from .serializers import (
     TrackEventSerializer, SiteSerializer, VisitorSerializer,
     ContactSerializer, EventSerializer, ConversionGoalSerializer
 )
-from .tasks import process_identity_resolution
+from .tasks import schedule_identity_resolution
 from .authentication import APIKeyAuthentication
 from .permissions import HasAPIKeyOrIsStaff, IsAPISiteOwner
+from .bot_detection import classify_request, record_bot_hit
+from .throttling import TrackingRateThrottle
+from .user_agents import fill_fingerprint
+from .event_fields import extract_promoted_fields
+from .ip_index import lookup_ip
+from .bloom import might_match
+from .concurrency import run_with_retry, lock_identity_rows
+from .versioning import touch_version
+from .live import publish_event
+from .uniques import record_visit, top_keys, page_key
+from .heavy_hitters import record_hit
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Fingerprint fields refreshed on every hit from a returning visitor
+VISITOR_FINGERPRINT_FIELDS = (
+    'browser_name', 'browser_version', 'os_name', 'device_type',
+    'screen_resolution', 'timezone', 'language',
+)
 
 
 def get_client_ip(request):
@@ -26,9 +57,98 @@ def get_client_ip(request):
     return ip
 
 
+def _identify_from_enrichment(visitor_pk, enrichment_pk, matched_via, match_details):
+    """
+    Create or re-point the Contact for an enrichment match and mark the visitor identified
+
+    Runs inside run_with_retry(), with the visitor, the contact holding the
+    enrichment email and the enrichment row locked up front.
+    """
+    from .models import EnrichmentData
+
+    enrichment = EnrichmentData.objects.get(pk=enrichment_pk)
+    contact_ids = Contact.objects.filter(
+        site_id=enrichment.site_id, email=enrichment.email
+    ).values_list('id', flat=True)
+    visitors, _, enrichments = lock_identity_rows([visitor_pk], contact_ids, [enrichment_pk])
+    visitor, enrichment = visitors[visitor_pk], enrichments[enrichment_pk]
+    if visitor.is_identified:
+        # Another worker identified this visitor first
+        return visitor
+
+    # Collect all visitor information for comprehensive contact data
+    visitor_info = {
+        # Browser fingerprint data
+        'browser_fingerprint': {
+            'browser_name': visitor.browser_name,
+            'browser_version': visitor.browser_version,
+            'os_name': visitor.os_name,
+            'device_type': visitor.device_type,
+            'screen_resolution': visitor.screen_resolution,
+            'timezone': visitor.timezone,
+            'language': visitor.language,
+        },
+        # Tracking data
+        'ip_address': visitor.ip_address,
+        'user_agent': visitor.user_agent,
+        'referrer': visitor.referrer,
+        # UTM attribution data (first-touch)
+        'utm_data': {
+            'utm_source': visitor.utm_source,
+            'utm_medium': visitor.utm_medium,
+            'utm_campaign': visitor.utm_campaign,
+            'utm_term': visitor.utm_term,
+            'utm_content': visitor.utm_content,
+        },
+        # Identification metadata
+        'matched_via': matched_via,
+        'match_details': match_details,
+        'first_seen': visitor.first_seen.isoformat() if visitor.first_seen else None,
+        'identified_at': timezone.now().isoformat(),
+    }
+
+    contact, contact_created = Contact.objects.get_or_create(
+        site_id=visitor.site_id,
+        email=enrichment.email,
+        defaults={
+            'visitor': visitor,
+            'enrichment_data': enrichment,
+            'name': f"{enrichment.first_name} {enrichment.last_name}".strip(),
+            'phone': enrichment.phone,
+            'linkedin_url': enrichment.linkedin_url,
+            'facebook_url': enrichment.facebook_url,
+            'extra_data': {
+                'company': enrichment.company,
+                'job_title': enrichment.job_title,
+                'location': enrichment.location,
+                **visitor_info,  # Include all visitor information
+            }
+        }
+    )
+
+    # If contact exists but linked to different visitor, update it with new visitor data
+    if not contact_created and contact.visitor != visitor:
+        # Stitch the previous visitor into the same identity before re-pointing
+        if contact.visitor_id:
+            IdentityLink.objects.link(contact.visitor, visitor, via=matched_via)
+        contact.visitor = visitor
+        # Update extra_data with new visitor information
+        if not contact.extra_data:
+            contact.extra_data = {}
+        contact.extra_data.update(visitor_info)
+        contact.save()
+
+    # Mark visitor as identified - ONLY SET ONCE
+    visitor.is_identified = True
+    visitor.matched_via = matched_via
+    visitor.save(update_fields=['is_identified', 'matched_via'])
+    return visitor
+
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([TrackingRateThrottle])
 def track_event(request):
     """
     Main endpoint for receiving tracking events from the pixel
@@ -37,11 +157,22 @@ def track_event(request):
     The client cannot send is_identified or matched_via - these fields are
     computed by the server based on multi-factor matching logic.
     """
-    # Log incoming request data to verify client is not sending identification fields
-    import logging
-    logger = logging.getLogger(__name__)
+    # Drop crawler and scripted traffic before touching the database
+    bot_filter = getattr(settings, 'TRACKING_BOT_FILTER', 'count')
+    if bot_filter != 'off' and classify_request(request):
+        if bot_filter == 'count':
+            record_bot_hit(request.data.get('site_key'))
+        return Response({'status': 'ignored'}, status=status.HTTP_202_ACCEPTED)
+
+    # Record clients trying to send identification fields (only field names, never the payload)
     if 'is_identified' in request.data or 'matched_via' in request.data:
-        logger.warning(f"CLIENT ATTEMPTED TO SEND IDENTIFICATION FIELDS: {request.data}")
+        logger.warning(
+            'Client attempted to send identification fields',
+            extra={
+                'site_key': request.data.get('site_key'),
+                'fields': [f for f in ('is_identified', 'matched_via') if f in request.data],
+            }
+        )
         # These fields will be ignored by the serializer, but we log the attempt
 
     serializer = TrackEventSerializer(data=request.data)
@@ -59,21 +190,24 @@ def track_event(request):
         site = Site.objects.get(site_key=data['site_key'], is_active=True)
 
         # Extract browser fingerprint from request (sent at top level by pixel.js)
-        browser_fp = data.get('browser_fingerprint', {})
+        # and fill anything the client could not detect from the parsed user agent
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        browser_fp = fill_fingerprint(data.get('browser_fingerprint', {}), user_agent)
 
         # Extract UTM parameters (stored for first-touch attribution)
         stored_utm = data.get('stored_utm_params', {})
 
-        # Get or create visitor
+        # Insert or refresh the visitor in one statement (no get_or_create race)
         ip_address = get_client_ip(request)
-        visitor, created = Visitor.objects.get_or_create(
+        visitor, created = Visitor.objects.upsert(
             site=site,
             visitor_id=data['visitor_id'],
             defaults={
-                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                'user_agent': user_agent,
                 'ip_address': ip_address,
                 'referrer': data.get('referrer', ''),
                 'browser_name': browser_fp.get('browser_name'),
+                'browser_version': browser_fp.get('browser_version'),
                 'os_name': browser_fp.get('os_name'),
                 'device_type': browser_fp.get('device_type'),
                 'screen_resolution': browser_fp.get('screen_resolution'),
@@ -85,20 +219,11 @@ def track_event(request):
                 'utm_campaign': stored_utm.get('utm_campaign'),
                 'utm_term': stored_utm.get('utm_term'),
                 'utm_content': stored_utm.get('utm_content'),
-            }
+            },
+            # Existing visitors pick up any newly provided fingerprint values
+            merge_fields=VISITOR_FINGERPRINT_FIELDS,
         )
-
-        # Update visitor data if not newly created
-        if not created:
-            # Update fingerprint if provided
-            if browser_fp:
-                visitor.browser_name = browser_fp.get('browser_name') or visitor.browser_name
-                visitor.os_name = browser_fp.get('os_name') or visitor.os_name
-                visitor.device_type = browser_fp.get('device_type') or visitor.device_type
-                visitor.screen_resolution = browser_fp.get('screen_resolution') or visitor.screen_resolution
-                visitor.timezone = browser_fp.get('timezone') or visitor.timezone
-                visitor.language = browser_fp.get('language') or visitor.language
-            visitor.save()
+        was_identified = visitor.is_identified
 
         # SIMPLIFIED MATCHING: Only match against CSV enrichment data
         # Match incoming event data against enrichment data from CSV uploads ONLY
@@ -112,132 +237,108 @@ def track_event(request):
             # Only try to match if visitor is NOT already identified
             # This ensures we preserve the ORIGINAL matching method
             if not visitor.is_identified:
-                # Get all enrichment data for this site
-                all_enrichment = EnrichmentData.objects.filter(site=site)
-
-                # Try to match by IP address ONLY
+                # Try to match by IP address or CIDR range ONLY
                 # This is the most reliable method as it comes from CSV
-                if ip_address:
-                    for enrichment_data in all_enrichment:
-                        if ip_address in enrichment_data.ip_addresses:
-                            enrichment = enrichment_data
-                            matched_via = 'ip_address'
-                            match_details = {'ip': ip_address}
-                            break
+                # The Bloom filter rejects IPs no enrichment row can match
+                match = None
+                if ip_address and might_match(site.id, ip=ip_address):
+                    match = lookup_ip(site.id, ip_address)
+                if match:
+                    enrichment_id, network = match
+                    enrichment = EnrichmentData.objects.filter(id=enrichment_id, site=site).first()
+                    if enrichment:
+                        matched_via = 'ip_address'
+                        match_details = {'ip': ip_address, 'network': network}
 
                 # If matched, create contact and mark visitor as identified
                 if enrichment:
-                    # Collect all visitor information for comprehensive contact data
-                    visitor_info = {
-                        # Browser fingerprint data
-                        'browser_fingerprint': {
-                            'browser_name': visitor.browser_name,
-                            'browser_version': visitor.browser_version,
-                            'os_name': visitor.os_name,
-                            'device_type': visitor.device_type,
-                            'screen_resolution': visitor.screen_resolution,
-                            'timezone': visitor.timezone,
-                            'language': visitor.language,
-                        },
-                        # Tracking data
-                        'ip_address': visitor.ip_address,
-                        'user_agent': visitor.user_agent,
-                        'referrer': visitor.referrer,
-                        # UTM attribution data (first-touch)
-                        'utm_data': {
-                            'utm_source': visitor.utm_source,
-                            'utm_medium': visitor.utm_medium,
-                            'utm_campaign': visitor.utm_campaign,
-                            'utm_term': visitor.utm_term,
-                            'utm_content': visitor.utm_content,
-                        },
-                        # Identification metadata
-                        'matched_via': matched_via,
-                        'match_details': match_details,
-                        'first_seen': visitor.first_seen.isoformat() if visitor.first_seen else None,
-                        'identified_at': timezone.now().isoformat(),
-                    }
-
-                    contact, contact_created = Contact.objects.get_or_create(
-                        site=site,
-                        email=enrichment.email,
-                        defaults={
-                            'visitor': visitor,
-                            'enrichment_data': enrichment,
-                            'name': f"{enrichment.first_name} {enrichment.last_name}".strip(),
-                            'phone': enrichment.phone,
-                            'linkedin_url': enrichment.linkedin_url,
-                            'facebook_url': enrichment.facebook_url,
-                            'extra_data': {
-                                'company': enrichment.company,
-                                'job_title': enrichment.job_title,
-                                'location': enrichment.location,
-                                **visitor_info,  # Include all visitor information
-                            }
-                        }
+                    visitor = run_with_retry(
+                        _identify_from_enrichment, visitor.pk, enrichment.pk, matched_via, match_details,
+                        site_key=site.site_key,
                     )
 
-                    # If contact exists but linked to different visitor, update it with new visitor data
-                    if not contact_created and contact.visitor != visitor:
-                        contact.visitor = visitor
-                        # Update extra_data with new visitor information
-                        if not contact.extra_data:
-                            contact.extra_data = {}
-                        contact.extra_data.update(visitor_info)
-                        contact.save()
-
-                    # Mark visitor as identified - ONLY SET ONCE
-                    visitor.is_identified = True
-                    visitor.matched_via = matched_via
-                    visitor.save()
-
-        except Exception as e:
+        except Exception:
             # Log error but don't fail the request
-            import traceback
-            print(f"Auto-matching error: {e}")
-            print(traceback.format_exc())
+            logger.exception('Auto-matching error', extra={'site_key': site.site_key, 'visitor_id': visitor.visitor_id})
 
         # Extract current UTM parameters for last-touch attribution
         current_utm = data.get('utm_params', {})
 
-        # Create event
-        event = Event.objects.create(
+        # URLs and titles are stored as ids into dictionary tables (cached per
+        # process), interned outside the transaction so a rollback cannot
+        # leave uncommitted ids in the cache
+        page_url_id = InternedURL.objects.intern(data['page_url'])
+        page_title_id = InternedTitle.objects.intern(data.get('page_title', ''))
+        referrer_id = InternedURL.objects.intern(data.get('referrer', ''))
+
+        # Create event, counting it on the visitor only once its row is stored
+        with transaction.atomic():
+            event = Event.objects.create(
+                site=site,
+                visitor=visitor,
+                event_type=data['event_type'],
+                event_name=data.get('event_name', ''),
+                page_url_id=page_url_id,
+                page_title_id=page_title_id,
+                event_data=data.get('event_data', {}),
+                session_id=data.get('session_id', ''),
+                referrer_id=referrer_id,
+                # Last-touch UTM attribution
+                utm_source=current_utm.get('utm_source'),
+                utm_medium=current_utm.get('utm_medium'),
+                utm_campaign=current_utm.get('utm_campaign'),
+                utm_term=current_utm.get('utm_term'),
+                utm_content=current_utm.get('utm_content'),
+                # Typed copies of hot event_data keys (product id, cart total, clicked element)
+                **extract_promoted_fields(data['event_type'], data.get('event_data', {})),
+            )
+            Visitor.objects.filter(pk=visitor.pk).update(event_count=F('event_count') + 1)
+
+        # Keep the materialized session row in step with its events
+        Session.objects.record_event(
             site=site,
             visitor=visitor,
-            event_type=data['event_type'],
-            event_name=data.get('event_name', ''),
+            session_id=event.session_id,
+            event_type=event.event_type,
             page_url=data['page_url'],
-            page_title=data.get('page_title', ''),
-            event_data=data.get('event_data', {}),
-            session_id=data.get('session_id', ''),
-            referrer=data.get('referrer', ''),
-            # Last-touch UTM attribution
-            utm_source=current_utm.get('utm_source'),
-            utm_medium=current_utm.get('utm_medium'),
-            utm_campaign=current_utm.get('utm_campaign'),
-            utm_term=current_utm.get('utm_term'),
-            utm_content=current_utm.get('utm_content'),
+            timestamp=event.timestamp,
+            referrer=data.get('referrer') or None,
+            utm=current_utm,
         )
 
+        # Count the visitor in the day's unique-visitor sketches (flushed in batches)
+        record_visit(site.id, visitor.pk, event.timestamp, data['page_url'], current_utm.get('utm_campaign'))
+        # and its page, referrer and clicked element in the day's top-K sketches
+        record_hit(site.id, event.timestamp, data['page_url'], data.get('referrer') or None, event.element_path)
+
+        # Let cached dashboard widgets know there is new data (throttled per site)
+        stats_refresh = getattr(settings, 'TRACKING_STATS_REFRESH_SECONDS', 30)
+        touch_version('stats', site.id, stats_refresh)
+        touch_version('stats', 'all', stats_refresh)
+
         # Check for identity resolution data
         if data['event_type'] == 'custom' and 'event_data' in data:
             event_data = data.get('event_data', {})
             if 'event_name' in event_data and event_data['event_name'] == 'identify':
                 identity_data = event_data.get('identity_data', {})
                 if 'email' in identity_data:
-                    # Trigger identity resolution (async if Celery is available)
-                    try:
-                        process_identity_resolution.delay(
-                            str(visitor.id),
-                            identity_data
-                        )
-                    except Exception:
-                        # Fallback to synchronous processing if Celery is not available
-                        from .tasks import process_identity_resolution_sync
-                        process_identity_resolution_sync(str(visitor.id), identity_data)
-                        # Refresh visitor object to get updated is_identified status
+                    # Trigger identity resolution (async and coalesced if Celery is available)
+                    if schedule_identity_resolution(visitor.id, identity_data, site_key=site.site_key):
+                        # Resolved synchronously: refresh visitor to get updated is_identified status
                         visitor.refresh_from_db()
 
+        # Push the event and the summary counter changes it caused to live dashboards
+        deltas = {'total_events': 1, 'today_events': 1}
+        if created:
+            deltas.update(total_visitors=1, today_visitors=1)
+        if visitor.is_identified and (created or not was_identified):
+            deltas['identified_visitors'] = 1
+            if not created:
+                deltas['anonymous_visitors'] = -1
+        elif created:
+            deltas['anonymous_visitors'] = 1
+        publish_event(site, event, data['page_url'], deltas)
+
         # Build response with all available visitor data for frontend matching
         response_data = {
             'status': 'ok',
@@ -248,6 +349,7 @@ def track_event(request):
                 'ip_address': visitor.ip_address,
                 'user_agent': visitor.user_agent,
                 'browser_name': visitor.browser_name,
+                'browser_version': visitor.browser_version,
                 'os_name': visitor.os_name,
                 'device_type': visitor.device_type,
                 'screen_resolution': visitor.screen_resolution,
@@ -276,18 +378,126 @@ def track_event(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     except Exception as e:
-        import traceback
-        error_details = {
-            'error': str(e),
-            'traceback': traceback.format_exc()
-        }
-        print(f"Tracking error: {error_details}")  # Log to console
+        logger.exception('Tracking error', extra={'site_key': data.get('site_key'), 'event_type': data.get('event_type')})
         return Response(
             {'error': str(e), 'details': 'Check server logs for more information'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+@api_view(['GET'])
+@authentication_classes([APIKeyAuthentication])
+@permission_classes([HasAPIKeyOrIsStaff])
+def ingest_metrics(request):
+    """
+    Ingest counters (bot drops, rate limiter sheds) for the authenticated site
+
+    Staff users pass ?site=<site_id>, as on the stats endpoints.
+    """
+    site, error = _request_site(request)
+    if error:
+        return error
+    site_key = site.site_key
+
+    return Response({
+        'site_key': site_key,
+        'metrics': metrics.get_counters(site_key),
+    })
+
+
+def _request_site(request):
+    """
+    The site a metrics or stats request is about
+
+    API keys are scoped to their site; staff users pick one with ?site=<site_id>.
+    Returns (site, None), or (None, error response).
+    """
+    if request.auth:
+        return request.user, None
+    try:
+        site = Site.objects.filter(id=uuid.UUID(request.query_params.get('site', ''))).first()
+    except ValueError:
+        site = None
+    if site is None:
+        return None, Response({'error': 'site parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+    return site, None
+
+
+def _stats_scope(request, dimensions, default_dimension):
+    """
+    Site, date range, dimension and limit of a stats request
+
+    Returns (scope, None), or (None, error response) for bad parameters.
+    """
+    site, error = _request_site(request)
+    if error:
+        return None, error
+
+    try:
+        end = parse_date(request.query_params.get('end', '')) or timezone.localdate()
+        start = parse_date(request.query_params.get('start', '')) or end - timedelta(days=6)
+        limit = min(int(request.query_params.get('limit', 10)), 50)
+    except ValueError:
+        return None, Response({'error': 'invalid date or limit'}, status=status.HTTP_400_BAD_REQUEST)
+    dimension = request.query_params.get('dimension', default_dimension)
+    if dimension not in dict(dimensions) or start > end:
+        return None, Response({'error': 'invalid dimension or date range'}, status=status.HTTP_400_BAD_REQUEST)
+    return (site, start, end, dimension, limit), None
+
+
+@api_view(['GET'])
+@authentication_classes([APIKeyAuthentication])
+@permission_classes([HasAPIKeyOrIsStaff])
+def unique_visitors(request):
+    """
+    Approximate distinct visitors from the HyperLogLog sketches (about 1.6% error)
+
+    Query parameters: start and end (YYYY-MM-DD, default the last 7 days),
+    dimension ('site', 'page' or 'campaign'), and url (page) or key
+    (campaign) for a single bucket; without one, the top `limit` keys are
+    listed. Staff users pass ?site=<site_id>.
+    """
+    scope, error = _stats_scope(request, UniqueVisitorSketch.DIMENSIONS, 'site')
+    if error:
+        return error
+    site, start, end, dimension, limit = scope
+
+    response_data = {'site': str(site.id), 'dimension': dimension, 'start': start, 'end': end}
+    url = request.query_params.get('url')
+    key = page_key(url) if dimension == 'page' and url else request.query_params.get('key')
+    if dimension == 'site' or key:
+        response_data['uniques'] = UniqueVisitorSketch.objects.estimate(site.id, start, end, dimension, key or '')
+    else:
+        response_data['results'] = top_keys(site.id, start, end, dimension, limit)
+    return Response(response_data)
+
+
+@api_view(['GET'])
+@authentication_classes([APIKeyAuthentication])
+@permission_classes([HasAPIKeyOrIsStaff])
+def top_values(request):
+    """
+    Most frequent pages, referrers or clicked elements from the top-K sketches
+
+    Query parameters: dimension ('page', 'referrer' or 'element'), start and
+    end (YYYY-MM-DD, default the last 7 days) and limit (at most 50). Counts
+    are estimates that never undercount. Staff users pass ?site=<site_id>.
+    """
+    scope, error = _stats_scope(request, HeavyHitterSketch.DIMENSIONS, 'page')
+    if error:
+        return error
+    site, start, end, dimension, limit = scope
+
+    top = HeavyHitterSketch.objects.top(site.id, start, end, dimension, limit)
+    return Response({
+        'site': str(site.id),
+        'dimension': dimension,
+        'start': start,
+        'end': end,
+        'results': [{'value': value, 'count': count} for value, count in top],
+    })
+
+
 class SiteViewSet(viewsets.ModelViewSet):
     queryset = Site.objects.all()
     serializer_class = SiteSerializer
@@ -351,7 +561,7 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [HasAPIKeyOrIsStaff]
 
     def get_queryset(self):
-        queryset = Event.objects.all()
+        queryset = Event.objects.select_related('page_url', 'page_title')
 
         # Filter by authenticated site
         if hasattr(self.request, 'auth') and self.request.auth:
@@ -361,13 +571,25 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
         site_id = self.request.query_params.get('site', None)
         visitor_id = self.request.query_params.get('visitor', None)
         event_type = self.request.query_params.get('type', None)
+        product_id = self.request.query_params.get('product', None)
+        contact_id = self.request.query_params.get('contact', None)
 
         if site_id and self.request.user.is_staff:
             queryset = queryset.filter(site_id=site_id)
         if visitor_id:
             queryset = queryset.filter(visitor_id=visitor_id)
         if event_type:
+            if event_type not in dict(Event.EVENT_TYPES):
+                return queryset.none()
             queryset = queryset.filter(event_type=event_type)
+        if product_id:
+            queryset = queryset.filter(product_id=product_id)
+        if contact_id:
+            # All events of every visitor stitched to the contact's identity
+            contact = Contact.objects.filter(id=contact_id).first()
+            if not contact or not contact.visitor_id:
+                return queryset.none()
+            queryset = queryset.filter(visitor_id__in=IdentityLink.objects.members(contact.visitor_id))
 
         return queryset.order_by('-timestamp')
 